@@ -3,6 +3,10 @@ from django.utils.html import format_html
 from django.urls import reverse
 
 from .models import Category, Subcategory, Section, Product, Order, OrderItem, Lead
+from .fragments import products_changed, tree_changed
+from .fts import is_supported, search_queryset
+from .thumbnails import get_thumbnail
+from .tree import sync_nodes
 
 
 # Inline для подкатегорий
@@ -100,13 +104,21 @@ class CategoryAdmin(admin.ModelAdmin):
 
     def make_active(self, request, queryset):
         """Массовое действие: сделать категории активными"""
+        # id до update(): при фильтре по is_active queryset после него пуст
+        pks = list(queryset.values_list('pk', flat=True))
         updated = queryset.update(is_active=True)
+        sync_nodes(Category, pks)
+        tree_changed()
         self.message_user(request, f'Активировано категорий: {updated}')
     make_active.short_description = 'Активировать выбранные категории'
 
     def make_inactive(self, request, queryset):
         """Массовое действие: сделать категории неактивными"""
+        # id до update(): при фильтре по is_active queryset после него пуст
+        pks = list(queryset.values_list('pk', flat=True))
         updated = queryset.update(is_active=False)
+        sync_nodes(Category, pks)
+        tree_changed()
         self.message_user(request, f'Деактивировано категорий: {updated}')
     make_inactive.short_description = 'Деактивировать выбранные категории'
 
@@ -189,13 +201,21 @@ class SubcategoryAdmin(admin.ModelAdmin):
 
     def make_active(self, request, queryset):
         """Массовое действие: сделать подкатегории активными"""
+        # id до update(): при фильтре по is_active queryset после него пуст
+        pks = list(queryset.values_list('pk', flat=True))
         updated = queryset.update(is_active=True)
+        sync_nodes(Subcategory, pks)
+        tree_changed()
         self.message_user(request, f'Активировано подкатегорий: {updated}')
     make_active.short_description = 'Активировать выбранные подкатегории'
 
     def make_inactive(self, request, queryset):
         """Массовое действие: сделать подкатегории неактивными"""
+        # id до update(): при фильтре по is_active queryset после него пуст
+        pks = list(queryset.values_list('pk', flat=True))
         updated = queryset.update(is_active=False)
+        sync_nodes(Subcategory, pks)
+        tree_changed()
         self.message_user(request, f'Деактивировано подкатегорий: {updated}')
     make_inactive.short_description = 'Деактивировать выбранные подкатегории'
 
@@ -236,7 +256,7 @@ class SectionAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         """Оптимизация запросов для отображения"""
         qs = super().get_queryset(request)
-        return qs.select_related('subcategory__category').prefetch_related('products')
+        return qs.select_related('subcategory__category').with_products_count()
     
     def delete_selected_sections(self, request, queryset):
         """Массовое удаление разделов"""
@@ -247,13 +267,21 @@ class SectionAdmin(admin.ModelAdmin):
 
     def make_active(self, request, queryset):
         """Массовое действие: сделать разделы активными"""
+        # id до update(): при фильтре по is_active queryset после него пуст
+        pks = list(queryset.values_list('pk', flat=True))
         updated = queryset.update(is_active=True)
+        sync_nodes(Section, pks)
+        tree_changed()
         self.message_user(request, f'Активировано разделов: {updated}')
     make_active.short_description = 'Активировать выбранные разделы'
 
     def make_inactive(self, request, queryset):
         """Массовое действие: сделать разделы неактивными"""
+        # id до update(): при фильтре по is_active queryset после него пуст
+        pks = list(queryset.values_list('pk', flat=True))
         updated = queryset.update(is_active=False)
+        sync_nodes(Section, pks)
+        tree_changed()
         self.message_user(request, f'Деактивировано разделов: {updated}')
     make_inactive.short_description = 'Деактивировать выбранные разделы'
 
@@ -266,24 +294,25 @@ class SectionAdmin(admin.ModelAdmin):
     subcategory_link.short_description = 'Подкатегория'
 
     def products_count(self, obj):
-        """Количество товаров в разделе"""
-        count = obj.products.count()
+        """Количество активных товаров в разделе"""
+        count = obj.get_products_count()
         if count > 0:
             url = reverse('admin:catalog_product_changelist') + f'?section__id__exact={obj.pk}'
             return format_html('<a href="{}">{} товаров</a>', url, count)
         return '0 товаров'
     products_count.short_description = 'Товаров'
+    products_count.admin_order_field = 'active_products_count'
 
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     """Админка для товаров"""
     list_display = ('title', 'sku', 'section_link', 'price_special', 'price_retail', 'order', 'is_active', 'image_preview')
-    list_filter = ('is_active', 'section__subcategory__category', 'section__subcategory', 'section', 'created_at')
+    list_filter = ('is_active', 'category', 'subcategory', 'section', 'created_at')
     search_fields = ('title', 'sku', 'short_description', 'full_description')
     prepopulated_fields = {'slug': ('title',)}
     list_editable = ('order', 'is_active', 'price_special', 'price_retail')
-    readonly_fields = ('created_at', 'updated_at', 'image_preview')
+    readonly_fields = ('created_at', 'updated_at', 'image_preview', 'wire_section_min', 'wire_section_max', 'load_limit_kn')
     actions = ['make_active', 'make_inactive', 'duplicate_products', 'delete_selected_products']
     
     fieldsets = (
@@ -299,6 +328,7 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': (
                 'price', 'price_special', 'price_retail',
                 'unit', 'wire_section', 'load_limit',
+                ('wire_section_min', 'wire_section_max', 'load_limit_kn'),
                 'stock'
             )
         }),
@@ -312,6 +342,19 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'section':
+            # Названия разделов включают подкатегорию и категорию; выбранный раздел
+            # приходит в Product.save() вместе с ними, и путь считается без запроса
+            kwargs['queryset'] = Section.objects.select_related('subcategory__category')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по полнотекстовому индексу - тот же, что и на сайте"""
+        if not search_term.strip() or not is_supported():
+            return super().get_search_results(request, queryset, search_term)
+        return search_queryset(queryset, search_term), False
+
     def section_link(self, obj):
         """Ссылка на раздел"""
         if obj.section:
@@ -329,6 +372,12 @@ class ProductAdmin(admin.ModelAdmin):
 
     def image_preview(self, obj):
         """Превью изображения"""
+        thumbnail = get_thumbnail(obj.image_url, 'admin') if obj.pk else None
+        if thumbnail:
+            return format_html(
+                '<img src="{}" srcset="{}" width="{}" height="{}" style="border: 1px solid #ddd; padding: 5px; border-radius: 4px;" />',
+                thumbnail.src, thumbnail.srcset, thumbnail.width, thumbnail.height,
+            )
         if obj.image:
             return format_html(
                 '<img src="{}" style="max-height: 150px; max-width: 150px; border: 1px solid #ddd; padding: 5px; border-radius: 4px;" />',
@@ -342,8 +391,11 @@ class ProductAdmin(admin.ModelAdmin):
             elif obj.image_code.startswith('http'):
                 image_url = obj.image_code
             else:
-                # Пробуем загрузить с оригинального сайта
-                image_url = f'https://group.ck-mitra.kz/upload/resize_cache/iblock/{obj.image_code}/310_310_2/{obj.image_code}.png'
+                # Локальная копия resize_cache Битрикса (catalog.resize_cache), тот же URL, что и на сайте
+                image_url = reverse('catalog:resize-cache', kwargs={
+                    'code': obj.image_code, 'width': 310, 'height': 310, 'mode': 2,
+                    'filename': f'{obj.image_code}.png',
+                })
             
             # Используем data URI для placeholder вместо несуществующего файла
             placeholder = 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
@@ -358,13 +410,19 @@ class ProductAdmin(admin.ModelAdmin):
 
     def make_active(self, request, queryset):
         """Массовое действие: сделать товары активными"""
+        # Разделы до update(): при фильтре по is_active queryset после него пуст
+        section_ids = set(queryset.values_list('section_id', flat=True))
         updated = queryset.update(is_active=True)
+        products_changed(section_ids)
         self.message_user(request, f'Активировано товаров: {updated}')
     make_active.short_description = 'Активировать выбранные товары'
 
     def make_inactive(self, request, queryset):
         """Массовое действие: сделать товары неактивными"""
+        # Разделы до update(): при фильтре по is_active queryset после него пуст
+        section_ids = set(queryset.values_list('section_id', flat=True))
         updated = queryset.update(is_active=False)
+        products_changed(section_ids)
         self.message_user(request, f'Деактивировано товаров: {updated}')
     make_inactive.short_description = 'Деактивировать выбранные товары'
 
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_schema(sender, using, **kwargs):
+    # SQLite пересоздаёт таблицу при изменении колонок, и триггеры FTS пропадают
+    from .fts import ensure_search_schema, is_supported
+
+    connection = connections[using]
+    if is_supported(connection):
+        ensure_search_schema(connection)
 
 
 class CatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalog'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(ensure_search_schema, sender=self)
@@ -0,0 +1,99 @@
+"""
+Разбор текстовых характеристик товара в числа для индексированных колонок.
+
+Сечение провода: «35/50», «120-150», «16», «3х2,5 мм²» → (мин, макс) в мм²;
+множитель жил («3х») отбрасывается. Предельная нагрузка: «5,5 кН», «500 кгс»,
+«2 т» → кН. Нераспознанное значение и значение, которое не помещается в колонку
+(DecimalField max_digits), дают None.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+KGF_IN_KN = Decimal('0.00980665')
+# Множители единиц нагрузки к кН; проверяются по порядку
+LOAD_UNITS = (
+    (re.compile(r'кн|kn'), Decimal('1')),
+    (re.compile(r'мн|mn'), Decimal('1000')),
+    (re.compile(r'кгс|кг|kgf|kg'), KGF_IN_KN),
+    (re.compile(r'тс|т\b|t\b'), KGF_IN_KN * 1000),
+    (re.compile(r'н\b|n\b'), Decimal('0.001')),
+)
+_NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)?')
+_AREA_UNIT_RE = re.compile(r'(?:мм|mm)\s*(?:2|²|\^2)|кв\.?\s*мм')
+_CORES_RE = re.compile(r'\d+\s*[xх×*]\s*(?=\d)')
+_CENTS = Decimal('0.01')
+# Верхние границы колонок Product: max_digits=8 и 10 при decimal_places=2
+WIRE_SECTION_LIMIT = Decimal(10) ** 6
+LOAD_LIMIT_LIMIT = Decimal(10) ** 8
+
+
+def _numbers(text):
+    numbers = []
+    for match in _NUMBER_RE.findall(text):
+        try:
+            numbers.append(Decimal(match.replace(',', '.')).quantize(_CENTS))
+        except InvalidOperation:
+            continue
+    return numbers
+
+
+def parse_wire_section(value):
+    """(минимальное, максимальное) сечение в мм² или (None, None)"""
+    text = _AREA_UNIT_RE.sub(' ', str(value or '').lower())
+    numbers = _numbers(_CORES_RE.sub('', text))
+    if not numbers or max(numbers) >= WIRE_SECTION_LIMIT:
+        return None, None
+    return min(numbers), max(numbers)
+
+
+def parse_load_limit(value):
+    """Предельная нагрузка в кН или None; для диапазона берётся верхняя граница"""
+    text = str(value or '').lower()
+    numbers = _numbers(text)
+    if not numbers:
+        return None
+    multiplier = Decimal('1')
+    for pattern, unit_multiplier in LOAD_UNITS:
+        if pattern.search(text):
+            multiplier = unit_multiplier
+            break
+    load = max(numbers) * multiplier
+    # Сравнение до quantize: слишком длинное число не округлить в точности контекста
+    if load >= LOAD_LIMIT_LIMIT or load.quantize(_CENTS) >= LOAD_LIMIT_LIMIT:
+        return None
+    return load.quantize(_CENTS)
+
+
+def parsed_attributes(wire_section, load_limit):
+    """Значения числовых колонок товара по текстовым полям"""
+    wire_section_min, wire_section_max = parse_wire_section(wire_section)
+    return {
+        'wire_section_min': wire_section_min,
+        'wire_section_max': wire_section_max,
+        'load_limit_kn': parse_load_limit(load_limit),
+    }
+
+
+ATTRIBUTE_FIELDS = ('wire_section_min', 'wire_section_max', 'load_limit_kn')
+
+
+def backfill_attributes(model, batch_size=1000):
+    """Пересчитывает числовые колонки пачками через bulk_update; возвращает число изменённых товаров"""
+    queryset = model.objects.only('id', 'wire_section', 'load_limit', *ATTRIBUTE_FIELDS).order_by('id')
+    changed = []
+    updated = 0
+    for product in queryset.iterator(chunk_size=batch_size):
+        attributes = parsed_attributes(product.wire_section, product.load_limit)
+        if all(getattr(product, name) == value for name, value in attributes.items()):
+            continue
+        for name, value in attributes.items():
+            setattr(product, name, value)
+        changed.append(product)
+        if len(changed) >= batch_size:
+            model.objects.bulk_update(changed, ATTRIBUTE_FIELDS)
+            updated += len(changed)
+            changed = []
+    if changed:
+        model.objects.bulk_update(changed, ATTRIBUTE_FIELDS)
+        updated += len(changed)
+    return updated
@@ -0,0 +1,109 @@
+"""
+Модель чтения для карточек товаров.
+
+Снимок каталога держит в памяти все активные товары, а карточке нужна малая часть
+полей модели Product. ProductCard - неизменяемый объект со __slots__, который
+строится из строк .values_list() только с нужными колонками (без описаний и
+служебных полей) и хранит уже готовые строки для шаблона: цены в формате
+floatformat:0|intcomma и URL изображения из манифеста. Поэтому рендер карточки -
+подстановка строк без фильтров и обращений к манифесту.
+
+Модальное окно товара (полное описание) рендерится по модели Product,
+см. catalog.modal_cache.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.utils import numberformat
+from django.utils.formats import get_format
+
+# Колонки .values_list(), из которых строится карточка
+CARD_FIELDS = (
+    'id', 'sku', 'title', 'section_id', 'order', 'updated_at',
+    'wire_section', 'load_limit', 'unit',
+    'price', 'price_special', 'price_retail', 'image', 'image_code',
+)
+
+
+_UNIT = Decimal('1')
+
+
+def price_formatter():
+    """Функция цена → строка как {{ value|floatformat:0|intcomma }} для текущего языка;
+    для нулевой цены - пустая строка. Настройки локали читаются один раз на снимок"""
+    separator = get_format('THOUSAND_SEPARATOR')
+    grouping = get_format('NUMBER_GROUPING')
+
+    def format_price(value):
+        if not value:
+            return ''
+        number = int(Decimal(value).quantize(_UNIT, ROUND_HALF_UP))
+        if not number:
+            return ''
+        if grouping == 3:
+            return f'{number:,}'.replace(',', separator)
+        return numberformat.format(number, '', grouping=grouping, thousand_sep=separator, force_grouping=True)
+
+    return format_price
+
+
+@dataclass(frozen=True, slots=True)
+class ProductCard:
+    """Активный товар в снимке каталога"""
+    id: int
+    sku: str
+    title: str
+    section_id: int
+    order: int
+    updated_at: datetime
+    wire_section: str
+    load_limit: str
+    unit: str
+    display_price: Decimal
+    price_text: str
+    retail_price_text: str
+    image_url: str
+
+    # В снимок попадают только активные товары
+    is_active = True
+
+    @property
+    def pk(self):
+        return self.id
+
+
+def make_card(row, image_url, format_price):
+    """Карточка из строки .values_list(*CARD_FIELDS)"""
+    (pk, sku, title, section_id, order, updated_at, wire_section, load_limit, unit,
+     price, price_special, price_retail, image, image_code) = row
+    display_price = price_special or price
+    return ProductCard(
+        id=pk,
+        sku=sku,
+        title=title,
+        section_id=section_id,
+        order=order,
+        updated_at=updated_at,
+        wire_section=wire_section,
+        load_limit=load_limit,
+        unit=unit,
+        display_price=display_price,
+        price_text=format_price(display_price),
+        retail_price_text=format_price(price_retail),
+        image_url=image_url,
+    )
+
+
+def build_cards(queryset):
+    """Карточки товаров queryset в его порядке (один запрос)"""
+    from .image_manifest import get_manifest
+
+    manifest = get_manifest()
+    # Снимок пересобирается после сборки манифеста в другом процессе - берём её результат
+    manifest.reload_if_changed()
+    format_price = price_formatter()
+    return tuple(
+        make_card(row, manifest.get_by_values(row[0], row[-2], row[-1], row[2]), format_price)
+        for row in queryset.values_list(*CARD_FIELDS)
+    )
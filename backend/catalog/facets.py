@@ -0,0 +1,265 @@
+"""
+Фасетный фильтр активных товаров: категория, подкатегория, раздел, сечение провода,
+предельная нагрузка, единица измерения и диапазон цены.
+
+Каждому товару выделяется номер (слот), и для каждого значения фасета хранится
+битовая маска - целое число Python, в котором установлены биты товаров с этим
+значением. Внутри фасета выбранные значения объединяются (|), между фасетами
+пересекаются (&), количество - int.bit_count(). Счётчики фасета считаются по
+пересечению остальных фасетов, поэтому выбор одного значения не обнуляет соседние.
+Числовые диапазоны (сечение в мм², нагрузка в кН) считаются запросом по индексам
+базы (ProductQuerySet) и ограничивают множество товаров через product_ids.
+
+Индекс синхронизируется со снимком каталога так же, как поисковый: при смене
+версии обновляются только биты товаров, у которых изменились updated_at или раздел.
+"""
+import heapq
+import re
+import threading
+from dataclasses import dataclass
+from decimal import Decimal
+
+from .pagination import product_sort_key
+from .snapshot import get_snapshot
+
+FACETS = ('category', 'subcategory', 'section', 'wire_section', 'load_limit', 'unit', 'price')
+FACET_TITLES = {
+    'category': 'Категория',
+    'subcategory': 'Подкатегория',
+    'section': 'Раздел',
+    'wire_section': 'Сечение провода',
+    'load_limit': 'Предельная нагрузка',
+    'unit': 'Единица измерения',
+    'price': 'Цена',
+}
+# Границы диапазонов цены, ₸
+PRICE_BOUNDS = (1000, 5000, 20000, 100000)
+
+_NATURAL_RE = re.compile(r'(\d+)')
+
+
+def price_range(price):
+    """Ключ диапазона цены: '1000-5000', '100000-'"""
+    lower = 0
+    for upper in PRICE_BOUNDS:
+        if price < upper:
+            return f'{lower}-{upper}'
+        lower = upper
+    return f'{lower}-'
+
+
+def _price_label(value):
+    lower, upper = value.split('-')
+    if not upper:
+        return f'от {int(lower):,} ₸'.replace(',', ' ')
+    return f'{int(lower):,} - {int(upper):,} ₸'.replace(',', ' ')
+
+
+def _natural_key(label):
+    return [int(part) if part.isdigit() else part for part in _NATURAL_RE.split(str(label).lower())]
+
+
+def product_facet_values(product, subcategory_id, category_id):
+    """{фасет: значение} товара; пустые значения не попадают в фасеты"""
+    values = {
+        'category': category_id,
+        'subcategory': subcategory_id,
+        'section': product.section_id,
+        'wire_section': (product.wire_section or '').strip(),
+        'load_limit': (product.load_limit or '').strip(),
+        'unit': (product.unit or '').strip(),
+        'price': price_range(product.display_price or Decimal('0')),
+    }
+    return {facet: value for facet, value in values.items() if value not in (None, '')}
+
+
+def _iter_bits(bits):
+    """Номера установленных битов по возрастанию"""
+    digits = bin(bits)[:1:-1]
+    position = digits.find('1')
+    while position >= 0:
+        yield position
+        position = digits.find('1', position + 1)
+
+
+@dataclass(frozen=True, slots=True)
+class FacetResult:
+    """Страница товаров и счётчики фасетов для выбранных фильтров"""
+    products: tuple
+    total_count: int
+    offset: int
+    facets: dict
+
+    @property
+    def has_more(self):
+        return self.offset + len(self.products) < self.total_count
+
+
+class FacetIndex:
+    """Битовые маски значений фасетов"""
+
+    def __init__(self):
+        self.bitsets = {facet: {} for facet in FACETS}
+        self.slots = {}
+        self.docs = []
+        self.doc_values = {}
+        self.free_slots = []
+        self.all_bits = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, product, values):
+        self.remove(product.pk)
+        slot = self.free_slots.pop() if self.free_slots else len(self.docs)
+        if slot == len(self.docs):
+            self.docs.append(None)
+        bit = 1 << slot
+        for facet, value in values.items():
+            bitsets = self.bitsets[facet]
+            bitsets[value] = bitsets.get(value, 0) | bit
+        self.slots[product.pk] = slot
+        self.docs[slot] = product
+        self.doc_values[product.pk] = values
+        self.all_bits |= bit
+
+    def remove(self, product_id):
+        slot = self.slots.pop(product_id, None)
+        if slot is None:
+            return
+        mask = ~(1 << slot)
+        for facet, value in self.doc_values.pop(product_id).items():
+            bitsets = self.bitsets[facet]
+            bits = bitsets[value] & mask
+            if bits:
+                bitsets[value] = bits
+            else:
+                del bitsets[value]
+        self.docs[slot] = None
+        self.free_slots.append(slot)
+        self.all_bits &= mask
+
+    def _selected_bits(self, facet, values):
+        bitsets = self.bitsets[facet]
+        bits = 0
+        for value in values:
+            bits |= bitsets.get(value, 0)
+        return bits
+
+    def _product_bits(self, product_ids):
+        bits = 0
+        for product_id in product_ids:
+            slot = self.slots.get(product_id)
+            if slot is not None:
+                bits |= 1 << slot
+        return bits
+
+    def query(self, selected=None, offset=0, limit=9, product_ids=None):
+        """selected - {фасет: [значения]}; внутри фасета ИЛИ, между фасетами И.
+        product_ids - если задан, только эти товары (и в результатах, и в счётчиках)"""
+        selected = {facet: values for facet, values in (selected or {}).items() if facet in self.bitsets and values}
+        masks = {facet: self._selected_bits(facet, values) for facet, values in selected.items()}
+        universe = self.all_bits if product_ids is None else self._product_bits(product_ids)
+
+        matched = universe
+        for bits in masks.values():
+            matched &= bits
+
+        facets = {}
+        for facet, bitsets in self.bitsets.items():
+            # Счётчики фасета - по фильтрам остальных фасетов
+            base = universe
+            for other, bits in masks.items():
+                if other != facet:
+                    base &= bits
+            counts = {}
+            for value, bits in bitsets.items():
+                count = (bits & base).bit_count()
+                if count or value in selected.get(facet, ()):
+                    counts[value] = count
+            facets[facet] = counts
+
+        docs = self.docs
+        products = heapq.nsmallest(offset + limit, (docs[slot] for slot in _iter_bits(matched)), key=product_sort_key)
+        return FacetResult(
+            products=tuple(products[offset:]),
+            total_count=matched.bit_count(),
+            offset=offset,
+            facets=facets,
+        )
+
+
+class CatalogFacets:
+    """Фасетный индекс активных товаров, синхронизируемый со снимком каталога"""
+
+    def __init__(self):
+        self.index = FacetIndex()
+        self.version = None
+        self.signatures = {}
+        self.labels = {}
+        self.lock = threading.RLock()
+
+    def sync(self, snapshot):
+        if self.version == snapshot.version:
+            return
+        with self.lock:
+            if self.version == snapshot.version:
+                return
+            labels = {'category': {}, 'subcategory': {}, 'section': {}}
+            parents = {}
+            for category in snapshot.categories:
+                labels['category'][category.id] = category.title
+                for subcategory in category.subcategories:
+                    labels['subcategory'][subcategory.id] = subcategory.title
+                    for section in subcategory.sections:
+                        labels['section'][section.id] = section.title
+                        parents[section.id] = (subcategory.id, category.id)
+            signatures = {}
+            for product in snapshot.products:
+                # Товары неактивных разделов, подкатегорий и категорий не фильтруются
+                if product.section_id not in parents:
+                    continue
+                subcategory_id, category_id = parents[product.section_id]
+                signature = (product.updated_at, product.section_id, subcategory_id, category_id)
+                signatures[product.pk] = signature
+                if self.signatures.get(product.pk) != signature:
+                    self.index.add(product, product_facet_values(product, subcategory_id, category_id))
+                else:
+                    self.index.docs[self.index.slots[product.pk]] = product
+            for product_id in self.signatures.keys() - signatures.keys():
+                self.index.remove(product_id)
+            self.signatures = signatures
+            self.labels = labels
+            self.version = snapshot.version
+
+    def label(self, facet, value):
+        if facet == 'price':
+            return _price_label(value)
+        return self.labels.get(facet, {}).get(value, value)
+
+    def query(self, selected=None, offset=0, limit=9, product_ids=None):
+        with self.lock:
+            result = self.index.query(selected, offset, limit, product_ids)
+        facets = {}
+        for facet, counts in result.facets.items():
+            values = [
+                {
+                    'value': value,
+                    'label': self.label(facet, value),
+                    'count': count,
+                    'selected': value in (selected or {}).get(facet, ()),
+                }
+                for value, count in counts.items()
+            ]
+            values.sort(key=lambda item: _natural_key(item['value'] if facet == 'price' else item['label']))
+            facets[facet] = {'title': FACET_TITLES[facet], 'values': values}
+        return FacetResult(result.products, result.total_count, result.offset, facets)
+
+
+_facets = CatalogFacets()
+
+
+def filter_products(selected=None, offset=0, limit=9, product_ids=None):
+    """Страница товаров и счётчики фасетов по актуальному снимку каталога"""
+    _facets.sync(get_snapshot())
+    return _facets.query(selected, offset, limit, product_ids)
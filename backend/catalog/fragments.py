@@ -0,0 +1,117 @@
+"""
+Кэш HTML-фрагментов с карточками товаров раздела.
+
+Ключ фрагмента: версия каталога + поколение фрагментов + раздел + версия раздела +
+offset/limit + вариант загрузки изображений. Версия раздела меняется только при
+изменении товаров этого раздела и вместе с поколением определяет ETag страниц раздела;
+поколение сбрасывает всё сразу (например, после пересборки манифеста изображений).
+
+Счётчики хранятся в кэше, который может вытеснить ключ. Поэтому значение счётчика -
+время в нс (snapshot.next_version), а не 1, 2, 3...: пересозданный счётчик не
+совпадёт с прежним, и старые фрагменты и ETag не оживут. Версия каталога в ключе
+дополнительно отделяет фрагменты разных снимков.
+
+Порядок важен: при изменении сначала увеличивается версия каталога, затем версия
+раздела; при чтении сначала берётся версия раздела, затем снимок каталога. Так
+фрагмент с новой версией раздела никогда не строится из старого снимка.
+"""
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .snapshot import bump_catalog_version, get_catalog_version, get_snapshot, next_version, touch_catalog_modified
+
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+SECTION_VERSION_KEY = 'catalog:section-version:{}'
+FRAGMENTS_GENERATION_KEY = 'catalog:fragments-generation'
+LOADING_VARIANTS = ('lazy', 'eager')
+
+
+def _get_counter(key):
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, next_version(), timeout=None)
+        value = cache.get(key) or next_version()
+    return value
+
+
+def _incr_counter(key):
+    # cache.set, а не incr: в файловом кэше incr - это get + set без блокировки,
+    # а значение от времени различается и у одновременных изменений
+    cache.set(key, next_version(cache.get(key)), timeout=None)
+
+
+def get_section_version(section_id):
+    return _get_counter(SECTION_VERSION_KEY.format(section_id))
+
+
+def invalidate_section_fragments(section_ids):
+    """Сбрасывает фрагменты перечисленных разделов"""
+    for section_id in {section_id for section_id in section_ids if section_id is not None}:
+        _incr_counter(SECTION_VERSION_KEY.format(section_id))
+
+
+def invalidate_all_fragments():
+    _incr_counter(FRAGMENTS_GENERATION_KEY)
+    touch_catalog_modified()
+
+
+def products_changed(section_ids):
+    """Товары изменились: сначала версия каталога, затем версии их разделов"""
+    bump_catalog_version()
+    invalidate_section_fragments(section_ids)
+
+
+def tree_changed():
+    """Изменились категории, подкатегории или разделы: раздел мог исчезнуть из каталога,
+    поэтому вместе с версией каталога сбрасываются все фрагменты (и их ETag)"""
+    bump_catalog_version()
+    invalidate_all_fragments()
+
+
+def get_fragments_generation():
+    return _get_counter(FRAGMENTS_GENERATION_KEY)
+
+
+def _fragment_key(catalog_version, section_id, section_version, offset, limit, loading):
+    generation = get_fragments_generation()
+    return f'catalog:fragment:{catalog_version}:{generation}:{section_id}:{section_version}:{offset}:{limit}:{loading}'
+
+
+def render_section_cards(section, offset=0, limit=9, loading='lazy', section_version=None, snapshot_version=None):
+    """HTML карточек раздела из снимка каталога, с кэшированием"""
+    if loading not in LOADING_VARIANTS:
+        loading = 'lazy'
+    if section_version is None:
+        section_version = get_section_version(section.id)
+    catalog_version = snapshot_version if snapshot_version is not None else get_catalog_version()
+    key = _fragment_key(catalog_version, section.id, section_version, offset, limit, loading)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string('catalog/_product_list.html', {
+            'products': section.products[offset:offset + limit],
+            'loading': loading,
+        })
+        # Не сохраняем фрагмент, если снимок успел устареть во время рендера
+        if snapshot_version is None or snapshot_version == get_catalog_version():
+            cache.set(key, html, FRAGMENT_TIMEOUT)
+    return html
+
+
+def warm_fragments(pages=1, limit=9, loading_variants=LOADING_VARIANTS):
+    """Заранее рендерит первые страницы всех разделов; возвращает число фрагментов"""
+    snapshot = get_snapshot()
+    count = 0
+    for section in snapshot.sections.values():
+        section_version = get_section_version(section.id)
+        for page in range(pages):
+            offset = page * limit
+            if page and offset >= section.products_count:
+                break
+            for loading in loading_variants:
+                render_section_cards(
+                    section, offset, limit, loading,
+                    section_version=section_version,
+                    snapshot_version=snapshot.version,
+                )
+                count += 1
+    return count
@@ -0,0 +1,202 @@
+"""
+Полнотекстовый поиск товаров средствами базы данных.
+
+PostgreSQL: колонка catalog_product.search_vector (tsvector) с GIN-индексом, её заполняет триггер.
+SQLite: виртуальная таблица FTS5 catalog_product_fts, которую поддерживают триггеры.
+
+Текст в обоих случаях нормализуется так же, как в catalog.search: латинские буквы,
+похожие на кириллические, заменяются кириллическими, Ё → Е, название и SKU дополнительно
+индексируются без дефисов («ЗАН-1500» → «ЗАН1500»). Веса полей одинаковые: название,
+SKU - A, сечение и нагрузка - B, описания - D. Ранжирование - ts_rank и bm25 с этими
+весами, сниппеты строит catalog.search.make_snippet для любого движка.
+
+Структуры создаются миграцией и проверяются после каждого migrate (post_migrate):
+SQLite пересоздаёт таблицу при изменении колонок, и триггеры при этом пропадают.
+"""
+import re
+
+from django.db import connection as default_connection, connections
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from .search import LOOKALIKES, tokenize_query
+
+PRODUCT_TABLE = 'catalog_product'
+FTS_TABLE = 'catalog_product_fts'
+SEARCH_VECTOR_INDEX = 'catalog_product_search_vector_idx'
+
+# (колонка FTS5, вес bm25); веса bm25 соответствуют A/B/D в PostgreSQL
+FTS_COLUMNS = (
+    ('title', 10.0),
+    ('joined', 10.0),
+    ('sku', 10.0),
+    ('wire_section', 4.0),
+    ('load_limit', 4.0),
+    ('description', 1.0),
+)
+
+_TERM_RE = re.compile(r'[^\w.]+')
+
+
+def is_supported(connection=None):
+    return (connection or default_connection).vendor in ('postgresql', 'sqlite')
+
+
+def _postgres_fold(expression):
+    latin = ''.join(LOOKALIKES) + ''.join(LOOKALIKES).lower()
+    cyrillic = ''.join(LOOKALIKES.values()) + ''.join(LOOKALIKES.values()).lower()
+    return f"translate(coalesce({expression}, ''), '{latin}', '{cyrillic}')"
+
+
+def _sqlite_fold(expression):
+    # upper() в SQLite меняет только ASCII - латиницу; регистр кириллицы FTS5 сворачивает сам.
+    # Вложенность replace() ограничена стеком парсера SQLite, поэтому оба регистра не заменяем
+    expression = f"upper(coalesce({expression}, ''))"
+    for latin, cyrillic in LOOKALIKES.items():
+        expression = f"replace({expression}, '{latin}', '{cyrillic}')"
+    return f"replace({expression}, 'ё', 'е')"
+
+
+def _joined(expression):
+    return f"replace(replace({expression}, '-', ''), '_', '')"
+
+
+def _sqlite_values(row):
+    return ', '.join([
+        f'{row}.id',
+        _sqlite_fold(f'{row}.title'),
+        _sqlite_fold(_joined(f"{row}.title || ' ' || {row}.sku")),
+        _sqlite_fold(f'{row}.sku'),
+        _sqlite_fold(f'{row}.wire_section'),
+        _sqlite_fold(f'{row}.load_limit'),
+        _sqlite_fold(f"{row}.short_description || ' ' || {row}.full_description"),
+    ])
+
+
+def _postgres_vector(row):
+    return (
+        f"setweight(to_tsvector('simple', {_postgres_fold(f'{row}title')} || ' ' || "
+        f"{_postgres_fold(_joined(f'{row}title'))} || ' ' || {_postgres_fold(f'{row}sku')} || ' ' || "
+        f"{_postgres_fold(_joined(f'{row}sku'))}), 'A') || "
+        f"setweight(to_tsvector('simple', {_postgres_fold(f'{row}wire_section')} || ' ' || "
+        f"{_postgres_fold(f'{row}load_limit')}), 'B') || "
+        f"setweight(to_tsvector('simple', {_postgres_fold(f'{row}short_description')} || ' ' || "
+        f"{_postgres_fold(f'{row}full_description')}), 'D')"
+    )
+
+
+def ensure_search_schema(connection=None):
+    """Создаёт недостающие структуры полнотекстового поиска (идемпотентно)"""
+    connection = connection or default_connection
+    if PRODUCT_TABLE not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Колонка заполняется триггером, а не GENERATED: генерируемая колонка
+            # запретила бы миграциям менять тип title, sku и остальных полей
+            cursor.execute(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = 'search_vector'",
+                [PRODUCT_TABLE],
+            )
+            created = cursor.fetchone() is None
+            cursor.execute(f'ALTER TABLE {PRODUCT_TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector')
+            cursor.execute(
+                f'CREATE OR REPLACE FUNCTION {PRODUCT_TABLE}_search_vector_update() RETURNS trigger AS $$ '
+                f'BEGIN NEW.search_vector := {_postgres_vector("NEW.")}; RETURN NEW; END '
+                f'$$ LANGUAGE plpgsql'
+            )
+            cursor.execute(f'DROP TRIGGER IF EXISTS {PRODUCT_TABLE}_search_vector ON {PRODUCT_TABLE}')
+            cursor.execute(
+                f'CREATE TRIGGER {PRODUCT_TABLE}_search_vector BEFORE INSERT OR UPDATE ON {PRODUCT_TABLE} '
+                f'FOR EACH ROW EXECUTE FUNCTION {PRODUCT_TABLE}_search_vector_update()'
+            )
+            if created:
+                cursor.execute(f'UPDATE {PRODUCT_TABLE} SET search_vector = {_postgres_vector("")}')
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {SEARCH_VECTOR_INDEX} ON {PRODUCT_TABLE} USING GIN (search_vector)'
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                [PRODUCT_TABLE],
+            )
+            triggers = {row[0] for row in cursor.fetchall()}
+            columns = ', '.join(name for name, weight in FTS_COLUMNS)
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+                f"{columns}, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {PRODUCT_TABLE} BEGIN '
+                f'INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES ({_sqlite_values("new")}); END'
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {PRODUCT_TABLE} BEGIN '
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END'
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON {PRODUCT_TABLE} BEGIN '
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = old.id; '
+                f'INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES ({_sqlite_values("new")}); END'
+            )
+            if not {f'{FTS_TABLE}_ai', f'{FTS_TABLE}_ad', f'{FTS_TABLE}_au'} <= triggers:
+                # Таблица создана или пересоздана без триггеров: заполняем индекс заново
+                cursor.execute(f'DELETE FROM {FTS_TABLE}')
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE} (rowid, {columns}) '
+                    f'SELECT {_sqlite_values(PRODUCT_TABLE)} FROM {PRODUCT_TABLE}'
+                )
+
+
+def drop_search_schema(connection=None):
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'DROP TRIGGER IF EXISTS {PRODUCT_TABLE}_search_vector ON {PRODUCT_TABLE}')
+            cursor.execute(f'DROP FUNCTION IF EXISTS {PRODUCT_TABLE}_search_vector_update()')
+            cursor.execute(f'DROP INDEX IF EXISTS {SEARCH_VECTOR_INDEX}')
+            cursor.execute(f'ALTER TABLE {PRODUCT_TABLE} DROP COLUMN IF EXISTS search_vector')
+        elif connection.vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def query_terms(query):
+    """Слова запроса в нормализованном виде, без символов синтаксиса FTS"""
+    terms = []
+    for term in tokenize_query(query):
+        for part in _TERM_RE.split(term):
+            part = part.strip('.')
+            if part and part not in terms:
+                terms.append(part)
+    return terms
+
+
+def search_queryset(queryset, query):
+    """Товары из queryset, подходящие под запрос, с аннотацией search_rank,
+    отсортированные по релевантности; все слова запроса ищутся по префиксу"""
+    terms = query_terms(query)
+    if not terms:
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        tsquery = ' & '.join(f"'{term.lower()}':*" for term in terms)
+        queryset = queryset.filter(RawSQL(
+            f"{PRODUCT_TABLE}.search_vector @@ to_tsquery('simple', %s)", [tsquery],
+            output_field=BooleanField(),
+        )).annotate(search_rank=RawSQL(
+            f"ts_rank({PRODUCT_TABLE}.search_vector, to_tsquery('simple', %s))", [tsquery],
+        ))
+    elif vendor == 'sqlite':
+        match = ' AND '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for name, weight in FTS_COLUMNS)
+        queryset = queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match],
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {PRODUCT_TABLE}.id', [match],
+        ))
+    else:
+        raise NotImplementedError(f'Full-text search is not supported for {vendor}')
+    return queryset.order_by('-search_rank', 'order', 'title', 'id')
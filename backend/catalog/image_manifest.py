@@ -0,0 +1,416 @@
+"""
+Манифест изображений товаров: product id → итоговый URL изображения.
+
+Поиск файла (resolve_image_url) обходит несколько папок static и делает десятки
+вызовов Path.exists()/glob на товар, поэтому результат вычисляется заранее
+(команда build_image_manifest, первый запуск процесса), сохраняется на диск и
+дальше Product.image_url - это поиск в словаре без обращений к файловой системе.
+
+Каждая запись хранит подпись товара (image, image_code, title). Если подпись
+изменилась (товар отредактирован в другом процессе), запись пересчитывается при
+первом обращении. Появление и удаление файлов отслеживается по mtime папок с
+изображениями, замена и удаление файла записи (в том числе во вложенных папках) -
+по размеру и mtime файла, сохранённым в записи.
+
+Сохранение товара обновляет запись после фиксации транзакции, а запись на диск
+откладывается на SAVE_DELAY секунд: серия сохранений даёт одну запись файла.
+
+Сборка манифеста повышает версию каталога (snapshot), а другие процессы
+перечитывают файл манифеста при изменении его mtime: перед пересборкой снимка
+без задержки, при обычных обращениях - не чаще раза в RELOAD_INTERVAL секунд.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import unquote
+
+from django.conf import settings
+
+from .fragments import invalidate_all_fragments
+from .image_matcher import get_matcher
+from .image_storage import get_name_index, get_name_index_path, is_content_name
+from .snapshot import bump_catalog_version
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FORMAT = 2
+# Задержка записи манифеста на диск после изменения записей, секунд
+SAVE_DELAY = 2.0
+# Как часто проверять mtime файла манифеста на диске, секунд
+RELOAD_INTERVAL = 5
+
+# Data URI для placeholder (1x1 прозрачный PNG)
+# Это предотвратит 404 ошибки и не будет пытаться загрузить несуществующий файл
+PLACEHOLDER_IMAGE = 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+
+STATIC_PRODUCTS_DIR = ('static', 'img', 'products')
+KVT_IMAGES_DIR = ('static', 'img', 'elektrotehnicheskij-zavod-kvt')
+
+
+def get_manifest_path():
+    return Path(getattr(settings, 'IMAGE_MANIFEST_PATH', Path(settings.BASE_DIR) / 'image_manifest.json'))
+
+
+def _image_dirs():
+    base = Path(settings.BASE_DIR)
+    return [base.joinpath(*STATIC_PRODUCTS_DIR), base.joinpath(*KVT_IMAGES_DIR)]
+
+
+def get_dirs_signature():
+    """mtime папок с изображениями (меняется при добавлении, удалении и переименовании файлов)
+    и индекса имён"""
+    signature = {}
+    for directory in _image_dirs():
+        try:
+            signature[str(directory)] = directory.stat().st_mtime_ns
+        except OSError:
+            signature[str(directory)] = None
+    # Индекс имён: старые ссылки товаров переводятся на файлы по содержимому
+    try:
+        signature['names'] = get_name_index_path().stat().st_mtime_ns
+    except OSError:
+        signature['names'] = None
+    return signature
+
+
+def url_path(url):
+    """Файл, который отдаётся по URL изображения (None для внешних URL и placeholder)"""
+    for prefix, root in (
+        (settings.STATIC_URL, Path(settings.BASE_DIR) / 'static'),
+        (settings.MEDIA_URL, Path(settings.MEDIA_ROOT)),
+    ):
+        if prefix and url.startswith(prefix):
+            return root / unquote(url[len(prefix):])
+    return None
+
+
+def file_stat(url):
+    """(размер, mtime в нс) файла изображения; (None, None) - файла нет или URL не на диске"""
+    path = url_path(url)
+    if path is not None:
+        try:
+            stat = path.stat()
+        except OSError:
+            pass
+        else:
+            return stat.st_size, stat.st_mtime_ns
+    return None, None
+
+
+def make_entry(signature, url):
+    """Запись манифеста: (подпись, URL, размер файла, mtime файла)"""
+    return (signature, url, *file_stat(url))
+
+
+def image_signature(image_name, image_code, title):
+    """Подпись из полей товара, от которых зависит URL изображения"""
+    return f'{image_name or ""}|{image_code or ""}|{title or ""}'
+
+
+def product_signature(product):
+    return image_signature(product.image.name if product.image else '', product.image_code, product.title)
+
+
+def resolve_image_url(product):
+    """Ищет изображение товара в файловой системе (медленный путь, без манифеста)"""
+    if product.image:
+        name = product.image.name
+        if not is_content_name(name):
+            # Старая ссылка: файл мог переименовать dedupe_product_images
+            name = get_name_index().get(name) or name
+        # Проверяем, есть ли файл в static (для Railway)
+        # Пробуем найти в static/img/products
+        image_name = os.path.basename(name)
+        static_products_dir = Path(settings.BASE_DIR).joinpath(*STATIC_PRODUCTS_DIR)
+
+        # Пробуем точное совпадение
+        static_image_path = static_products_dir / image_name
+        if static_image_path.exists():
+            return f'/static/img/products/{image_name}'
+        if is_content_name(name):
+            # Имя по содержимому однозначно - угадывать не нужно
+            return product.image.storage.url(name)
+
+        # Файл ещё не переведён в хранение по содержимому:
+        # пробуем варианты без суффикса (например, CA1500_TSni0GL.jpg -> CA1500.jpg)
+        if '_' in image_name:
+            base_name = image_name.split('_')[0]
+            for ext in ['.jpg', '.jpeg', '.png']:
+                variant_path = static_products_dir / f'{base_name}{ext}'
+                if variant_path.exists():
+                    return f'/static/img/products/{base_name}{ext}'
+
+        # Если нет в static, используем media (для локальной разработки)
+        return product.image.url
+    if product.image_code:
+        # Игнорируем product-placeholder.png
+        if 'product-placeholder.png' in product.image_code:
+            # Пропускаем и переходим к следующей проверке
+            pass
+        # Проверяем, что image_code не является полным URL
+        elif product.image_code.startswith('http'):
+            # Если это полный URL, используем его напрямую
+            return product.image_code
+        # Если это путь к статическому файлу (начинается с /static/)
+        elif product.image_code.startswith('/static/'):
+            return product.image_code
+        # Если это просто код - пробуем найти в static
+        else:
+            # Сначала пробуем найти в static/img/products
+            static_products_dir = Path(settings.BASE_DIR).joinpath(*STATIC_PRODUCTS_DIR)
+            # Пробуем разные варианты имени файла
+            code_variants = [
+                f'{product.image_code}.jpg',
+                f'{product.image_code}.png',
+                f'{product.image_code}.jpeg',
+            ]
+
+            for variant in code_variants:
+                variant_path = static_products_dir / variant
+                if variant_path.exists():
+                    return f'/static/img/products/{variant}'
+
+            # Если не найдено в static, возвращаем старый путь (для обратной совместимости)
+            return f'/upload/resize_cache/iblock/{product.image_code}/310_310_2/{product.image_code}.png'
+
+    # Пробуем найти изображение в папке elektrotehnicheskij-zavod-kvt по названию товара (title)
+    # ИСПРАВЛЕНИЕ: Ищем по title, а не по SKU, потому что SKU - это числовой код,
+    # а имена файлов соответствуют обозначениям товаров (названиям)
+    if product.title:
+        filename = get_matcher(Path(settings.BASE_DIR).joinpath(*KVT_IMAGES_DIR)).match(product.title)
+        if filename:
+            return f'/static/img/elektrotehnicheskij-zavod-kvt/{filename}'
+
+    return PLACEHOLDER_IMAGE
+
+
+def resolve_task(row):
+    """Задача пула: (id, image, image_code, title) → запись манифеста без запросов к базе"""
+    from .models import Product
+
+    pk, image_name, image_code, title = row
+    product = Product(pk=pk, image=image_name or None, image_code=image_code, title=title)
+    return make_entry(image_signature(image_name, image_code, title), resolve_image_url(product))
+
+
+class ImageManifest:
+    """Словарь product id → (подпись, URL, размер, mtime) с сохранением на диск"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {}
+        self.dirs = {}
+        self.loaded = False
+        self.loaded_mtime = None
+        self.checked_at = None
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._timer = None
+
+    def _mtime(self):
+        try:
+            return self.path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self):
+        """Загружает манифест с диска; возвращает False, если файла нет или он повреждён"""
+        mtime = self._mtime()
+        try:
+            with open(self.path, encoding='utf-8') as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return False
+        if data.get('format') != MANIFEST_FORMAT:
+            return False
+        with self._lock:
+            self.entries = {int(pk): tuple(entry) for pk, entry in data.get('products', {}).items()}
+            self.dirs = data.get('dirs', {})
+            self.loaded = True
+            self.loaded_mtime = mtime
+            self.checked_at = time.monotonic()
+        return True
+
+    def save(self):
+        """Атомарно записывает манифест на диск"""
+        with self._lock:
+            self._dirty = False
+            data = {
+                'format': MANIFEST_FORMAT,
+                'dirs': self.dirs,
+                'products': {str(pk): list(entry) for pk, entry in self.entries.items()},
+            }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                json.dump(data, fh, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save image manifest {self.path}: {e}")
+            return
+        # Собственную запись перечитывать не нужно
+        with self._lock:
+            self.loaded_mtime = self._mtime()
+            self.checked_at = time.monotonic()
+
+    def schedule_save(self):
+        """Отложенная запись: изменения за SAVE_DELAY секунд сохраняются одним файлом"""
+        with self._lock:
+            self._dirty = True
+            if self._timer is None:
+                self._timer = threading.Timer(SAVE_DELAY, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Записывает отложенные изменения (по таймеру и при завершении процесса)"""
+        with self._lock:
+            self._timer = None
+            if not self._dirty:
+                return
+        self.save()
+
+    def build(self, products=None, workers=1, chunk_size=None, progress=None):
+        """Пересчитывает URL для всех товаров (или переданных) и сохраняет манифест.
+        Полная сборка при workers > 1 идёт в пуле процессов (catalog.image_pool);
+        по умолчанию - в текущем процессе, как при первом обращении из веб-воркера"""
+        from .image_pool import DEFAULT_CHUNK_SIZE, run_parallel
+        from .models import Product
+
+        if products is None:
+            entries = {}
+            rows = Product.objects.values_list('id', 'image', 'image_code', 'title').order_by('id')
+            for row, entry, error in run_parallel(
+                resolve_task, rows, workers, chunk_size or DEFAULT_CHUNK_SIZE, progress,
+            ):
+                if error:
+                    logger.warning(f"Could not resolve image for product {row[0]}: {error}")
+                    entry = make_entry(image_signature(*row[1:]), PLACEHOLDER_IMAGE)
+                entries[row[0]] = entry
+        else:
+            entries = dict(self.entries)
+            for product in products:
+                entries[product.pk] = make_entry(product_signature(product), resolve_image_url(product))
+        with self._lock:
+            self.entries = entries
+            self.dirs = get_dirs_signature()
+            self.loaded = True
+        self.save()
+        # URL изображений могли измениться - отрендеренные карточки и снимок каталога
+        # больше не актуальны (версия каталога общая для всех воркеров)
+        invalidate_all_fragments()
+        bump_catalog_version()
+        return len(entries)
+
+    def dirs_changed(self):
+        """Изменился ли набор файлов в папках с изображениями с момента сборки"""
+        return self.dirs != get_dirs_signature()
+
+    def stale_products(self):
+        """id товаров, у которых файл изображения заменён или удалён с момента записи"""
+        return [pk for pk, entry in self.entries.items() if tuple(entry[2:]) != file_stat(entry[1])]
+
+    def is_stale(self):
+        return self.dirs_changed() or bool(self.stale_products())
+
+    def refresh(self):
+        """Приводит загруженный манифест в актуальное состояние: полная сборка при изменении
+        папок, иначе пересчёт записей с изменёнными файлами. Возвращает число пересчитанных"""
+        from .models import Product
+
+        if self.dirs_changed():
+            return self.build()
+        stale = self.stale_products()
+        if stale:
+            self.build(Product.objects.filter(pk__in=stale).only('id', 'image', 'image_code', 'title'))
+        return len(stale)
+
+    def reload_if_changed(self):
+        """Перечитывает манифест, если файл на диске записан другим процессом.
+        Несохранённые изменения этого процесса не затираются"""
+        if not self.loaded:
+            return False
+        with self._lock:
+            self.checked_at = time.monotonic()
+            if self._dirty or self._mtime() == self.loaded_mtime:
+                return False
+            return self.load()
+
+    def ensure_loaded(self):
+        if self.loaded:
+            checked_at = self.checked_at
+            if checked_at is None or time.monotonic() - checked_at >= RELOAD_INTERVAL:
+                self.reload_if_changed()
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            # Первое обращение в процессе: берём манифест с диска, если он актуален
+            if self.load():
+                self.refresh()
+            else:
+                self.build()
+
+    def get(self, product):
+        """URL изображения товара: O(1) для актуальной записи"""
+        self.ensure_loaded()
+        signature = product_signature(product)
+        entry = self.entries.get(product.pk)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+        url = resolve_image_url(product)
+        if product.pk is not None:
+            with self._lock:
+                self.entries[product.pk] = make_entry(signature, url)
+        return url
+
+    def get_by_values(self, pk, image_name, image_code, title):
+        """get() по значениям полей (строкам .values_list()) без экземпляра модели"""
+        self.ensure_loaded()
+        entry = self.entries.get(pk)
+        if entry is not None and entry[0] == image_signature(image_name, image_code, title):
+            return entry[1]
+        from .models import Product
+
+        return self.get(Product(pk=pk, image=image_name or None, image_code=image_code, title=title))
+
+    def update(self, product):
+        """Пересчитывает запись одного товара; запись на диск - отложенная"""
+        if not self.loaded:
+            # Манифест ещё не загружен этим процессом: устаревшая запись будет
+            # пересчитана по подписи товара при первом обращении
+            return
+        entry = make_entry(product_signature(product), resolve_image_url(product))
+        with self._lock:
+            self.entries[product.pk] = entry
+        self.schedule_save()
+
+    def discard(self, product_id):
+        """Удаляет запись товара; запись на диск - отложенная"""
+        if not self.loaded:
+            return
+        with self._lock:
+            removed = self.entries.pop(product_id, None)
+        if removed is not None:
+            self.schedule_save()
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest():
+    """Общий для процесса манифест изображений"""
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                _manifest = ImageManifest(get_manifest_path())
+                # Отложенная запись не должна теряться при остановке воркера
+                atexit.register(_manifest.flush)
+    return _manifest
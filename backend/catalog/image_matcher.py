@@ -0,0 +1,172 @@
+"""
+Индексированный поиск изображения по названию товара в папке elektrotehnicheskij-zavod-kvt.
+
+Правила те же, что были в Product.image_url:
+1. точное имя файла (варианты названия с заменой '/' и '-' на '_', расширения .jpg/.jpeg/.png);
+2. точное совпадение нормализованных имён;
+3. частичное совпадение: одно имя входит в другое и покрывает не меньше 70% его длины.
+Раньше шаги 2 и 3 шли одним перебором и возвращали первый подходящий файл в порядке
+glob; теперь точное совпадение проверяется раньше частичного, а из частичных
+выбирается совпадение с наибольшим процентом (при равенстве - первое в порядке glob:
+.jpg, .png, .jpeg, внутри расширения по имени файла). Сравнение с прежними правилами -
+ImageMatcherTests.
+
+Имена файлов нормализуются один раз: хэш-индекс нормализованное имя → файлы и
+индекс триграмм для поиска имён, содержащих название товара.
+"""
+import math
+import os
+import re
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+MATCH_RATIO = 0.7
+MIN_MATCH_LENGTH = 3
+NGRAM_SIZE = 3
+
+
+def clean_title(title):
+    """Название товара без лишних символов и пробелов, в верхнем регистре"""
+    return re.sub(r'[^\w\-/]', '', str(title).upper().strip())
+
+
+def normalize_name(name):
+    """Приводит название или имя файла (без расширения) к виду для сравнения"""
+    return re.sub(r'[^\w\-/]', '', name.upper()).replace(' ', '').replace('/', '_').replace('-', '_')
+
+
+def _ngrams(value):
+    return {value[i:i + NGRAM_SIZE] for i in range(len(value) - NGRAM_SIZE + 1)}
+
+
+class ImageMatcher:
+    """Индекс файлов одной папки для сопоставления названий товаров с изображениями"""
+
+    def __init__(self, filenames):
+        # Порядок расширений как у glob('*.jpg') + glob('*.png') + glob('*.jpeg'), затем по имени
+        ext_order = {'.jpg': 0, '.png': 1, '.jpeg': 2}
+        self.filenames = sorted(
+            (name for name in filenames if os.path.splitext(name)[1] in ext_order),
+            key=lambda name: (ext_order[os.path.splitext(name)[1]], name),
+        )
+        self.names = frozenset(self.filenames)
+        self.normalized = [normalize_name(os.path.splitext(name)[0]) for name in self.filenames]
+        self.by_normalized = {}
+        self.by_ngram = {}
+        for position, normalized in enumerate(self.normalized):
+            self.by_normalized.setdefault(normalized, []).append(position)
+            if len(normalized) >= MIN_MATCH_LENGTH:
+                for gram in _ngrams(normalized):
+                    self.by_ngram.setdefault(gram, set()).add(position)
+
+    @classmethod
+    def from_directory(cls, directory):
+        try:
+            with os.scandir(directory) as entries:
+                return cls([entry.name for entry in entries if entry.is_file()])
+        except OSError:
+            return cls([])
+
+    def match(self, title):
+        """Имя файла изображения для названия товара или None"""
+        if not title:
+            return None
+        title_clean = clean_title(title)
+        normalized_title = re.sub(r'\s+', '', title_clean)
+
+        # 1. Точное имя файла
+        for ext in IMAGE_EXTENSIONS:
+            for variant in (
+                normalized_title + ext,
+                normalized_title.replace('/', '_') + ext,
+                normalized_title.replace('-', '_') + ext,
+                title_clean + ext,
+                title_clean.replace('/', '_') + ext,
+                title_clean.replace('-', '_') + ext,
+            ):
+                if variant in self.names:
+                    return variant
+
+        # 2-3. Сравнение нормализованных имён (все варианты названия сводятся к одной строке)
+        value = normalize_name(title_clean)
+        exact = self.by_normalized.get(value)
+        if exact:
+            return self.filenames[exact[0]]
+        best = self._best_partial(value)
+        if best is None:
+            return None
+        return self.filenames[best[1]]
+
+    def _best_partial(self, value):
+        """(−ratio, позиция) лучшего частичного совпадения не ниже MATCH_RATIO"""
+        length = len(value)
+        if length < MIN_MATCH_LENGTH:
+            return None
+        best = None
+
+        # Название входит в имя файла: файл содержит все триграммы названия
+        max_length = length / MATCH_RATIO
+        postings = sorted((self.by_ngram.get(gram, ()) for gram in _ngrams(value)), key=len)
+        if postings and postings[0]:
+            positions = set(postings[0])
+            for posting in postings[1:]:
+                positions &= posting
+                if not positions:
+                    break
+            for position in positions:
+                name = self.normalized[position]
+                if len(name) <= max_length and value in name:
+                    candidate = (-(length / len(name)), position)
+                    if best is None or candidate < best:
+                        best = candidate
+
+        # Имя файла входит в название: перебираем подстроки названия достаточной длины
+        min_length = max(MIN_MATCH_LENGTH, math.ceil(length * MATCH_RATIO))
+        while min_length / length < MATCH_RATIO:
+            min_length += 1
+        for size in range(length - 1, min_length - 1, -1):
+            ratio = size / length
+            if best is not None and -best[0] > ratio:
+                break
+            for start in range(length - size + 1):
+                positions = self.by_normalized.get(value[start:start + size])
+                if positions:
+                    candidate = (-ratio, positions[0])
+                    if best is None or candidate < best:
+                        best = candidate
+        return best
+
+    def match_many(self, titles):
+        """Пакетный режим: {название: имя файла или None} за один проход по каталогу"""
+        results = {}
+        for title in titles:
+            if title not in results:
+                results[title] = self.match(title)
+        return results
+
+
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+
+def get_matcher(directory=None):
+    """Матчер для папки (по умолчанию kvt); перестраивается при изменении содержимого папки"""
+    if directory is None:
+        directory = Path(settings.BASE_DIR) / 'static' / 'img' / 'elektrotehnicheskij-zavod-kvt'
+    directory = str(directory)
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        mtime = None
+    cached = _matchers.get(directory)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _matchers_lock:
+        cached = _matchers.get(directory)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, ImageMatcher.from_directory(directory))
+            _matchers[directory] = cached
+        return cached[1]
@@ -0,0 +1,122 @@
+"""
+Параллельная обработка изображений в пуле процессов.
+
+Хэширование, миниатюры (Pillow) и поиск файлов упираются в CPU и системные
+вызовы, и потоки из-за GIL не ускоряют их. run_parallel раздаёт задачи процессам
+пачками по chunk_size: данные между процессами передаются один раз на пачку,
+а не на файл. Результаты приходят по мере готовности пачек; вызывающий код
+сохраняет их (индекс миниатюр, манифест) контрольными точками, поэтому
+прерванный запуск продолжается с места остановки.
+
+Задача - функция уровня модуля (её передаёт pickle), аргументы - простые
+значения: пути, строки, кортежи; без моделей и соединений с базой.
+"""
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+
+DEFAULT_CHUNK_SIZE = 16
+PROGRESS_INTERVAL = 1.0
+
+
+def get_workers(workers=None):
+    """Число процессов: аргумент, settings.CATALOG_IMAGE_WORKERS или число ядер"""
+    if not workers:
+        workers = getattr(settings, 'CATALOG_IMAGE_WORKERS', 0) or os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def _init_worker():
+    # При запуске процессов через spawn (macOS, Windows) Django нужно настроить заново
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def _run_chunk(func, chunk):
+    results = []
+    for item in chunk:
+        try:
+            results.append((item, func(item), None))
+        except Exception as e:
+            # Исключение передаётся строкой: не каждое переживает pickle
+            results.append((item, None, f'{type(e).__name__}: {e}'))
+    return results
+
+
+def run_parallel(func, items, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Генератор (item, результат, ошибка) в порядке готовности пачек; ошибка - строка или None.
+    progress(done, total) вызывается после каждой пачки. При workers=1 пул не создаётся"""
+    items = list(items)
+    total = len(items)
+    chunk_size = max(1, chunk_size)
+    chunks = [items[start:start + chunk_size] for start in range(0, total, chunk_size)]
+    workers = min(get_workers(workers), len(chunks)) if chunks else 1
+    done = 0
+
+    if workers == 1:
+        for chunk in chunks:
+            results = _run_chunk(func, chunk)
+            done += len(chunk)
+            if progress:
+                progress(done, total)
+            yield from results
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    try:
+        futures = [executor.submit(_run_chunk, func, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            results = future.result()
+            done += len(results)
+            if progress:
+                progress(done, total)
+            yield from results
+    finally:
+        # Генератор могли не дочитать (ошибка, Ctrl+C): оставшиеся пачки не запускаем
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def progress_printer(label, stream=None, interval=PROGRESS_INTERVAL):
+    """Колбэк progress для run_parallel: «label: done/total (N%)» не чаще раза в interval секунд"""
+    stream = stream or sys.stderr
+    last = 0
+
+    def report(done, total):
+        nonlocal last
+        now = time.monotonic()
+        if done < total and now - last < interval:
+            return
+        last = now
+        percent = done * 100 // total if total else 100
+        stream.write(f'{label}: {done}/{total} ({percent}%)\n')
+
+    return report
+
+
+class Checkpoint:
+    """Вызывает save не чаще раза в interval секунд - контрольная точка для продолжения"""
+
+    def __init__(self, save, interval=10.0):
+        self.save = save
+        self.interval = interval
+        self.saved_at = time.monotonic()
+
+    def __call__(self):
+        if time.monotonic() - self.saved_at >= self.interval:
+            self.save()
+            self.saved_at = time.monotonic()
+
+
+def copy_file(paths):
+    """Задача пула: копирует (источник, назначение) с метаданными; возвращает размер"""
+    source, target = paths
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.copy2(source, target)
+    return os.path.getsize(target)
@@ -0,0 +1,197 @@
+"""
+Хранилище изображений товаров по содержимому (content-addressed).
+
+Файл сохраняется под именем из sha256 содержимого: products/<sha256>.jpg.
+Одинаковые загрузки дают одно имя и один файл на диске, а Django больше не
+добавляет к имени случайные суффиксы (CA1500_TSni0GL.jpg рядом с CA1500.jpg).
+
+Индекс имён (MEDIA_ROOT/image_names.json) хранит исходное имя → имя по
+содержимому - для новых загрузок и для файлов, которые переименовала команда
+dedupe_product_images. По нему resolve_image_url находит файл по старой ссылке
+(например, в другой базе) без угадывания по префиксу имени.
+
+Один файл может принадлежать нескольким товарам, поэтому хранилище файлы
+не удаляет: файлы, на которые не ссылается ни один товар, удаляет команда
+prune_product_images.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT = 1
+RELOAD_INTERVAL = 5
+_CONTENT_NAME_RE = re.compile(r'^[0-9a-f]{64}\.[0-9a-z]+$')
+
+
+def is_content_name(name):
+    """Имя файла уже по содержимому (<sha256>.<расширение>)"""
+    return bool(_CONTENT_NAME_RE.match(os.path.basename(name or '')))
+
+
+def content_name(directory, sha, original_name):
+    """Имя по содержимому в папке directory; расширение берётся из исходного имени"""
+    extension = os.path.splitext(original_name)[1].lower() or '.bin'
+    return f'{directory}/{sha}{extension}' if directory else f'{sha}{extension}'
+
+
+class NameIndex:
+    """Индекс исходное имя → имя по содержимому с сохранением на диск"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.names = {}
+        self.loaded_mtime = None
+        self.checked_at = None
+        self._lock = threading.RLock()
+
+    def _mtime(self):
+        try:
+            return self.path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self):
+        mtime = self._mtime()
+        data = {}
+        if mtime is not None:
+            try:
+                with open(self.path, encoding='utf-8') as fh:
+                    data = json.load(fh)
+            except (OSError, ValueError):
+                data = {}
+        if data.get('format') != INDEX_FORMAT:
+            data = {}
+        with self._lock:
+            self.names = data.get('names', {})
+            self.loaded_mtime = mtime
+            self.checked_at = time.monotonic()
+
+    def save(self):
+        """Атомарно записывает индекс на диск"""
+        with self._lock:
+            data = {'format': INDEX_FORMAT, 'names': dict(sorted(self.names.items()))}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                # По строке на имя: индекс хранится в git вместе с media/products
+                json.dump(data, fh, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save image name index {self.path}: {e}")
+            return
+        with self._lock:
+            self.loaded_mtime = self._mtime()
+
+    def _ensure_fresh(self):
+        checked_at = self.checked_at
+        if checked_at is not None and time.monotonic() - checked_at < RELOAD_INTERVAL:
+            return
+        with self._lock:
+            if self.checked_at is not None and time.monotonic() - self.checked_at < RELOAD_INTERVAL:
+                return
+            if self.checked_at is None or self._mtime() != self.loaded_mtime:
+                self.load()
+            self.checked_at = time.monotonic()
+
+    def get(self, name):
+        """Имя по содержимому для исходного имени или None"""
+        self._ensure_fresh()
+        return self.names.get(name)
+
+    def update(self, names, overwrite=True):
+        """Добавляет пары исходное имя → имя по содержимому и сохраняет индекс;
+        overwrite=False не меняет уже известные имена"""
+        with self._lock:
+            # Индекс могли дополнить другие процессы
+            self.load()
+            if not overwrite:
+                names = {name: target for name, target in names.items() if name not in self.names}
+            if not names:
+                return
+            self.names.update(names)
+        self.save()
+
+    def discard_targets(self, targets):
+        """Удаляет пары, ведущие к удалённым файлам, и сохраняет индекс"""
+        targets = set(targets)
+        with self._lock:
+            self.load()
+            names = {name: target for name, target in self.names.items() if target not in targets}
+            if len(names) == len(self.names):
+                return
+            self.names = names
+        self.save()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, в котором имя файла - sha256 содержимого"""
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяет содержимое: суффиксы для уникальности не нужны
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        target = content_name(os.path.dirname(name), digest.hexdigest(), name)
+        full_path = Path(self.path(target))
+        if not full_path.exists():
+            full_path.parent.mkdir(parents=True, exist_ok=True)
+            if self.directory_permissions_mode is not None:
+                os.chmod(full_path.parent, self.directory_permissions_mode)
+            # Запись во временный файл и os.replace: одновременные загрузки одного
+            # содержимого пишут одинаковые байты, поэтому замена безопасна
+            tmp_path = full_path.with_name(f'{full_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            try:
+                with open(tmp_path, 'wb') as fh:
+                    for chunk in content.chunks():
+                        fh.write(chunk)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, full_path)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+        if name != target:
+            # Старое имя из базы (до dedupe_product_images) не перенаправляем на новую загрузку
+            get_name_index().update({name: target}, overwrite=False)
+        return target
+
+    def delete(self, name):
+        # Файл может принадлежать другим товарам; ненужные удаляет prune_product_images
+        pass
+
+
+def get_name_index_path():
+    return Path(getattr(settings, 'CATALOG_IMAGE_NAME_INDEX', Path(settings.MEDIA_ROOT) / 'image_names.json'))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_name_index():
+    """Общий для процесса индекс имён"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = NameIndex(get_name_index_path())
+    return _index
+
+
+def get_product_image_storage():
+    """Хранилище Product.image; вызываемый storage не попадает в миграции объектом"""
+    return ContentAddressedStorage()
@@ -0,0 +1,251 @@
+"""
+Инкрементальная синхронизация изображений товаров: media/products → static/img/products.
+
+В папке назначения лежит манифест: для каждого файла источника [размер, mtime в нс,
+sha256] на момент последней синхронизации. Запуск читает обе папки через os.scandir
+и сравнивает их с манифестом. Файлы с прежними размером и mtime, у которых есть
+копия, пропускаются без чтения. Остальные хэшируются в пуле процессов
+(catalog.image_pool), а копируются только те, у которых изменился хэш или пропала
+копия. Поэтому повторный запуск без изменений - это два обхода папок и ни одного
+чтения файла. Файлы, удалённые из источника, удаляются и из назначения, но только
+те, что создала синхронизация: они есть в манифесте.
+
+Способы переноса (SYNC_MODES):
+- copy - копия байтов;
+- hardlink - жёсткая ссылка, без второй копии на диске;
+- reflink - клон с копированием при записи (FICLONE: Btrfs, XFS).
+Если ссылку создать нельзя (другая файловая система, нет поддержки), файл копируется.
+"""
+import errno
+import json
+import logging
+import os
+import shutil
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+
+from .image_pool import DEFAULT_CHUNK_SIZE, Checkpoint, run_parallel
+from .thumbnails import fingerprint
+
+try:
+    import fcntl
+except ImportError:  # Windows: reflink недоступен
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = '.sync_manifest.json'
+MANIFEST_FORMAT = 1
+SYNC_MODES = ('copy', 'hardlink', 'reflink')
+# ioctl FICLONE из linux/fs.h (в модуле fcntl - только с Python 3.12)
+FICLONE = getattr(fcntl, 'FICLONE', 0x40049409)
+_LINK_ERRORS = (errno.EXDEV, errno.EPERM, errno.EINVAL, errno.ENOTTY, errno.EOPNOTSUPP, errno.ENOSYS)
+
+
+def get_source_dir():
+    return Path(settings.MEDIA_ROOT) / 'products'
+
+
+def get_target_dir():
+    return Path(settings.BASE_DIR) / 'static' / 'img' / 'products'
+
+
+def scan(root):
+    """Относительный путь (через /) → (размер, mtime в нс) для всех файлов под root"""
+    files = {}
+    stack = [(str(root), '')]
+    while stack:
+        directory, prefix = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = prefix + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, name + '/'))
+                elif entry.is_file() and not entry.name.endswith('.tmp') and name != MANIFEST_NAME:
+                    stat = entry.stat()
+                    files[name] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def _reflink(source, target):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'reflink is not supported')
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def sync_file(job):
+    """Задача пула: переносит (источник, назначение, способ); возвращает способ, которым
+    файл перенесён на самом деле (при неудаче ссылки - copy)"""
+    source, target, mode = job
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Через временный файл: жёсткая ссылка на старую копию не должна меняться на месте
+    tmp_path = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        used = mode
+        try:
+            if mode == 'hardlink':
+                os.link(source, tmp_path)
+            elif mode == 'reflink':
+                _reflink(source, tmp_path)
+            else:
+                used = 'copy'
+        except OSError as e:
+            if e.errno not in _LINK_ERRORS:
+                raise
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            used = 'copy'
+        if used == 'copy':
+            shutil.copy2(source, tmp_path)
+        elif used == 'reflink':
+            shutil.copystat(source, tmp_path)
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return used
+
+
+@dataclass
+class SyncReport:
+    """Итог синхронизации: списки относительных путей по видам изменений"""
+    added: list = field(default_factory=list)
+    updated: list = field(default_factory=list)
+    deleted: list = field(default_factory=list)
+    # Файл источника тронут (mtime), но содержимое и копия прежние
+    touched: list = field(default_factory=list)
+    unchanged: int = 0
+    copied_bytes: int = 0
+    modes: dict = field(default_factory=dict)
+    errors: list = field(default_factory=list)
+
+    @property
+    def changed(self):
+        return bool(self.added or self.updated or self.deleted)
+
+    def diff_lines(self):
+        """Строки в духе diff: + добавлен, ~ обновлён, - удалён"""
+        lines = [f'+ {name}' for name in self.added]
+        lines += [f'~ {name}' for name in self.updated]
+        lines += [f'- {name}' for name in self.deleted]
+        return sorted(lines, key=lambda line: line[2:])
+
+
+class ImageSync:
+    """Синхронизация папки source в target по манифесту (размер, mtime, sha256)"""
+
+    def __init__(self, source, target, mode='copy'):
+        if mode not in SYNC_MODES:
+            raise ValueError(f'Unknown sync mode: {mode}')
+        self.source = Path(source)
+        self.target = Path(target)
+        self.mode = mode
+        self.files = {}
+
+    @property
+    def manifest_path(self):
+        return self.target / MANIFEST_NAME
+
+    def load(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            data = {}
+        if data.get('format') != MANIFEST_FORMAT:
+            data = {}
+        self.files = {name: tuple(entry) for name, entry in data.get('files', {}).items()}
+
+    def save(self):
+        """Атомарно записывает манифест"""
+        data = {'format': MANIFEST_FORMAT, 'files': {name: list(entry) for name, entry in self.files.items()}}
+        self.target.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_name(f'{MANIFEST_NAME}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                json.dump(data, fh, ensure_ascii=False)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError as e:
+            logger.warning(f"Could not save image sync manifest {self.manifest_path}: {e}")
+
+    def run(self, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, progress=None):
+        """Синхронизирует папки и возвращает SyncReport; dry_run только считает изменения.
+        progress(label) возвращает колбэк прогресса для этапа (см. progress_printer) или None"""
+        progress = progress or (lambda label: None)
+        self.load()
+        report = SyncReport()
+        source_files = scan(self.source)
+        target_files = scan(self.target)
+
+        # Без чтения файлов: прежние размер и mtime, копия на месте и того же размера
+        suspects = []
+        for name, (size, mtime) in source_files.items():
+            entry = self.files.get(name)
+            if entry is not None and entry[:2] == (size, mtime) and target_files.get(name, (None,))[0] == size:
+                report.unchanged += 1
+            else:
+                suspects.append(name)
+
+        # Файлы к переносу: имя → [размер, mtime, sha256]
+        entries = {}
+        checkpoint = Checkpoint(self.save)
+        for path, entry, error in run_parallel(
+            fingerprint, [str(self.source / name) for name in suspects], workers, chunk_size, progress('Хэширование'),
+        ):
+            name = Path(path).relative_to(self.source).as_posix()
+            if error:
+                report.errors.append(f'{name}: {error}')
+                continue
+            previous = self.files.get(name)
+            size, mtime, sha = entry
+            copy = target_files.get(name)
+            if previous is not None and previous[2] == sha and copy is not None and copy[0] == size:
+                report.touched.append(name)
+                if not dry_run:
+                    self.files[name] = tuple(entry)
+                continue
+            (report.added if copy is None and previous is None else report.updated).append(name)
+            entries[name] = tuple(entry)
+
+        if dry_run:
+            report.copied_bytes = sum(entry[0] for entry in entries.values())
+        else:
+            for (source, target, mode), used, error in run_parallel(
+                sync_file,
+                [(str(self.source / name), str(self.target / name), self.mode) for name in entries],
+                workers, chunk_size, progress('Копирование'),
+            ):
+                name = Path(source).relative_to(self.source).as_posix()
+                if error:
+                    report.errors.append(f'{name}: {error}')
+                    (report.added if name in report.added else report.updated).remove(name)
+                    continue
+                self.files[name] = entries[name]
+                report.copied_bytes += entries[name][0]
+                report.modes[used] = report.modes.get(used, 0) + 1
+                checkpoint()
+
+        # Удалённые из источника: только файлы, которые создала синхронизация
+        for name in sorted(set(self.files) - set(source_files)):
+            if not dry_run:
+                try:
+                    os.remove(self.target / name)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    report.errors.append(f'{name}: {e}')
+                    continue
+                del self.files[name]
+            report.deleted.append(name)
+
+        if not dry_run and (entries or report.touched or report.deleted):
+            self.save()
+        return report
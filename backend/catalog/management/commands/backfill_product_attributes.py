@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from catalog.attributes import backfill_attributes
+from catalog.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Заполняет числовые колонки товаров (сечение провода, нагрузка в кН) из текстовых полей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пачки bulk_update')
+
+    def handle(self, *args, **options):
+        updated = backfill_attributes(Product, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Обновлено товаров: {updated}'))
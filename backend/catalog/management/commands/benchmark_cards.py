@@ -0,0 +1,123 @@
+import gc
+import random
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import Context, Template
+from django.template.loader import render_to_string
+
+from catalog.cards import CARD_FIELDS, make_card, price_formatter
+from catalog.models import Category, Product, Section, Subcategory
+
+PREFIXES = ['ЗАН', 'НБЕ', 'ТМЛ', 'ПК', 'ГМ', 'СИП', 'КВТ', 'DKC', 'ШВВП', 'НИ', 'ТА']
+IMAGE_URL = '/static/img/products/placeholder.jpg'
+# Цены в шаблоне до catalog.cards и после
+MODEL_PRICES = Template(
+    '{% load humanize %}{% for product in products %}'
+    '{{ product.display_price|floatformat:0|intcomma }}{{ product.price_retail|floatformat:0|intcomma }}'
+    '{% endfor %}'
+)
+CARD_PRICES = Template('{% for product in products %}{{ product.price_text }}{{ product.retail_price_text }}{% endfor %}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает память и время построения и рендера карточек: модели Product против '
+        'catalog.cards.ProductCard. Синтетические товары создаются в транзакции, которая откатывается'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50_000, help='Размер синтетического каталога')
+        parser.add_argument('--render', type=int, default=5_000, help='Сколько карточек рендерить шаблоном')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def measure(self, build):
+        """(результат, секунды, байты): время - без tracemalloc, память - отдельным прогоном"""
+        gc.collect()
+        started = time.perf_counter()
+        result = build()
+        seconds = time.perf_counter() - started
+        del result
+        gc.collect()
+        tracemalloc.start()
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, seconds, size
+
+    def create_products(self, count, rng):
+        category = Category.objects.create(title='Бенчмарк', slug='benchmark-cards')
+        subcategory = Subcategory.objects.create(category=category, title='Бенчмарк', slug='benchmark-cards')
+        section = Section.objects.create(subcategory=subcategory, title='Бенчмарк', slug='benchmark-cards')
+        products = []
+        for number in range(count):
+            title = f'{rng.choice(PREFIXES)}-{rng.randint(1, 2500)}{rng.choice(["", "(Л)", " У3", "/35"])}'
+            price = Decimal(rng.randint(0, 300_000))
+            products.append(Product(
+                section=section,
+                subcategory=subcategory,
+                category=category,
+                title=title,
+                slug=f'benchmark-{number}',
+                sku=f'BENCH-{number}',
+                short_description=f'{title}. Краткое описание товара для каталога.',
+                full_description=' '.join(rng.choice(PREFIXES) for _ in range(120)),
+                price=price,
+                price_retail=price * Decimal('1.2') if rng.random() < 0.5 else None,
+                image=f'products/benchmark-{number}.jpg',
+                unit='шт',
+                wire_section=f'{rng.choice([1.5, 2.5, 16, 35, 70, 95])}-{rng.choice([120, 150, 240])}',
+                load_limit=f'{rng.randint(1, 60)} кН',
+                order=rng.randint(0, 100),
+            ))
+        Product.objects.bulk_create(products, batch_size=1000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            self.create_products(options['products'], rng)
+            queryset = Product.objects.filter(sku__startswith='BENCH-').order_by('order', 'title', 'id')
+            format_price = price_formatter()
+            models, model_seconds, model_bytes = self.measure(lambda: tuple(queryset.all()))
+            # URL изображений синтетических товаров не ищется: манифест в замер не входит
+            cards, card_seconds, card_bytes = self.measure(
+                lambda: tuple(make_card(row, IMAGE_URL, format_price) for row in queryset.values_list(*CARD_FIELDS))
+            )
+            transaction.set_rollback(True)
+
+        count = len(cards)
+        self.stdout.write(
+            f'Модели Product: {model_bytes / 2**20:.1f} МБ ({model_bytes / count:.0f} байт на товар), '
+            f'{model_seconds:.2f} с'
+        )
+        self.stdout.write(
+            f'ProductCard:    {card_bytes / 2**20:.1f} МБ ({card_bytes / count:.0f} байт на товар), '
+            f'{card_seconds:.2f} с с форматированием цен'
+        )
+
+        sample = options['render']
+        started = time.perf_counter()
+        MODEL_PRICES.render(Context({'products': models[:sample]}))
+        model_render = time.perf_counter() - started
+        started = time.perf_counter()
+        CARD_PRICES.render(Context({'products': cards[:sample]}))
+        card_render = time.perf_counter() - started
+        self.stdout.write(
+            f'Цены {sample} карточек: фильтры floatformat|intcomma {model_render * 1000:.0f} мс, '
+            f'готовые строки {card_render * 1000:.0f} мс'
+        )
+
+        started = time.perf_counter()
+        render_to_string('catalog/_product_list.html', {'products': cards[:sample], 'loading': 'lazy'})
+        list_render = time.perf_counter() - started
+        self.stdout.write(
+            f'Рендер _product_list.html: {sample} карточек за {list_render * 1000:.0f} мс '
+            f'({list_render / sample * 1_000_000:.0f} мкс на карточку)'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Память: -{(1 - card_bytes / model_bytes) * 100:.0f}%, '
+            f'построение: x{model_seconds / card_seconds:.1f}, рендер цен: x{model_render / card_render:.1f}'
+        ))
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from catalog.image_pool import DEFAULT_CHUNK_SIZE, run_parallel
+from catalog.thumbnails import PRESETS, fingerprint, get_thumbnails_dir, thumbnail_task
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+
+
+class Command(BaseCommand):
+    help = 'Замеряет масштабирование обработки изображений (хэши, миниатюры) по числу процессов пула'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, nargs='+',
+            help='Числа процессов для сравнения (по умолчанию 1, 2, 4 … до числа ядер)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--limit', type=int, help='Не больше N изображений из корпуса')
+        parser.add_argument('--skip-thumbnails', action='store_true', help='Только хэширование')
+
+    def corpus(self, limit):
+        """Локальные изображения из media и static/img (без готовых миниатюр)"""
+        thumbnails_dir = get_thumbnails_dir().resolve()
+        files = []
+        for root in (Path(settings.MEDIA_ROOT), Path(settings.BASE_DIR) / 'static' / 'img'):
+            for path in sorted(root.rglob('*')):
+                if path.suffix.lower() in IMAGE_EXTENSIONS and path.is_file() and path.stat().st_size:
+                    if thumbnails_dir not in path.resolve().parents:
+                        files.append(str(path))
+        return files[:limit] if limit else files
+
+    def run(self, func, items, workers, chunk_size):
+        started = time.perf_counter()
+        results = []
+        errors = 0
+        for item, result, error in run_parallel(func, items, workers, chunk_size):
+            if error:
+                errors += 1
+            else:
+                results.append((item, result))
+        return time.perf_counter() - started, results, errors
+
+    def report(self, title, count, timings):
+        self.stdout.write(f'\n{title} ({count} файлов):')
+        self.stdout.write(f'{"процессов":>10} {"время, с":>10} {"файлов/с":>10} {"ускорение":>10} {"эффективность":>14}')
+        base = timings[0][1] * timings[0][0]
+        for workers, seconds in timings:
+            speedup = base / seconds
+            self.stdout.write(
+                f'{workers:>10} {seconds:>10.2f} {count / seconds:>10.0f} '
+                f'{speedup:>9.2f}x {speedup / workers * 100:>13.0f}%'
+            )
+
+    def handle(self, *args, **options):
+        cpu_count = os.cpu_count() or 1
+        workers_list = options['workers']
+        if not workers_list:
+            workers_list = [1]
+            while workers_list[-1] * 2 <= cpu_count:
+                workers_list.append(workers_list[-1] * 2)
+            if workers_list[-1] != cpu_count:
+                workers_list.append(cpu_count)
+        files = self.corpus(options['limit'])
+        self.stdout.write(f'Корпус: {len(files)} изображений, ядер: {cpu_count}')
+        if not files:
+            return
+
+        timings = []
+        fingerprints = []
+        for workers in workers_list:
+            seconds, results, errors = self.run(fingerprint, files, workers, options['chunk_size'])
+            timings.append((workers, seconds))
+            fingerprints = results
+        self.report('Хэширование sha256', len(files), timings)
+
+        if options['skip_thumbnails']:
+            return
+        # Один исходник на sha256 - как в generate_thumbnails
+        jobs = list({entry[2]: (path, entry[2], tuple(PRESETS)) for path, entry in fingerprints}.values())
+        timings = []
+        for workers in workers_list:
+            with tempfile.TemporaryDirectory() as output_dir:
+                seconds, results, errors = self.run(
+                    thumbnail_task, [job + (output_dir, False) for job in jobs], workers, options['chunk_size'],
+                )
+            timings.append((workers, seconds))
+        self.report(f'Миниатюры {", ".join(PRESETS)} (WebP + JPEG, 1x/2x)', len(jobs), timings)
+        if errors:
+            self.stdout.write(self.style.WARNING(f'Не удалось обработать: {errors}'))
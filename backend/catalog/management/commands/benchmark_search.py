@@ -0,0 +1,75 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.search import SearchIndex
+
+PREFIXES = ['ЗАН', 'НБЕ', 'ТМЛ', 'ПК', 'ГМ', 'СИП', 'ВВГнг', 'КВТ', 'DKC', 'ШВВП', 'НИ', 'ТА']
+PATHS = [
+    'Кабельная арматура / Наконечники / Наконечники медные',
+    'Кабельная арматура / Гильзы / Гильзы алюминиевые',
+    'Электромонтажный инструмент / Пресс-клещи / Гидравлические',
+    'Крепёж / Анкеры / Анкерные зажимы',
+]
+TARGET_P99_MS = 5
+
+
+class Command(BaseCommand):
+    help = 'Замеряет скорость поиска (catalog.search) на синтетическом каталоге'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000, help='Размер синтетического каталога')
+        parser.add_argument('--queries', type=int, default=5_000, help='Количество поисковых запросов')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        titles = []
+        index = SearchIndex()
+        started = time.perf_counter()
+        for doc_id in range(options['products']):
+            title = f'{rng.choice(PREFIXES)}-{rng.randint(1, 2500)}{rng.choice(["", "(Л)", " У3", "/35"])}'
+            titles.append(title)
+            index.add(doc_id, {
+                'sku': str(100000 + doc_id),
+                'title': title,
+                'wire_section': f'{rng.choice([1.5, 2.5, 4, 6, 10, 16, 25, 35, 50, 70, 95])}-{rng.choice([120, 150, 185, 240])}',
+                'load_limit': f'{rng.randint(1, 60)} кН',
+                'path': rng.choice(PATHS),
+            }, payload=doc_id)
+        build_seconds = time.perf_counter() - started
+        self.stdout.write(f'Индекс: {len(index)} товаров, {sum(map(len, index.tokens.values()))} токенов за {build_seconds:.1f} с')
+
+        queries = []
+        for _ in range(options['queries']):
+            title = rng.choice(titles)
+            kind = rng.random()
+            if kind < 0.4:
+                queries.append(title.lower())
+            elif kind < 0.7:
+                queries.append(title[:rng.randint(2, len(title))])
+            elif kind < 0.85:
+                queries.append(f'{title.split("-")[0]} {rng.randint(1, 25)}')
+            else:
+                queries.append(str(100000 + rng.randrange(options['products']))[:rng.randint(3, 6)])
+
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, limit=20)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+
+        def percentile(value):
+            return timings[min(len(timings) - 1, int(len(timings) * value))]
+
+        p99 = percentile(0.99)
+        self.stdout.write(
+            f'Запросов: {len(timings)}; p50 {percentile(0.5):.3f} мс, '
+            f'p95 {percentile(0.95):.3f} мс, p99 {p99:.3f} мс, max {timings[-1]:.3f} мс'
+        )
+        if p99 < TARGET_P99_MS:
+            self.stdout.write(self.style.SUCCESS(f'p99 < {TARGET_P99_MS} мс'))
+        else:
+            self.stdout.write(self.style.WARNING(f'p99 выше {TARGET_P99_MS} мс'))
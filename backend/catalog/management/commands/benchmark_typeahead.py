@@ -0,0 +1,63 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.typeahead import Typeahead
+
+PREFIXES = ['КА', 'ВС', 'ЗАН', 'НБЕ', 'ТМЛ', 'ПК', 'ГМ', 'СИП', 'КВТ', 'DKC', 'НИ', 'ТА']
+TARGET_P99_US = 50
+
+
+class Command(BaseCommand):
+    help = 'Замеряет скорость подсказок (catalog.typeahead) на синтетическом каталоге'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000, help='Размер синтетического каталога')
+        parser.add_argument('--queries', type=int, default=20_000, help='Количество запросов')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        items = []
+        popularity = {}
+        for doc_id in range(options['products']):
+            sku = str(100000 + doc_id)
+            title = f'{rng.choice(PREFIXES)}-{rng.randint(1, 2500)}{rng.choice(["", "(Л)", "/95", " У3"])}'
+            items.append((sku, title, doc_id))
+            if rng.random() < 0.2:
+                popularity[sku] = int(rng.paretovariate(1.2))
+
+        started = time.perf_counter()
+        typeahead = Typeahead(items, popularity)
+        build_seconds = time.perf_counter() - started
+        self.stdout.write(
+            f'Подсказки: {len(typeahead)} товаров, {len(typeahead.keys)} ключей, '
+            f'{len(typeahead.top)} префиксов в таблице за {build_seconds:.1f} с'
+        )
+
+        queries = []
+        for _ in range(options['queries']):
+            sku, title, doc_id = rng.choice(items)
+            value = title if rng.random() < 0.8 else sku
+            queries.append(value[:rng.randint(1, len(value))].lower())
+
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            typeahead.complete(query)
+            timings.append((time.perf_counter() - started) * 1_000_000)
+        timings.sort()
+
+        def percentile(value):
+            return timings[min(len(timings) - 1, int(len(timings) * value))]
+
+        p99 = percentile(0.99)
+        self.stdout.write(
+            f'Запросов: {len(timings)}; p50 {percentile(0.5):.1f} мкс, '
+            f'p95 {percentile(0.95):.1f} мкс, p99 {p99:.1f} мкс, max {timings[-1]:.1f} мкс'
+        )
+        if p99 < TARGET_P99_US:
+            self.stdout.write(self.style.SUCCESS(f'p99 < {TARGET_P99_US} мкс'))
+        else:
+            self.stdout.write(self.style.WARNING(f'p99 выше {TARGET_P99_US} мкс'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from catalog.image_manifest import get_manifest
+from catalog.image_pool import DEFAULT_CHUNK_SIZE, get_workers, progress_printer
+
+
+class Command(BaseCommand):
+    help = 'Собирает манифест изображений товаров (product id → URL изображения)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--if-stale',
+            action='store_true',
+            help='Пересобрать только при изменении папок с изображениями, иначе пересчитать записи с изменёнными файлами',
+        )
+        parser.add_argument('--workers', type=int, help='Число процессов (по умолчанию CATALOG_IMAGE_WORKERS или число ядер)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Товаров в одной задаче пула')
+
+    def handle(self, *args, **options):
+        manifest = get_manifest()
+        if options['if_stale'] and manifest.load() and not manifest.dirs_changed():
+            # Папки прежние: пересчитываются только записи с заменёнными или удалёнными файлами
+            count = manifest.refresh()
+            self.stdout.write(
+                f'Манифест актуален: {manifest.path} ({len(manifest.entries)} товаров, пересчитано {count})'
+            )
+            return
+        workers = get_workers(options['workers'])
+        count = manifest.build(
+            workers=workers,
+            chunk_size=options['chunk_size'],
+            progress=progress_printer('Товары', self.stderr),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Манифест изображений собран: {manifest.path} ({count} товаров, {workers} процессов)'
+        ))
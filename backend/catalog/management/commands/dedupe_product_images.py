@@ -0,0 +1,135 @@
+import os
+from collections import defaultdict
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.fragments import products_changed
+from catalog.image_manifest import get_manifest
+from catalog.image_pool import DEFAULT_CHUNK_SIZE, get_workers, progress_printer, run_parallel
+from catalog.image_storage import content_name, get_name_index, is_content_name
+from catalog.image_sync import ImageSync, get_source_dir, get_target_dir
+from catalog.models import Product
+from catalog.thumbnails import fingerprint
+
+UPDATE_BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Переводит изображения товаров на хранение по содержимому: одинаковые файлы '
+        'схлопываются в один <sha256>.<расширение>, ссылки Product.image переписываются, '
+        'копия в static/img/products синхронизируется'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что изменится')
+        parser.add_argument('--workers', type=int, help='Число процессов (по умолчанию CATALOG_IMAGE_WORKERS или число ядер)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Файлов в одной задаче пула')
+        parser.add_argument(
+            '--no-sync', action='store_true',
+            help='Не обновлять копию в static/img/products (тогда до деплоя - sync_product_images)',
+        )
+
+    def handle(self, *args, **options):
+        storage = Product._meta.get_field('image').storage
+        upload_to = Product._meta.get_field('image').upload_to.strip('/')
+        location = Path(storage.location)
+        directory = location / upload_to
+        files = sorted(
+            str(path) for path in directory.rglob('*')
+            if path.is_file() and not path.name.endswith('.tmp') and not is_content_name(path.name)
+        ) if directory.exists() else []
+
+        # sha256 → пути файлов с таким содержимым
+        groups = defaultdict(list)
+        sizes = {}
+        for path, entry, error in run_parallel(
+            fingerprint, files, get_workers(options['workers']), options['chunk_size'],
+            progress_printer('Хэширование', self.stderr),
+        ):
+            if error:
+                self.stderr.write(self.style.WARNING(f'{path}: {error}'))
+                continue
+            size, mtime, sha = entry
+            groups[sha].append(path)
+            sizes[sha] = size
+
+        # Старое имя → имя по содержимому; у группы одно расширение - первого по алфавиту файла
+        names = {}
+        targets = {}
+        for sha, paths in groups.items():
+            paths.sort()
+            # Только готовые файлы: <sha>.<расширение>.<pid>.<поток>.tmp - незаконченная запись
+            existing = sorted(path for path in directory.glob(f'{sha}.*') if is_content_name(path.name))
+            if existing:
+                target = existing[0].relative_to(location).as_posix()
+            else:
+                target = content_name(upload_to, sha, paths[0])
+            targets[sha] = target
+            for path in paths:
+                names[Path(path).relative_to(location).as_posix()] = target
+
+        # Ссылки товаров: новые переименования и уже известные индексу (повторный запуск, другая база)
+        index = get_name_index()
+        index.load()
+        known = {**index.names, **names}
+        updates = []
+        section_ids = set()
+        for pk, image, section_id in Product.objects.exclude(image='').exclude(image__isnull=True).values_list(
+            'id', 'image', 'section_id',
+        ):
+            target = known.get(image)
+            if target and target != image:
+                updates.append(Product(pk=pk, image=target))
+                section_ids.add(section_id)
+
+        duplicates = len(files) - len(groups)
+        saved = sum(sizes[sha] * (len(paths) - 1) for sha, paths in groups.items())
+        self.stdout.write(
+            f'Файлов: {len(files)}, уникальных: {len(groups)}, дубликатов: {duplicates} '
+            f'({saved / 2**20:.1f} МБ), ссылок товаров: {len(updates)}'
+        )
+        if options['dry_run']:
+            return
+
+        # Сначала индекс: пока файлы переносятся, старые ссылки уже находят файл по содержимому
+        if names:
+            index.update(names)
+        for sha, paths in groups.items():
+            target_path = location / targets[sha]
+            for path in paths:
+                if not target_path.exists():
+                    os.replace(path, target_path)
+                else:
+                    os.remove(path)
+
+        with transaction.atomic():
+            Product.objects.bulk_update(updates, ['image'], batch_size=UPDATE_BATCH_SIZE)
+        # Production раздаёт изображения только из static: без копии новые имена вели бы на /media/
+        if options['no_sync']:
+            self.stderr.write(self.style.WARNING(
+                'Копия в static/img/products не обновлена: выполните sync_product_images до деплоя, '
+                'иначе переименованные изображения будут ссылаться на /media/'
+            ))
+        else:
+            report = ImageSync(get_source_dir(), get_target_dir()).run(
+                workers=get_workers(options['workers']),
+                chunk_size=options['chunk_size'],
+                progress=lambda label: progress_printer(label, self.stderr),
+            )
+            for error in report.errors:
+                self.stderr.write(self.style.WARNING(error))
+            self.stdout.write(
+                f'Копия в {get_target_dir()}: добавлено {len(report.added)}, обновлено {len(report.updated)}, '
+                f'удалено {len(report.deleted)}'
+            )
+        # bulk_update не отправляет сигналы: версии каталога и манифест обновляются здесь
+        if updates:
+            products_changed(section_ids)
+        get_manifest().build()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: удалено дубликатов {duplicates}, освобождено {saved / 2**20:.1f} МБ, '
+            f'обновлено товаров {len(updates)}. Индекс имён: {index.path}'
+        ))
@@ -0,0 +1,79 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from catalog.fragments import invalidate_all_fragments
+from catalog.image_manifest import KVT_IMAGES_DIR, STATIC_PRODUCTS_DIR
+from catalog.image_pool import DEFAULT_CHUNK_SIZE, get_workers, progress_printer
+from catalog.models import Product
+from catalog.thumbnails import PRESETS, ThumbnailStore, get_thumbnails_dir, get_thumbnails_url
+
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие миниатюры изображений товаров (WebP и JPEG, 1x и 2x) в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--preset', action='append', choices=sorted(PRESETS),
+            help='Только указанные размеры (можно повторять); по умолчанию все',
+        )
+        parser.add_argument('--force', action='store_true', help='Пересоздать миниатюры, даже если они есть')
+        parser.add_argument(
+            '--from-files', action='store_true',
+            help='Исходники - все изображения static-папок товаров, без базы (этап сборки до collectstatic)',
+        )
+        parser.add_argument('--workers', type=int, help='Число процессов (по умолчанию CATALOG_IMAGE_WORKERS или число ядер)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Изображений в одной задаче пула')
+
+    def static_urls(self):
+        """URL изображений из static/img/products и папки KVT - те же, что выдаёт resolve_image_url"""
+        static_dir = Path(settings.BASE_DIR) / 'static'
+        urls = []
+        for parts in (STATIC_PRODUCTS_DIR, KVT_IMAGES_DIR):
+            directory = Path(settings.BASE_DIR).joinpath(*parts)
+            if directory.is_dir():
+                urls += sorted(
+                    f'{settings.STATIC_URL}{path.relative_to(static_dir).as_posix()}'
+                    for path in directory.rglob('*')
+                    if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+                )
+        return urls
+
+    def handle(self, *args, **options):
+        store = ThumbnailStore(get_thumbnails_dir(), get_thumbnails_url())
+        # Индекс с прошлого (в том числе прерванного) запуска: готовое не пересчитывается
+        store.load()
+        if options['from_files']:
+            urls = self.static_urls()
+        else:
+            urls = [
+                product.image_url
+                for product in Product.objects.only('id', 'title', 'image', 'image_code').order_by('id')
+            ]
+        workers = get_workers(options['workers'])
+        stats = store.generate_all(
+            urls,
+            presets=options['preset'],
+            force=options['force'],
+            workers=workers,
+            chunk_size=options['chunk_size'],
+            progress=lambda label: progress_printer(label, self.stderr),
+        )
+        if stats['written'] and not options['from_files']:
+            # В карточках и модальных окнах появятся <picture>
+            invalidate_all_fragments()
+
+        for url, error in stats['errors']:
+            # Повреждённый или неподдерживаемый файл не останавливает остальные
+            self.stderr.write(self.style.WARNING(f'{url}: {error}'))
+        self.stdout.write(
+            f'Исходников: {stats["sources"]}; без локального файла: {stats["without_source"]}, '
+            f'хэшировано: {stats["hashed"]}, актуальны: {stats["up_to_date"]}, ошибок: {len(stats["errors"])}'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано файлов: {stats["written"]} в {store.root} ({workers} процессов)'
+        ))
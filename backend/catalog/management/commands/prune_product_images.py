@@ -0,0 +1,78 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from catalog.image_storage import get_name_index, is_content_name
+from catalog.models import Product
+
+# Файл моложе часа может принадлежать товару, сохранение которого ещё не зафиксировано
+DEFAULT_MIN_AGE = 60 * 60
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет изображения товаров с именем по содержимому (<sha256>.<расширение>), '
+        'на которые не ссылается ни один товар'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет удалено')
+        parser.add_argument(
+            '--min-age', type=int, default=DEFAULT_MIN_AGE,
+            help=f'Не трогать файлы моложе стольких секунд (по умолчанию {DEFAULT_MIN_AGE})',
+        )
+
+    def handle(self, *args, **options):
+        storage = Product._meta.get_field('image').storage
+        upload_to = Product._meta.get_field('image').upload_to.strip('/')
+        location = Path(storage.location)
+        directory = location / upload_to
+        if not directory.exists():
+            self.stdout.write(f'Папка {directory} не найдена')
+            return
+
+        # Ссылки товаров: имя по содержимому или старое имя, переведённое индексом
+        index = get_name_index()
+        index.load()
+        referenced = set()
+        for image in Product.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True):
+            referenced.add(image)
+            if image in index.names:
+                referenced.add(index.names[image])
+
+        deadline = time.time() - options['min_age']
+        unused = []
+        for path in sorted(directory.rglob('*')):
+            if not path.is_file() or not is_content_name(path.name):
+                continue
+            name = path.relative_to(location).as_posix()
+            stat = path.stat()
+            if name not in referenced and stat.st_mtime < deadline:
+                unused.append((name, path, stat.st_size))
+
+        if options['verbosity'] >= 2:
+            for name, path, size in unused:
+                self.stdout.write(f'- {name}')
+        if options['dry_run']:
+            total = sum(size for name, path, size in unused)
+            self.stdout.write(f'Пробный запуск: не используются {len(unused)} файлов ({total / 2**20:.1f} МБ)')
+            return
+
+        deleted = []
+        freed = 0
+        for name, path, size in unused:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.stderr.write(self.style.WARNING(f'{name}: {e}'))
+                continue
+            deleted.append(name)
+            freed += size
+        if deleted:
+            index.discard_targets(deleted)
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено неиспользуемых изображений: {len(deleted)} ({freed / 2**20:.1f} МБ)'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.tree import rebuild_tree, tree_problems
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает closure-таблицу дерева каталога (после loaddata или правок в обход моделей)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить, что дерево совпадает с категориями, подкатегориями и разделами',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            problems = tree_problems()
+            for problem in problems:
+                self.stdout.write(problem)
+            if problems:
+                raise CommandError(f'Дерево каталога расходится с моделями: {len(problems)}. Запустите rebuild_catalog_tree')
+            self.stdout.write(self.style.SUCCESS('Дерево каталога актуально'))
+            return
+        count = rebuild_tree()
+        self.stdout.write(self.style.SUCCESS(f'Дерево каталога пересобрано: {count} узлов'))
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.image_pool import DEFAULT_CHUNK_SIZE, get_workers, progress_printer
+from catalog.image_sync import SYNC_MODES, ImageSync, get_source_dir, get_target_dir
+
+
+class Command(BaseCommand):
+    help = (
+        'Синхронизирует изображения товаров media/products → static/img/products: '
+        'переносит только новые и изменённые файлы (по размеру, mtime и sha256)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=SYNC_MODES, default='copy', help='Способ переноса файлов (по умолчанию copy)')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать изменения')
+        parser.add_argument('--workers', type=int, help='Число процессов (по умолчанию CATALOG_IMAGE_WORKERS или число ядер)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Файлов в одной задаче пула')
+
+    def handle(self, *args, **options):
+        source, target = get_source_dir(), get_target_dir()
+        if not source.is_dir():
+            raise CommandError(f'Папка {source} не найдена')
+        started = time.perf_counter()
+        report = ImageSync(source, target, options['mode']).run(
+            workers=get_workers(options['workers']),
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+            progress=lambda label: progress_printer(label, self.stderr),
+        )
+        seconds = time.perf_counter() - started
+
+        # Построчный diff - с -v 2, иначе только итог
+        if options['verbosity'] >= 2:
+            for line in report.diff_lines():
+                self.stdout.write(line)
+        for error in report.errors:
+            self.stderr.write(self.style.WARNING(error))
+        modes = ', '.join(f'{mode}: {count}' for mode, count in sorted(report.modes.items()))
+        summary = (
+            f'{source} → {target}: добавлено {len(report.added)}, обновлено {len(report.updated)}, '
+            f'удалено {len(report.deleted)}, без изменений {report.unchanged + len(report.touched)}; '
+            f'{report.copied_bytes / 2**20:.1f} МБ{f" ({modes})" if modes else ""} за {seconds:.2f} с'
+        )
+        if options['dry_run']:
+            self.stdout.write(f'Пробный запуск, файлы не изменены. {summary}')
+        elif report.errors:
+            self.stdout.write(self.style.WARNING(f'{summary}; ошибок: {len(report.errors)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
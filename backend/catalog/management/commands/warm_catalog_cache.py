@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from catalog.fragments import warm_fragments
+
+
+class Command(BaseCommand):
+    help = 'Заранее рендерит HTML-фрагменты карточек разделов каталога в кэш'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1, help='Сколько страниц каждого раздела рендерить')
+        parser.add_argument('--limit', type=int, default=9, help='Товаров на странице')
+
+    def handle(self, *args, **options):
+        count = warm_fragments(pages=options['pages'], limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Фрагментов в кэше: {count}'))
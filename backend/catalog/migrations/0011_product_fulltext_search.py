@@ -0,0 +1,119 @@
+from django.db import migrations
+
+# Копия SQL из catalog.fts на момент миграции: миграция не должна зависеть от текущего
+# кода модуля. Актуальные триггеры поддерживает catalog.fts.ensure_search_schema (post_migrate)
+PRODUCT_TABLE = 'catalog_product'
+FTS_TABLE = 'catalog_product_fts'
+SEARCH_VECTOR_INDEX = 'catalog_product_search_vector_idx'
+FTS_COLUMNS = 'title, joined, sku, wire_section, load_limit, description'
+LOOKALIKES = {
+    'A': 'А', 'B': 'В', 'C': 'С', 'E': 'Е', 'H': 'Н', 'K': 'К', 'M': 'М',
+    'O': 'О', 'P': 'Р', 'T': 'Т', 'X': 'Х', 'Y': 'У', 'Ё': 'Е',
+}
+
+
+def _postgres_fold(expression):
+    latin = ''.join(LOOKALIKES) + ''.join(LOOKALIKES).lower()
+    cyrillic = ''.join(LOOKALIKES.values()) + ''.join(LOOKALIKES.values()).lower()
+    return f"translate(coalesce({expression}, ''), '{latin}', '{cyrillic}')"
+
+
+def _sqlite_fold(expression):
+    expression = f"upper(coalesce({expression}, ''))"
+    for latin, cyrillic in LOOKALIKES.items():
+        expression = f"replace({expression}, '{latin}', '{cyrillic}')"
+    return f"replace({expression}, 'ё', 'е')"
+
+
+def _joined(expression):
+    return f"replace(replace({expression}, '-', ''), '_', '')"
+
+
+def _sqlite_values(row):
+    return ', '.join([
+        f'{row}.id',
+        _sqlite_fold(f'{row}.title'),
+        _sqlite_fold(_joined(f"{row}.title || ' ' || {row}.sku")),
+        _sqlite_fold(f'{row}.sku'),
+        _sqlite_fold(f'{row}.wire_section'),
+        _sqlite_fold(f'{row}.load_limit'),
+        _sqlite_fold(f"{row}.short_description || ' ' || {row}.full_description"),
+    ])
+
+
+def _postgres_vector(row):
+    return (
+        f"setweight(to_tsvector('simple', {_postgres_fold(f'{row}title')} || ' ' || "
+        f"{_postgres_fold(_joined(f'{row}title'))} || ' ' || {_postgres_fold(f'{row}sku')} || ' ' || "
+        f"{_postgres_fold(_joined(f'{row}sku'))}), 'A') || "
+        f"setweight(to_tsvector('simple', {_postgres_fold(f'{row}wire_section')} || ' ' || "
+        f"{_postgres_fold(f'{row}load_limit')}), 'B') || "
+        f"setweight(to_tsvector('simple', {_postgres_fold(f'{row}short_description')} || ' ' || "
+        f"{_postgres_fold(f'{row}full_description')}), 'D')"
+    )
+
+
+def create_search_schema(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = [
+            f'ALTER TABLE {PRODUCT_TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector',
+            f'CREATE OR REPLACE FUNCTION {PRODUCT_TABLE}_search_vector_update() RETURNS trigger AS $$ '
+            f'BEGIN NEW.search_vector := {_postgres_vector("NEW.")}; RETURN NEW; END '
+            f'$$ LANGUAGE plpgsql',
+            f'DROP TRIGGER IF EXISTS {PRODUCT_TABLE}_search_vector ON {PRODUCT_TABLE}',
+            f'CREATE TRIGGER {PRODUCT_TABLE}_search_vector BEFORE INSERT OR UPDATE ON {PRODUCT_TABLE} '
+            f'FOR EACH ROW EXECUTE FUNCTION {PRODUCT_TABLE}_search_vector_update()',
+            f'UPDATE {PRODUCT_TABLE} SET search_vector = {_postgres_vector("")}',
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_VECTOR_INDEX} ON {PRODUCT_TABLE} USING GIN (search_vector)',
+        ]
+    elif vendor == 'sqlite':
+        statements = [
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            f"{FTS_COLUMNS}, tokenize = 'unicode61 remove_diacritics 2')",
+            f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {PRODUCT_TABLE} BEGIN '
+            f'INSERT INTO {FTS_TABLE} (rowid, {FTS_COLUMNS}) VALUES ({_sqlite_values("new")}); END',
+            f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {PRODUCT_TABLE} BEGIN '
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END',
+            f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON {PRODUCT_TABLE} BEGIN '
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = old.id; '
+            f'INSERT INTO {FTS_TABLE} (rowid, {FTS_COLUMNS}) VALUES ({_sqlite_values("new")}); END',
+            f'DELETE FROM {FTS_TABLE}',
+            f'INSERT INTO {FTS_TABLE} (rowid, {FTS_COLUMNS}) '
+            f'SELECT {_sqlite_values(PRODUCT_TABLE)} FROM {PRODUCT_TABLE}',
+        ]
+    else:
+        # Другие базы: поиск в памяти (catalog.search)
+        return
+    for statement in statements:
+        schema_editor.execute(statement, params=None)
+
+
+def drop_search_schema(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = [
+            f'DROP TRIGGER IF EXISTS {PRODUCT_TABLE}_search_vector ON {PRODUCT_TABLE}',
+            f'DROP FUNCTION IF EXISTS {PRODUCT_TABLE}_search_vector_update()',
+            f'DROP INDEX IF EXISTS {SEARCH_VECTOR_INDEX}',
+            f'ALTER TABLE {PRODUCT_TABLE} DROP COLUMN IF EXISTS search_vector',
+        ]
+    elif vendor == 'sqlite':
+        statements = [f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}' for suffix in ('ai', 'ad', 'au')]
+        statements.append(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement, params=None)
+
+
+class Migration(migrations.Migration):
+    """Полнотекстовый поиск товаров: tsvector + GIN (PostgreSQL) или FTS5 с триггерами (SQLite)"""
+
+    dependencies = [
+        ('catalog', '0010_remove_product_subsection_product_section'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_schema, drop_search_schema),
+    ]
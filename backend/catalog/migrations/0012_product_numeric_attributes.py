@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:33
+
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+# Копия разбора из catalog.attributes на момент миграции: миграция не должна зависеть
+# от текущего кода модуля. Актуальные значения пересчитывает команда backfill_product_attributes
+KGF_IN_KN = Decimal('0.00980665')
+LOAD_UNITS = (
+    (re.compile(r'кн|kn'), Decimal('1')),
+    (re.compile(r'мн|mn'), Decimal('1000')),
+    (re.compile(r'кгс|кг|kgf|kg'), KGF_IN_KN),
+    (re.compile(r'тс|т\b|t\b'), KGF_IN_KN * 1000),
+    (re.compile(r'н\b|n\b'), Decimal('0.001')),
+)
+NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)?')
+AREA_UNIT_RE = re.compile(r'(?:мм|mm)\s*(?:2|²|\^2)|кв\.?\s*мм')
+CORES_RE = re.compile(r'\d+\s*[xх×*]\s*(?=\d)')
+CENTS = Decimal('0.01')
+WIRE_SECTION_LIMIT = Decimal(10) ** 6
+LOAD_LIMIT_LIMIT = Decimal(10) ** 8
+ATTRIBUTE_FIELDS = ('wire_section_min', 'wire_section_max', 'load_limit_kn')
+BATCH_SIZE = 1000
+
+
+def _numbers(text):
+    numbers = []
+    for match in NUMBER_RE.findall(text):
+        try:
+            numbers.append(Decimal(match.replace(',', '.')).quantize(CENTS))
+        except InvalidOperation:
+            continue
+    return numbers
+
+
+def _wire_section(value):
+    text = AREA_UNIT_RE.sub(' ', str(value or '').lower())
+    numbers = _numbers(CORES_RE.sub('', text))
+    if not numbers or max(numbers) >= WIRE_SECTION_LIMIT:
+        return None, None
+    return min(numbers), max(numbers)
+
+
+def _load_limit(value):
+    text = str(value or '').lower()
+    numbers = _numbers(text)
+    if not numbers:
+        return None
+    multiplier = Decimal('1')
+    for pattern, unit_multiplier in LOAD_UNITS:
+        if pattern.search(text):
+            multiplier = unit_multiplier
+            break
+    load = max(numbers) * multiplier
+    if load >= LOAD_LIMIT_LIMIT or load.quantize(CENTS) >= LOAD_LIMIT_LIMIT:
+        return None
+    return load.quantize(CENTS)
+
+
+def backfill(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    changed = []
+    queryset = Product.objects.only('id', 'wire_section', 'load_limit').order_by('id')
+    for product in queryset.iterator(chunk_size=BATCH_SIZE):
+        product.wire_section_min, product.wire_section_max = _wire_section(product.wire_section)
+        product.load_limit_kn = _load_limit(product.load_limit)
+        if product.wire_section_min is None and product.load_limit_kn is None:
+            continue
+        changed.append(product)
+        if len(changed) >= BATCH_SIZE:
+            Product.objects.bulk_update(changed, ATTRIBUTE_FIELDS)
+            changed = []
+    if changed:
+        Product.objects.bulk_update(changed, ATTRIBUTE_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_product_fulltext_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='load_limit_kn',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Предельная нагрузка, кН'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='wire_section_max',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, editable=False, max_digits=8, null=True, verbose_name='Сечение провода до, мм²'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='wire_section_min',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, editable=False, max_digits=8, null=True, verbose_name='Сечение провода от, мм²'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    Section = apps.get_model('catalog', 'Section')
+    Product = apps.get_model('catalog', 'Product')
+    for section_id, subcategory_id, category_id in Section.objects.values_list(
+        'id', 'subcategory_id', 'subcategory__category_id',
+    ):
+        Product.objects.filter(section_id=section_id).update(subcategory_id=subcategory_id, category_id=category_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_product_numeric_attributes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='category',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='catalog.category', verbose_name='Категория'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='subcategory',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='catalog.subcategory', verbose_name='Подкатегория'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'is_active', 'order', 'title'], name='product_category_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['subcategory', 'is_active', 'order', 'title'], name='product_subcat_listing_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
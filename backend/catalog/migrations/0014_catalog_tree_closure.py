@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Копия catalog.tree.rebuild_tree на момент миграции: только исторические модели,
+# без зависимости от текущего кода модуля. Модель → (уровень, поле родителя)
+TREE_MODELS = {
+    'Category': (1, None),
+    'Subcategory': (2, 'category'),
+    'Section': (3, 'subcategory'),
+    'Subsection': (4, 'section'),
+}
+NODE_FIELDS = ('title', 'slug', 'description', 'is_active', 'order')
+
+
+def build_tree(apps, schema_editor):
+    CatalogNode = apps.get_model('catalog', 'CatalogNode')
+    CatalogTreePath = apps.get_model('catalog', 'CatalogTreePath')
+    nodes = {}
+    ancestors = {}
+    for model_name, (level, parent_field) in TREE_MODELS.items():
+        objects = list(apps.get_model('catalog', model_name).objects.all())
+        created = CatalogNode.objects.bulk_create([
+            CatalogNode(
+                level=level,
+                object_id=instance.pk,
+                parent_id=nodes[(level - 1, getattr(instance, f'{parent_field}_id'))] if parent_field else None,
+                **{name: getattr(instance, name) for name in NODE_FIELDS},
+            )
+            for instance in objects
+        ])
+        paths = []
+        for instance, node in zip(objects, created):
+            nodes[(level, instance.pk)] = node.pk
+            node_ancestors = [(node.pk, 0)]
+            if node.parent_id:
+                node_ancestors += [(ancestor_id, depth + 1) for ancestor_id, depth in ancestors[node.parent_id]]
+            ancestors[node.pk] = node_ancestors
+            paths += [
+                CatalogTreePath(ancestor_id=ancestor_id, descendant_id=node.pk, depth=depth)
+                for ancestor_id, depth in node_ancestors
+            ]
+        CatalogTreePath.objects.bulk_create(paths, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_product_tree_denormalization'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveSmallIntegerField(choices=[(1, 'Категория'), (2, 'Подкатегория'), (3, 'Раздел'), (4, 'Товарная группа')], verbose_name='Уровень')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='ID объекта')),
+                ('title', models.CharField(max_length=255, verbose_name='Название')),
+                ('slug', models.SlugField(max_length=255, verbose_name='URL-адрес')),
+                ('description', models.TextField(blank=True, verbose_name='Описание')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('order', models.PositiveIntegerField(default=0, verbose_name='Порядок отображения')),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='catalog.catalognode', verbose_name='Родитель')),
+            ],
+            options={
+                'verbose_name': 'Узел каталога',
+                'verbose_name_plural': 'Узлы каталога',
+                'ordering': ['level', 'order', 'title'],
+                'unique_together': {('level', 'object_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CatalogTreePath',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField(verbose_name='Глубина')),
+                ('ancestor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='descendant_paths', to='catalog.catalognode', verbose_name='Предок')),
+                ('descendant', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_paths', to='catalog.catalognode', verbose_name='Потомок')),
+            ],
+            options={
+                'verbose_name': 'Путь в дереве каталога',
+                'verbose_name_plural': 'Пути в дереве каталога',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='catalog_tree_descendant_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_tree, migrations.RunPython.noop),
+    ]
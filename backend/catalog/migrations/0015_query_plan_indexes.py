@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_catalog_tree_closure'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='section',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='catalog.section', verbose_name='Раздел'),
+        ),
+        migrations.AddIndex(
+            model_name='catalognode',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['level', 'order', 'title'], name='catalog_node_active_menu_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['processed', '-created_at', '-id'], name='lead_processed_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['product_sku', 'order'], name='orderitem_sku_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['section', 'is_active', 'order', 'title'], name='product_section_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['section', 'order', 'title', 'id'], name='product_active_section_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['order', 'title', 'id'], name='product_active_order_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:53
+
+import catalog.image_storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0015_query_plan_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=catalog.image_storage.get_product_image_storage, upload_to='products/', verbose_name='Изображение'),
+        ),
+    ]
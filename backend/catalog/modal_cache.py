@@ -0,0 +1,67 @@
+"""
+Кэш отрендеренных модальных окон товаров (catalog/product_detail.html).
+
+Ключ - SKU + updated_at товара + поколение фрагментов (меняется после пересборки
+манифеста изображений), поэтому правка товара сама делает старую запись
+недостижимой. Перед общим кэшем Django стоит небольшой LRU в памяти процесса:
+популярные товары открываются тысячи раз в день и отдаются без обращения к кэшу.
+"""
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .fragments import get_fragments_generation
+from .lru import LRUCache
+
+MODAL_TIMEOUT = 60 * 60 * 24
+MODAL_KEY = 'catalog:modal:{}'
+
+_local = LRUCache(getattr(settings, 'CATALOG_MODAL_LRU_SIZE', 512))
+_stats = {'shared_hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _modal_key(product):
+    raw = f'{product.sku}:{product.updated_at.timestamp()}:{get_fragments_generation()}'
+    return MODAL_KEY.format(hashlib.md5(raw.encode('utf-8')).hexdigest())
+
+
+def _full_product(product):
+    """Модель Product для карточки из снимка: окну нужно полное описание"""
+    from .models import Product
+
+    if isinstance(product, Product):
+        return product
+    return Product.objects.filter(pk=product.pk).first() or product
+
+
+def render_product_modal(product):
+    """HTML модального окна товара: LRU процесса → общий кэш → рендер шаблона"""
+    key = _modal_key(product)
+    html = _local.get(key)
+    if html is not None:
+        return html
+    html = cache.get(key)
+    with _stats_lock:
+        _stats['shared_hits' if html is not None else 'misses'] += 1
+    if html is None:
+        html = render_to_string('catalog/product_detail.html', {'product': _full_product(product)})
+        cache.set(key, html, MODAL_TIMEOUT)
+    _local.set(key, html)
+    return html
+
+
+def get_modal_cache_stats():
+    """Счётчики попаданий текущего процесса"""
+    local = _local.stats()
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        'local_hits': local['hits'],
+        **stats,
+        'local_size': local['size'],
+        'local_maxsize': local['maxsize'],
+    }
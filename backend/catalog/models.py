@@ -1,6 +1,10 @@
 from decimal import Decimal
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Q
+
+from .attributes import parsed_attributes
+from .image_storage import get_product_image_storage
 
 
 class TimestampedModel(models.Model):
@@ -51,6 +55,22 @@ class Subcategory(TimestampedModel):
     def __str__(self) -> str:
         return f'{self.category.title} → {self.title}'
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Подкатегорию могли перенести в другую категорию
+            Product.objects.filter(subcategory=self).exclude(category_id=self.category_id).update(
+                category_id=self.category_id,
+            )
+
+
+class SectionQuerySet(models.QuerySet):
+    def with_products_count(self):
+        """Добавляет active_products_count одним агрегирующим запросом"""
+        return self.annotate(
+            active_products_count=Count('products', filter=Q(products__is_active=True)),
+        )
+
 
 class Section(TimestampedModel):
     """Раздел - третий уровень"""
@@ -66,6 +86,8 @@ class Section(TimestampedModel):
     is_active = models.BooleanField('Активна', default=True)
     order = models.PositiveIntegerField('Порядок отображения', default=0, help_text='Порядок отображения')
 
+    objects = SectionQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Раздел'
         verbose_name_plural = 'Разделы'
@@ -74,9 +96,22 @@ class Section(TimestampedModel):
 
     def __str__(self) -> str:
         return f'{self.subcategory.category.title} → {self.subcategory.title} → {self.title}'
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Раздел могли перенести в другую подкатегорию
+            category_id = Subcategory.objects.filter(pk=self.subcategory_id).values_list('category_id', flat=True).first()
+            Product.objects.filter(section=self).exclude(subcategory_id=self.subcategory_id, category_id=category_id).update(
+                subcategory_id=self.subcategory_id,
+                category_id=category_id,
+            )
     
     def get_products_count(self):
         """Возвращает количество активных товаров в разделе"""
+        # Если queryset построен через with_products_count(), обходимся без запроса
+        if hasattr(self, 'active_products_count'):
+            return self.active_products_count
         return self.products.filter(is_active=True).count()
 
 
@@ -104,15 +139,121 @@ class Subsection(TimestampedModel):
         return f'{self.section.subcategory.category.title} → {self.section.subcategory.title} → {self.section.title} → {self.title}'
 
 
+class CatalogNode(models.Model):
+    """Узел дерева каталога: копия категории, подкатегории, раздела или товарной группы.
+
+    Все четыре уровня в одной таблице, чтобы дерево, меню и хлебные крошки читались
+    одним запросом. Поддерживается сигналами (catalog.tree), вручную не редактируется.
+    """
+    class Level(models.IntegerChoices):
+        CATEGORY = 1, 'Категория'
+        SUBCATEGORY = 2, 'Подкатегория'
+        SECTION = 3, 'Раздел'
+        SUBSECTION = 4, 'Товарная группа'
+
+    level = models.PositiveSmallIntegerField('Уровень', choices=Level.choices)
+    object_id = models.PositiveBigIntegerField('ID объекта')
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        related_name='children',
+        null=True,
+        blank=True,
+        verbose_name='Родитель',
+    )
+    title = models.CharField('Название', max_length=255)
+    slug = models.SlugField('URL-адрес', max_length=255)
+    description = models.TextField('Описание', blank=True)
+    is_active = models.BooleanField('Активен', default=True)
+    order = models.PositiveIntegerField('Порядок отображения', default=0)
+
+    class Meta:
+        verbose_name = 'Узел каталога'
+        verbose_name_plural = 'Узлы каталога'
+        ordering = ['level', 'order', 'title']
+        unique_together = [['level', 'object_id']]
+        indexes = [
+            # Меню каталога: активные узлы в порядке отображения
+            models.Index(
+                fields=['level', 'order', 'title'],
+                condition=models.Q(is_active=True),
+                name='catalog_node_active_menu_idx',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.get_level_display()}: {self.title}'
+
+
+class CatalogTreePath(models.Model):
+    """Closure-таблица: строка на каждую пару предок - потомок (и узел сам себе, depth = 0)"""
+    # Индексы FK заменяют составные: (ancestor, descendant) и (descendant, depth)
+    ancestor = models.ForeignKey(
+        CatalogNode, on_delete=models.CASCADE, related_name='descendant_paths', db_index=False, verbose_name='Предок',
+    )
+    descendant = models.ForeignKey(
+        CatalogNode, on_delete=models.CASCADE, related_name='ancestor_paths', db_index=False, verbose_name='Потомок',
+    )
+    depth = models.PositiveSmallIntegerField('Глубина')
+
+    class Meta:
+        verbose_name = 'Путь в дереве каталога'
+        verbose_name_plural = 'Пути в дереве каталога'
+        unique_together = [['ancestor', 'descendant']]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='catalog_tree_descendant_idx'),
+        ]
+
+
+class ProductQuerySet(models.QuerySet):
+    def for_wire_section(self, mm2):
+        """Товары, подходящие для провода сечением mm2 мм² (индексы по числовым колонкам)"""
+        return self.filter(wire_section_min__lte=mm2, wire_section_max__gte=mm2)
+
+    def with_load_limit(self, min_kn=None, max_kn=None):
+        """Товары с предельной нагрузкой в диапазоне, кН"""
+        queryset = self
+        if min_kn is not None:
+            queryset = queryset.filter(load_limit_kn__gte=min_kn)
+        if max_kn is not None:
+            queryset = queryset.filter(load_limit_kn__lte=max_kn)
+        return queryset
+
+
 class Product(TimestampedModel):
+    # Отдельный индекс не нужен: section - первая колонка product_section_listing_idx
     section = models.ForeignKey(
         Section,
         on_delete=models.SET_NULL,
         related_name='products',
         null=True,
         blank=True,
+        db_index=False,
         verbose_name='Раздел',
     )
+    # Денормализация пути раздела: товары поддерева выбираются без join'ов.
+    # Поддерживается Product.save(), Section.save() и Subcategory.save();
+    # отдельные индексы не нужны - их заменяют составные индексы из Meta
+    subcategory = models.ForeignKey(
+        Subcategory,
+        on_delete=models.SET_NULL,
+        related_name='products',
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=False,
+        verbose_name='Подкатегория',
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        related_name='products',
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=False,
+        verbose_name='Категория',
+    )
     title = models.CharField('Название', max_length=255)
     slug = models.SlugField('URL-адрес', unique=True, max_length=255)
     sku = models.CharField('Маркировка (SKU)', max_length=128, help_text='Маркировка', unique=True)
@@ -120,20 +261,45 @@ class Product(TimestampedModel):
     full_description = models.TextField('Полное описание', blank=True)
     price = models.DecimalField('Цена', max_digits=12, decimal_places=2, default=0)
     stock = models.PositiveIntegerField('Остаток на складе', default=0)
-    image = models.ImageField('Изображение', upload_to='products/', blank=True, null=True)
+    image = models.ImageField(
+        'Изображение', upload_to='products/', storage=get_product_image_storage, blank=True, null=True,
+    )
     is_active = models.BooleanField('Активен', default=True)
     unit = models.CharField('Единица измерения', max_length=32, blank=True)
     price_special = models.DecimalField('Специальная цена', max_digits=12, decimal_places=2, null=True, blank=True)
     price_retail = models.DecimalField('Розничная цена', max_digits=12, decimal_places=2, null=True, blank=True)
     wire_section = models.CharField('Сечение провода', max_length=64, blank=True)
     load_limit = models.CharField('Предельная нагрузка', max_length=64, blank=True)
+    # Заполняются из wire_section и load_limit при сохранении (catalog.attributes)
+    wire_section_min = models.DecimalField('Сечение провода от, мм²', max_digits=8, decimal_places=2, null=True, blank=True, editable=False, db_index=True)
+    wire_section_max = models.DecimalField('Сечение провода до, мм²', max_digits=8, decimal_places=2, null=True, blank=True, editable=False, db_index=True)
+    load_limit_kn = models.DecimalField('Предельная нагрузка, кН', max_digits=10, decimal_places=2, null=True, blank=True, editable=False, db_index=True)
     image_code = models.CharField('Код изображения', max_length=128, blank=True, help_text='Код для загрузки изображения с оригинального сайта')
     order = models.PositiveIntegerField('Порядок отображения', default=0)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
         ordering = ['order', 'title']
+        indexes = [
+            models.Index(fields=['category', 'is_active', 'order', 'title'], name='product_category_listing_idx'),
+            models.Index(fields=['subcategory', 'is_active', 'order', 'title'], name='product_subcat_listing_idx'),
+            models.Index(fields=['section', 'is_active', 'order', 'title'], name='product_section_listing_idx'),
+            # Частичные индексы под WHERE is_active: хранят только активные товары, а SQLite
+            # не использует колонку is_active составного индекса для условия без сравнения
+            models.Index(
+                fields=['section', 'order', 'title', 'id'],
+                condition=models.Q(is_active=True),
+                name='product_active_section_idx',
+            ),
+            models.Index(
+                fields=['order', 'title', 'id'],
+                condition=models.Q(is_active=True),
+                name='product_active_order_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.title
@@ -148,143 +314,47 @@ class Product(TimestampedModel):
 
     @property
     def image_url(self):
-        if self.image:
-            # Проверяем, есть ли файл в static (для Railway)
-            import os
-            from pathlib import Path
-            from django.conf import settings
-            
-            # Пробуем найти в static/img/products
-            image_name = os.path.basename(self.image.name)
-            static_products_dir = Path(settings.BASE_DIR) / 'static' / 'img' / 'products'
-            
-            # Пробуем точное совпадение
-            static_image_path = static_products_dir / image_name
-            if static_image_path.exists():
-                return f'/static/img/products/{image_name}'
-            
-            # Пробуем варианты без суффикса (например, CA1500_TSni0GL.jpg -> CA1500.jpg)
-            if '_' in image_name:
-                base_name = image_name.split('_')[0]
-                for ext in ['.jpg', '.jpeg', '.png']:
-                    variant_path = static_products_dir / f'{base_name}{ext}'
-                    if variant_path.exists():
-                        return f'/static/img/products/{base_name}{ext}'
-            
-            # Если нет в static, используем media (для локальной разработки)
-            return self.image.url
-        if self.image_code:
-            # Игнорируем product-placeholder.png
-            if 'product-placeholder.png' in self.image_code:
-                # Пропускаем и переходим к следующей проверке
-                pass
-            # Проверяем, что image_code не является полным URL
-            elif self.image_code.startswith('http'):
-                # Если это полный URL, используем его напрямую
-                return self.image_code
-            # Если это путь к статическому файлу (начинается с /static/)
-            elif self.image_code.startswith('/static/'):
-                # Проверяем, что это не product-placeholder.png
-                if 'product-placeholder.png' not in self.image_code:
-                    return self.image_code
-            # Если это просто код - пробуем найти в static
-            else:
-                # Сначала пробуем найти в static/img/products
-                import os
-                from pathlib import Path
-                from django.conf import settings
-                
-                static_products_dir = Path(settings.BASE_DIR) / 'static' / 'img' / 'products'
-                # Пробуем разные варианты имени файла
-                code_variants = [
-                    f'{self.image_code}.jpg',
-                    f'{self.image_code}.png',
-                    f'{self.image_code}.jpeg',
-                ]
-                
-                for variant in code_variants:
-                    variant_path = static_products_dir / variant
-                    if variant_path.exists():
-                        return f'/static/img/products/{variant}'
-                
-                # Если не найдено в static, возвращаем старый путь (для обратной совместимости)
-                return f'/upload/resize_cache/iblock/{self.image_code}/310_310_2/{self.image_code}.png'
-        
-        # Пробуем найти изображение в папке elektrotehnicheskij-zavod-kvt по названию товара (title)
-        # ИСПРАВЛЕНИЕ: Ищем по title, а не по SKU, потому что SKU - это числовой код,
-        # а имена файлов соответствуют обозначениям товаров (названиям)
-        if self.title:
-            import os
-            from pathlib import Path
-            from django.conf import settings
-            
-            # Нормализуем название товара для поиска файла
-            import re
-            
-            # Убираем лишние символы и пробелы, переводим в верхний регистр
-            title_clean = re.sub(r'[^\w\-/]', '', str(self.title).upper().strip())
-            normalized_title = re.sub(r'\s+', '', title_clean)
-            
-            # Путь к папке с изображениями
-            images_dir = Path(settings.BASE_DIR) / 'static' / 'img' / 'elektrotehnicheskij-zavod-kvt'
-            
-            if images_dir.exists():
-                # Ищем файл по точному совпадению
-                for ext in ['.jpg', '.jpeg', '.png']:
-                    # Пробуем разные варианты имени файла
-                    variants = [
-                        normalized_title + ext,
-                        normalized_title.replace('/', '_') + ext,
-                        normalized_title.replace('-', '_') + ext,
-                        title_clean + ext,
-                        title_clean.replace('/', '_') + ext,
-                        title_clean.replace('-', '_') + ext,
-                    ]
-                    
-                    for variant in variants:
-                        img_path = images_dir / variant
-                        if img_path.exists():
-                            return f'/static/img/elektrotehnicheskij-zavod-kvt/{variant}'
-                
-                # Пробуем найти по частичному совпадению (более гибкий поиск)
-                title_variants = [
-                    normalized_title,
-                    normalized_title.replace('/', '_').replace('-', '_'),
-                    title_clean,
-                    title_clean.replace('/', '_').replace('-', '_'),
-                ]
-                
-                for img_file in list(images_dir.glob('*.jpg')) + list(images_dir.glob('*.png')) + list(images_dir.glob('*.jpeg')):
-                    img_name_no_ext = os.path.splitext(img_file.name)[0]
-                    img_name_normalized = re.sub(r'[^\w\-/]', '', img_name_no_ext.upper()).replace(' ', '').replace('/', '_').replace('-', '_')
-                    
-                    # Проверяем все варианты названия товара
-                    for title_variant in title_variants:
-                        title_variant_clean = title_variant.replace('/', '_').replace('-', '_')
-                        
-                        # Точное совпадение
-                        if title_variant_clean == img_name_normalized:
-                            return f'/static/img/elektrotehnicheskij-zavod-kvt/{img_file.name}'
-                        
-                        # Частичное совпадение (минимум 70% совпадения)
-                        if len(title_variant_clean) >= 3 and len(img_name_normalized) >= 3:
-                            if title_variant_clean in img_name_normalized:
-                                match_ratio = len(title_variant_clean) / len(img_name_normalized)
-                                if match_ratio >= 0.7:
-                                    return f'/static/img/elektrotehnicheskij-zavod-kvt/{img_file.name}'
-                            elif img_name_normalized in title_variant_clean:
-                                match_ratio = len(img_name_normalized) / len(title_variant_clean)
-                                if match_ratio >= 0.7:
-                                    return f'/static/img/elektrotehnicheskij-zavod-kvt/{img_file.name}'
-        
-        # Возвращаем data URI для placeholder (1x1 прозрачный PNG)
-        # Это предотвратит 404 ошибки и не будет пытаться загрузить несуществующий файл
-        return 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+        # URL берётся из манифеста изображений (catalog.image_manifest), без обращений к диску
+        from .image_manifest import get_manifest
+        return get_manifest().get(self)
 
     def save(self, *args, **kwargs):
         if self.price_special is not None:
             self.price = self.price_special
+        attributes = parsed_attributes(self.wire_section, self.load_limit)
+        for name, value in attributes.items():
+            setattr(self, name, value)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'section', 'section_id'} & set(update_fields):
+            # Раздел прежний - путь в базе уже актуален (его поддерживают Section.save и Subcategory.save)
+            if self._state.adding or self.section_id != getattr(self, '_loaded_section_id', None):
+                self.subcategory_id, self.category_id = self.tree_path()
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {'wire_section', 'load_limit'} & update_fields:
+                update_fields |= set(attributes)
+            if {'section', 'section_id'} & update_fields:
+                update_fields |= {'subcategory', 'category'}
+            kwargs['update_fields'] = update_fields
         super().save(*args, **kwargs)
+        self._loaded_section_id = self.section_id
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Раздел на момент загрузки: save() не пересчитывает путь, пока раздел не сменился
+        instance._loaded_section_id = instance.__dict__.get('section_id')
+        return instance
+
+    def tree_path(self):
+        """(subcategory_id, category_id) раздела товара; без запроса, если раздел
+        загружен вместе с подкатегорией (select_related('subcategory'))"""
+        if self.section_id is None:
+            return None, None
+        if Product.section.is_cached(self) and Section.subcategory.is_cached(self.section):
+            return self.section.subcategory_id, self.section.subcategory.category_id
+        path = Section.objects.filter(pk=self.section_id).values_list('subcategory_id', 'subcategory__category_id').first()
+        return path or (None, None)
 
 
 class Order(TimestampedModel):
@@ -304,6 +374,10 @@ class Order(TimestampedModel):
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
         ordering = ['-created_at']
+        indexes = [
+            # Список заказов в админке: ORDER BY created_at DESC, id DESC
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'Заказ #{self.pk} ({self.get_status_display()})'
@@ -324,6 +398,10 @@ class OrderItem(models.Model):
     class Meta:
         verbose_name = 'Позиция заказа'
         verbose_name_plural = 'Позиции заказа'
+        indexes = [
+            # Популярность маркировок для подсказок: число заказов по product_sku
+            models.Index(fields=['product_sku', 'order'], name='orderitem_sku_order_idx'),
+        ]
 
     def __str__(self) -> str:
         title = self.product.title if self.product else self.product_title
@@ -360,6 +438,10 @@ class Lead(TimestampedModel):
         verbose_name = 'Заявка'
         verbose_name_plural = 'Заявки'
         ordering = ['processed', '-created_at']
+        indexes = [
+            # Список заявок в админке: необработанные сверху, новые первыми
+            models.Index(fields=['processed', '-created_at', '-id'], name='lead_processed_created_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.get_lead_type_display()} от {self.name}'
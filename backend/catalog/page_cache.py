@@ -0,0 +1,42 @@
+"""
+Кэш HTML главной страницы целиком.
+
+Главная одинакова для всех посетителей, кроме CSRF-токена в формах. Страница
+рендерится один раз на версию каталога с заглушкой вместо токена и хранится в кэше
+в байтах; при отдаче заглушка заменяется токеном текущего запроса.
+Запросы авторизованных пользователей кэш не читают и не пополняют.
+"""
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .fragments import get_fragments_generation
+from .snapshot import get_catalog_version
+
+PAGE_TIMEOUT = 60 * 60 * 24
+PAGE_KEY = 'catalog:page:{name}:{version}:{generation}:{variant}'
+CSRF_PLACEHOLDER = '__csrf_token_placeholder__'
+
+
+def _page_key(name, version, variant):
+    return PAGE_KEY.format(name=name, version=version, generation=get_fragments_generation(), variant=variant)
+
+
+def get_cached_page(name, variant=''):
+    """Байты страницы с заглушкой CSRF для текущей версии каталога или None"""
+    return cache.get(_page_key(name, get_catalog_version(), variant))
+
+
+def render_page(name, template_name, context, request, variant='', store=True):
+    """Рендерит страницу с заглушкой CSRF и кэширует её под версией снимка из контекста"""
+    context = {**context, 'csrf_token': CSRF_PLACEHOLDER}
+    content = render_to_string(template_name, context, request=request).encode('utf-8')
+    version = context.get('catalog_version')
+    # Без версии (ошибка загрузки каталога) или с устаревшим снимком страницу не кэшируем
+    if store and version is not None and version == get_catalog_version():
+        cache.set(_page_key(name, version, variant), content, PAGE_TIMEOUT)
+    return content
+
+
+def punch_csrf_token(content, token):
+    """Подставляет CSRF-токен запроса в закэшированную страницу"""
+    return content.replace(CSRF_PLACEHOLDER.encode('ascii'), token.encode('ascii'))
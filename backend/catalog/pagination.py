@@ -0,0 +1,111 @@
+"""
+Курсорная (keyset) пагинация товаров раздела.
+
+Курсор - непрозрачная строка с ключом сортировки последнего отданного товара
+(order, title, id). Следующая страница начинается сразу после этого товара:
+позиция находится по id через индекс раздела в снимке каталога, поэтому глубокие
+страницы не дороже первой, а изменения в уже пройденной части раздела не сдвигают
+следующую страницу, как при offset.
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+
+from .fragments import get_section_version, render_section_cards
+from .snapshot import get_snapshot
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def product_sort_key(product):
+    return (product.order, product.title, product.pk)
+
+
+def encode_cursor(product):
+    raw = json.dumps(product_sort_key(product), ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Ключ (order, title, id) из курсора; InvalidCursor, если строка повреждена"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        order, title, pk = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+    if not isinstance(order, int) or not isinstance(title, str) or not isinstance(pk, int):
+        raise InvalidCursor(cursor)
+    return (order, title, pk)
+
+
+def cursor_position(section, key):
+    """Индекс первого товара раздела после ключа курсора"""
+    position = section.positions.get(key[2])
+    if position is not None and product_sort_key(section.products[position]) == key:
+        return position + 1
+    # Товар курсора изменён или удалён: ищем первый товар с большим ключом
+    for position, product in enumerate(section.products):
+        if product_sort_key(product) > key:
+            return position
+    return len(section.products)
+
+
+@dataclass(frozen=True, slots=True)
+class SectionPage:
+    """Страница товаров раздела с отрендеренными карточками"""
+    section: object
+    html: str
+    offset: int
+    loaded_count: int
+    has_more: bool
+    next_cursor: str
+
+    @property
+    def total_count(self):
+        return self.section.products_count
+
+    def as_dict(self):
+        return {
+            'html': self.html,
+            'has_more': self.has_more,
+            'total_count': self.total_count,
+            'loaded_count': self.loaded_count,
+            'next_cursor': self.next_cursor,
+        }
+
+
+def get_section_page(section_id, offset=0, limit=9, cursor=None, loading='lazy', snapshot=None):
+    """Страница товаров раздела по offset или курсору; None, если раздел не найден"""
+    try:
+        section_id = int(section_id)
+    except (TypeError, ValueError):
+        return None
+    # Версия раздела читается до снимка (см. catalog.fragments)
+    section_version = get_section_version(section_id)
+    if snapshot is None:
+        snapshot = get_snapshot()
+    section = snapshot.get_section(section_id)
+    if section is None:
+        return None
+    if cursor:
+        offset = cursor_position(section, decode_cursor(cursor))
+    # limit + 1 товар: есть ли следующая страница, без отдельного подсчёта
+    window = section.products[offset:offset + limit + 1]
+    products = window[:limit]
+    has_more = len(window) > limit
+    html = render_section_cards(
+        section, offset, limit, loading,
+        section_version=section_version,
+        snapshot_version=snapshot.version,
+    )
+    return SectionPage(
+        section=section,
+        html=html,
+        offset=offset,
+        loaded_count=offset + len(products),
+        has_more=has_more,
+        next_cursor=encode_cursor(products[-1]) if has_more else None,
+    )
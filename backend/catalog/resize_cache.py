@@ -0,0 +1,270 @@
+"""
+Локальная замена resize_cache Битрикса: /upload/resize_cache/iblock/{code}/{w}_{h}_{mode}/{file}.
+
+Старые товары ссылаются на изображения в формате Битрикса (image_code), а сам сайт
+Битрикса больше не отвечает за эти URL. Запрос ищет исходник локально (выгрузка
+upload/iblock, static/img/products, media/products), уменьшает его до w×h при первом
+обращении и кладёт результат в дисковый кэш. Следующие запросы отдают готовый файл.
+
+Режимы как в CFile::ResizeImageGet: 2 (BX_RESIZE_IMAGE_EXACT) - точный размер
+с обрезкой, 1 (PROPORTIONAL) и 0 (PROPORTIONAL_ALT) - вписать с сохранением
+пропорций. Обслуживаются только размеры из ALLOWED_SIZES - те, что выводит каталог:
+иначе любой мог бы заказать миллионы вариантов каждого изображения.
+
+Одновременные первые запросы одного файла ждут друг друга на блокировке (потоки -
+threading.Lock на время уменьшения, процессы - flock одного из LOCK_STRIPES файлов
+блокировки), поэтому уменьшение выполняется один раз.
+
+Размер кэша ограничен по сумме байт: при превышении удаляются давно не запрошенные
+файлы (время последнего обращения - mtime, обновляется при отдаче). Каждый процесс
+пересчитывает содержимое папки не реже раза в RESCAN_INTERVAL секунд, чтобы учитывать
+файлы, добавленные другими процессами.
+"""
+import io
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: только блокировка внутри процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# (ширина, высота, режим), которые встречаются в URL изображений каталога
+ALLOWED_SIZES = frozenset({(310, 310, 2), (575, 485, 2), (98, 98, 1)})
+# Число файлов блокировки: постоянный набор вместо файла на каждое изображение
+LOCK_STRIPES = 64
+LOCKS_DIR = '.locks'
+SOURCE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif')
+OUTPUT_FORMATS = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG', '.webp': 'WEBP'}
+CONTENT_TYPES = {'PNG': 'image/png', 'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+QUALITY = 85
+RESCAN_INTERVAL = 60
+# Имя папки и файла: буквы, цифры, точка, дефис, подчёркивание - без «..» и разделителей пути
+_NAME_RE = re.compile(r'^[\w\-][\w.\-]*$')
+
+
+class ResizeError(Exception):
+    """Исходник найден, но не читается как изображение"""
+
+
+def get_upload_root():
+    """Выгрузка Битрикса (upload/iblock/...) рядом с backend"""
+    return Path(getattr(settings, 'CATALOG_UPLOAD_ROOT', Path(settings.BASE_DIR).parent / 'upload'))
+
+
+def get_allowed_sizes():
+    return frozenset(tuple(size) for size in getattr(settings, 'CATALOG_RESIZE_SIZES', ALLOWED_SIZES))
+
+
+def is_valid_request(code, width, height, mode, filename):
+    return (
+        bool(_NAME_RE.match(code)) and bool(_NAME_RE.match(filename))
+        and (width, height, mode) in get_allowed_sizes()
+        and Path(filename).suffix.lower() in OUTPUT_FORMATS
+    )
+
+
+def find_source(code, filename):
+    """Локальный исходник для code/filename или None"""
+    base = Path(settings.BASE_DIR)
+    upload_root = get_upload_root()
+    stem = Path(filename).stem
+    candidates = [
+        # Оригинал Битрикса: upload/iblock/{code}/{filename}
+        upload_root / 'iblock' / code / filename,
+        # Готовая миниатюра из старой выгрузки - тоже годится как исходник
+        upload_root / 'resize_cache' / 'iblock' / code / '310_310_2' / filename,
+    ]
+    for directory in (upload_root / 'iblock' / code, base / 'static' / 'img' / 'products', Path(settings.MEDIA_ROOT) / 'products'):
+        candidates += [directory / f'{name}{extension}' for name in dict.fromkeys((stem, code)) for extension in SOURCE_EXTENSIONS]
+    for path in candidates:
+        if path.is_file() and path.stat().st_size:
+            return path
+    return None
+
+
+def resize(source, width, height, mode, image_format):
+    """Байты уменьшенного изображения"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if mode == 2:
+            image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+        else:
+            image = image.copy()
+            image.thumbnail((width, height), Image.Resampling.LANCZOS)
+        if image_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image_format != 'JPEG' and image.mode not in ('RGB', 'RGBA', 'P', 'L', 'LA'):
+            image = image.convert('RGBA')
+        buffer = io.BytesIO()
+        image.save(buffer, image_format, quality=QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+class ResizeCache:
+    """Дисковый кэш уменьшенных изображений с вытеснением по сумме байт"""
+
+    def __init__(self, root, max_bytes):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.files = {}
+        self.total_bytes = 0
+        self.scanned_at = None
+        self.resizes = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def path_for(self, code, width, height, mode, filename):
+        return self.root / f'{width}_{height}_{mode}' / code / filename
+
+    def _scan(self):
+        files = {}
+        for directory, dirnames, filenames in os.walk(self.root):
+            if directory == str(self.root) and LOCKS_DIR in dirnames:
+                dirnames.remove(LOCKS_DIR)
+            for name in filenames:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = (stat.st_mtime, stat.st_size)
+        self.files = files
+        self.total_bytes = sum(size for mtime, size in files.values())
+        self.scanned_at = time.monotonic()
+
+    def _touch(self, path):
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            return
+        with self._lock:
+            entry = self.files.get(str(path))
+            if entry is not None:
+                self.files[str(path)] = (now, entry[1])
+
+    def _add(self, path, size):
+        with self._lock:
+            if self.scanned_at is None or time.monotonic() - self.scanned_at > RESCAN_INTERVAL:
+                self._scan()
+            previous = self.files.get(str(path))
+            if previous is not None:
+                self.total_bytes -= previous[1]
+            self.files[str(path)] = (time.time(), size)
+            self.total_bytes += size
+            self._evict(keep=str(path))
+
+    def _evict(self, keep=None):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for path, (mtime, size) in sorted(self.files.items(), key=lambda item: item[1][0]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not evict {path}: {e}")
+                continue
+            del self.files[path]
+            self.total_bytes -= size
+
+    @contextmanager
+    def _key_lock(self, path):
+        """Блокировка одного файла для потоков процесса; запись удаляется, когда её никто не ждёт"""
+        key = str(path)
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def _lock_path(self, path):
+        stripe = zlib.crc32(str(path).encode('utf-8')) % LOCK_STRIPES
+        return self.root / LOCKS_DIR / f'{stripe:02d}.lock'
+
+    def get(self, code, width, height, mode, filename):
+        """Путь к готовому файлу (уменьшает исходник при первом запросе) или None;
+        ResizeError, если исходник не удалось обработать"""
+        path = self.path_for(code, width, height, mode, filename)
+        if path.is_file():
+            self._touch(path)
+            return path
+        source = find_source(code, filename)
+        if source is None:
+            return None
+        with self._key_lock(path):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            lock_path = self._lock_path(path)
+            lock_path.parent.mkdir(exist_ok=True)
+            lock_file = open(lock_path, 'a') if fcntl else None
+            try:
+                if lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # Пока ждали блокировку, файл мог создать другой запрос
+                if path.is_file():
+                    self._touch(path)
+                    return path
+                try:
+                    data = resize(source, width, height, mode, OUTPUT_FORMATS[path.suffix.lower()])
+                except Exception as e:
+                    # Повреждённый файл, неподдерживаемый формат, слишком большое изображение
+                    raise ResizeError(f'{source}: {e}') from e
+                tmp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, path)
+                self.resizes += 1
+            finally:
+                if lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+        self._add(path, len(data))
+        return path
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_resize_cache():
+    """Общий для процесса кэш"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResizeCache(
+                    getattr(settings, 'CATALOG_RESIZE_CACHE_DIR', Path(settings.BASE_DIR) / 'resize_cache'),
+                    getattr(settings, 'CATALOG_RESIZE_CACHE_MAX_BYTES', 256 * 1024 * 1024),
+                )
+    return _cache
+
+
+def content_type(path):
+    return CONTENT_TYPES[OUTPUT_FORMATS[Path(path).suffix.lower()]]
@@ -0,0 +1,364 @@
+"""
+Поиск товаров в памяти процесса: инвертированный индекс по названию, SKU, сечению
+провода, предельной нагрузке и пути раздела (категория / подкатегория / раздел).
+
+Нормализация одинакова для товаров и запросов: верхний регистр, Ё → Е, латинские
+буквы, похожие на кириллические (A, B, C, E, H, K, M, O, P, T, X, Y), заменяются
+кириллическими, разные тире сводятся к дефису. Слово с дефисом индексируется
+целиком без дефисов и по частям: «ЗАН-1500» находится по «зан1500», «зан-15»
+и «зан 1500». Каждое слово запроса ищется по префиксу (от двух символов),
+документ должен содержать все слова; точное совпадение весит вдвое больше.
+
+Индекс строится из снимка каталога и при смене версии каталога (её увеличивают
+сигналы при любом изменении) обновляется инкрементально: переиндексируются только
+товары с изменившимися updated_at, разделом или путём раздела.
+
+CATALOG_SEARCH_BACKEND = 'database' переключает поиск на полнотекстовый индекс
+базы данных (catalog.fts); сниппеты в обоих случаях строит make_snippet.
+"""
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.utils.html import escape, strip_tags
+
+from .lru import LRUCache
+from .snapshot import get_snapshot
+
+FIELD_WEIGHTS = {
+    'sku': 8,
+    'title': 6,
+    'wire_section': 3,
+    'load_limit': 3,
+    'path': 1,
+}
+EXACT_BONUS = 2
+MIN_PREFIX_LENGTH = 2
+# Раскрытие коротких префиксов («за», «10») затрагивает тысячи токенов: результат
+# запоминается до следующего изменения индекса
+TERM_CACHE_SIZE = 512
+TERM_CACHE_MIN_TOKENS = 32
+TERM_CACHE_MIN_DOCS = 2000
+# Если после первых слов кандидатов не больше этого числа, остальные слова проверяются по ним
+CANDIDATES_SCAN_LIMIT = 256
+PREFIX_END = '\U0010ffff'
+# Сколько слов описания показывать в сниппете
+SNIPPET_WORDS = 12
+
+# Латинские буквы, похожие на кириллические (и Ё), в верхнем регистре
+LOOKALIKES = {
+    'A': 'А', 'B': 'В', 'C': 'С', 'E': 'Е', 'H': 'Н', 'K': 'К', 'M': 'М',
+    'O': 'О', 'P': 'Р', 'T': 'Т', 'X': 'Х', 'Y': 'У', 'Ё': 'Е',
+}
+_LOOKALIKES = str.maketrans({
+    **LOOKALIKES,
+    '‐': '-', '‑': '-', '‒': '-', '–': '-', '—': '-', '―': '-', '−': '-',
+})
+_DECIMAL_COMMA_RE = re.compile(r'(?<=\d),(?=\d)')
+_SPLIT_RE = re.compile(r'[^\w.\-]+')
+
+
+def normalize_text(value):
+    """Текст в каноническом виде для сравнения"""
+    value = str(value or '').upper().translate(_LOOKALIKES)
+    return _DECIMAL_COMMA_RE.sub('.', value)
+
+
+def _words(value):
+    for word in _SPLIT_RE.split(normalize_text(value)):
+        word = word.strip('.-_')
+        if word:
+            yield word
+
+
+def tokenize(value):
+    """Токены для индекса: слово без дефисов и его части"""
+    tokens = set()
+    for word in _words(value):
+        parts = [part for part in re.split(r'[-_]+', word) if part]
+        tokens.add(''.join(parts))
+        tokens.update(parts)
+    return tokens
+
+
+def tokenize_query(value):
+    """Слова запроса: слово с дефисом ищется целиком, без дефисов"""
+    terms = []
+    for word in _words(value):
+        term = re.sub(r'[-_]+', '', word)
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def _highlights(word, terms):
+    return any(token.startswith(term) for token in tokenize(word) for term in terms)
+
+
+def make_snippet(product, query, words=SNIPPET_WORDS):
+    """HTML-сниппет: название с подсвеченными (<mark>) словами запроса, а если
+    в названии совпадений нет - фрагмент описания вокруг первого совпадения"""
+    terms = tokenize_query(query)
+    for field in ('title', 'short_description', 'full_description'):
+        # У карточек из снимка (catalog.cards) нет описаний
+        chunks = strip_tags(getattr(product, field, '') or '').split()
+        hits = [i for i, chunk in enumerate(chunks) if _highlights(chunk, terms)]
+        if not hits:
+            continue
+        start, end = 0, len(chunks)
+        if field != 'title':
+            start = max(hits[0] - words // 2, 0)
+            end = min(start + words, len(chunks))
+        hits = set(hits)
+        snippet = ' '.join(
+            f'<mark>{escape(chunks[i])}</mark>' if i in hits else escape(chunks[i])
+            for i in range(start, end)
+        )
+        return f'{"… " if start else ""}{snippet}{" …" if end < len(chunks) else ""}'
+    return escape(product.title)
+
+
+class SearchIndex:
+    """Инвертированный индекс: для каждого веса поля - token → множество id документов
+    и отсортированный список токенов для поиска по префиксу.
+
+    Документы хранятся во множествах, поэтому раскрытие префикса и пересечение слов
+    выполняются операциями над set без цикла по документам в Python. При равной
+    релевантности выше документ с меньшим id.
+    """
+
+    def __init__(self):
+        self.postings = {weight: {} for weight in sorted(set(FIELD_WEIGHTS.values()), reverse=True)}
+        self.tokens = {weight: [] for weight in self.postings}
+        self.doc_tokens = {}
+        self.docs = {}
+        self._term_cache = LRUCache(TERM_CACHE_SIZE)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, doc_id, fields, payload=None):
+        """Индексирует документ; fields - {имя поля: текст}"""
+        self.remove(doc_id)
+        self._term_cache.clear()
+        weights = {}
+        for name, value in fields.items():
+            weight = FIELD_WEIGHTS[name]
+            for token in tokenize(value):
+                if weights.get(token, 0) < weight:
+                    weights[token] = weight
+        for token, weight in weights.items():
+            postings = self.postings[weight]
+            docs = postings.get(token)
+            if docs is None:
+                docs = postings[token] = set()
+                insort(self.tokens[weight], token)
+            docs.add(doc_id)
+        self.doc_tokens[doc_id] = weights
+        self.docs[doc_id] = payload
+
+    def remove(self, doc_id):
+        weights = self.doc_tokens.pop(doc_id, None)
+        if weights is None:
+            return
+        self._term_cache.clear()
+        for token, weight in weights.items():
+            postings = self.postings[weight]
+            docs = postings[token]
+            docs.discard(doc_id)
+            if not docs:
+                del postings[token]
+                tokens = self.tokens[weight]
+                del tokens[bisect_left(tokens, token)]
+        self.docs.pop(doc_id, None)
+
+    def _term_levels(self, term):
+        """{релевантность: документы} для одного слова; каждый документ на уровне своего лучшего совпадения"""
+        levels = self._term_cache.get(term)
+        if levels is not None:
+            return levels
+        levels = {}
+        expanded = 0
+        for weight, postings in self.postings.items():
+            exact = postings.get(term)
+            if exact:
+                levels[weight * EXACT_BONUS] = exact
+            if len(term) < MIN_PREFIX_LENGTH:
+                continue
+            tokens = self.tokens[weight]
+            start = bisect_left(tokens, term)
+            end = bisect_left(tokens, term + PREFIX_END, start)
+            if exact:
+                start += 1
+            if start < end:
+                expanded += end - start
+                docs = set().union(*map(postings.__getitem__, tokens[start:end]))
+                level = levels.get(weight)
+                levels[weight] = level | docs if level else docs
+        levels = _disjoint(levels)
+        if expanded >= TERM_CACHE_MIN_TOKENS or sum(map(len, levels.values())) >= TERM_CACHE_MIN_DOCS:
+            self._term_cache.set(term, levels)
+        return levels
+
+    def _candidate_levels(self, term, candidates):
+        """То же, что _term_levels, но только для небольшого набора документов"""
+        prefix = len(term) >= MIN_PREFIX_LENGTH
+        levels = {}
+        for doc_id in candidates:
+            best = 0
+            for token, weight in self.doc_tokens[doc_id].items():
+                if token == term:
+                    weight *= EXACT_BONUS
+                elif not (prefix and token.startswith(term)):
+                    continue
+                if weight > best:
+                    best = weight
+            if best:
+                levels.setdefault(best, set()).add(doc_id)
+        return levels
+
+    def search(self, query, limit=20):
+        """(число найденных, [(score, payload), ...] лучших limit)"""
+        terms = tokenize_query(query)
+        if not terms:
+            return 0, []
+        # Длинные слова обычно избирательнее; когда кандидатов мало, остальные слова
+        # проверяются по токенам самих документов без раскрытия префикса по индексу
+        terms.sort(key=len, reverse=True)
+        levels = None
+        for term in terms:
+            if levels is not None and sum(map(len, levels.values())) <= CANDIDATES_SCAN_LIMIT:
+                term_levels = self._candidate_levels(term, set().union(*levels.values()))
+            else:
+                term_levels = self._term_levels(term)
+            if levels is None:
+                levels = term_levels
+            else:
+                # Документ должен содержать все слова: пересекаем уровни, релевантность складывается
+                combined = {}
+                for score, docs in levels.items():
+                    for term_score, term_docs in term_levels.items():
+                        common = docs & term_docs
+                        if common:
+                            key = score + term_score
+                            combined[key] = combined[key] | common if key in combined else common
+                levels = combined
+            if not levels:
+                return 0, []
+
+        results = []
+        for score in sorted(levels, reverse=True):
+            if len(results) >= limit:
+                break
+            for doc_id in heapq.nsmallest(limit - len(results), levels[score]):
+                results.append((score, self.docs[doc_id]))
+        return sum(len(docs) for docs in levels.values()), results
+
+
+def _disjoint(levels):
+    """Оставляет каждый документ только на самом высоком уровне"""
+    if len(levels) < 2:
+        return levels
+    disjoint = {}
+    seen = set()
+    for score in sorted(levels, reverse=True):
+        docs = levels[score] - seen
+        if docs:
+            disjoint[score] = docs
+            seen |= docs
+    return disjoint
+
+
+def _section_paths(snapshot):
+    paths = {}
+    for category in snapshot.categories:
+        for subcategory in category.subcategories:
+            for section in subcategory.sections:
+                paths[section.id] = f'{category.title} / {subcategory.title} / {section.title}'
+    return paths
+
+
+def product_fields(product, path=''):
+    return {
+        'sku': product.sku,
+        'title': product.title,
+        'wire_section': product.wire_section,
+        'load_limit': product.load_limit,
+        'path': path,
+    }
+
+
+class CatalogSearch:
+    """Индекс активных товаров, синхронизируемый со снимком каталога"""
+
+    def __init__(self):
+        self.index = SearchIndex()
+        self.version = None
+        self.signatures = {}
+        self.lock = threading.RLock()
+
+    def sync(self, snapshot):
+        """Переиндексирует товары, изменившиеся с прошлой версии снимка"""
+        if self.version == snapshot.version:
+            return
+        with self.lock:
+            if self.version == snapshot.version:
+                return
+            paths = _section_paths(snapshot)
+            signatures = {}
+            for product in snapshot.products:
+                # Товары неактивных разделов, подкатегорий и категорий не ищутся
+                if product.section_id not in paths:
+                    continue
+                path = paths[product.section_id]
+                signature = (product.updated_at, path)
+                signatures[product.pk] = signature
+                if self.signatures.get(product.pk) != signature:
+                    self.index.add(product.pk, product_fields(product, path), payload=(product, path))
+                else:
+                    # Объекты товаров берём из нового снимка без переиндексации
+                    self.index.docs[product.pk] = (product, path)
+            for product_id in self.signatures.keys() - signatures.keys():
+                self.index.remove(product_id)
+            self.signatures = signatures
+            self.version = snapshot.version
+
+    def search(self, query, limit=20):
+        with self.lock:
+            return self.index.search(query, limit)
+
+
+_search = CatalogSearch()
+
+
+def get_search_cache_stats():
+    """Счётчики LRU слов запроса текущего процесса"""
+    return _search.index._term_cache.stats()
+
+
+def search_products(query, limit=20):
+    """(число найденных, [(score, (product, путь раздела)), ...]) по актуальному снимку каталога.
+    CATALOG_SEARCH_BACKEND = 'database' на базе без полнотекстового индекса - поиск в памяти"""
+    if getattr(settings, 'CATALOG_SEARCH_BACKEND', 'memory') == 'database':
+        from .fts import is_supported
+
+        if is_supported():
+            return _search_database(query, limit)
+    _search.sync(get_snapshot())
+    return _search.search(query, limit)
+
+
+def _search_database(query, limit):
+    from .fts import search_queryset
+    from .models import Product
+
+    paths = _section_paths(get_snapshot())
+    queryset = search_queryset(Product.objects.filter(is_active=True, section_id__in=list(paths)), query)
+    results = [
+        (round(product.search_rank, 4), (product, paths[product.section_id]))
+        for product in queryset[:limit]
+    ]
+    total = queryset.count() if len(results) == limit else len(results)
+    return total, results
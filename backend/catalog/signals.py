@@ -0,0 +1,86 @@
+"""
+Сигналы каталога: любое изменение дерева или товара увеличивает версию каталога
+и обновляет производные данные (манифест изображений, кэш фрагментов разделов).
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Category, Subcategory, Section, Subsection, Product
+from .fragments import products_changed, tree_changed
+from .image_manifest import get_manifest
+from .tree import delete_node, rebuild_after_commit, sync_node
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Subcategory)
+@receiver(post_delete, sender=Subcategory)
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+def catalog_changed(sender, **kwargs):
+    """Инвалидирует снимок каталога и фрагменты после фиксации транзакции"""
+    transaction.on_commit(tree_changed)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Subcategory)
+@receiver(post_save, sender=Section)
+@receiver(post_save, sender=Subsection)
+def tree_node_saved(sender, instance, raw=False, **kwargs):
+    """Обновляет узел closure-таблицы. loaddata (raw) сохраняет объекты в произвольном
+    порядке и без связанных данных - дерево пересобирается один раз после фиксации"""
+    if raw:
+        rebuild_after_commit()
+    else:
+        sync_node(instance)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Subcategory)
+@receiver(post_delete, sender=Section)
+@receiver(post_delete, sender=Subsection)
+def tree_node_deleted(sender, instance, **kwargs):
+    delete_node(instance)
+
+
+@receiver(post_delete, sender=Section)
+def clear_product_tree_path(sender, instance, **kwargs):
+    """Товары удалённого раздела остались без раздела (SET_NULL) - сбрасываем и денормализованный путь"""
+    Product.objects.filter(section__isnull=True).exclude(subcategory__isnull=True, category__isnull=True).update(
+        subcategory=None,
+        category=None,
+    )
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_section(sender, instance, raw=False, **kwargs):
+    """Запоминает прежний раздел товара, чтобы сбросить фрагменты обоих разделов при переносе"""
+    if raw or instance.pk is None:
+        return
+    instance._previous_section_id = (
+        Product.objects.filter(pk=instance.pk).values_list('section_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    section_ids = {instance.section_id, getattr(instance, '_previous_section_id', None)}
+    transaction.on_commit(partial(products_changed, section_ids))
+
+
+@receiver(post_save, sender=Product)
+def product_image_changed(sender, instance, raw=False, **kwargs):
+    """Пересчитывает запись товара в манифесте изображений после фиксации транзакции:
+    откаченное сохранение не оставляет записи"""
+    if raw:
+        return
+    transaction.on_commit(partial(get_manifest().update, instance))
+
+
+@receiver(post_delete, sender=Product)
+def product_image_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(get_manifest().discard, instance.pk))
@@ -0,0 +1,200 @@
+"""
+Снимок дерева каталога (Category → Subcategory → Section → Product).
+
+Снимок строится один раз на процесс и переиспользуется главной страницей,
+меню и AJAX-загрузкой товаров раздела. Актуальность определяется версией
+каталога, которая хранится в кэше Django и меняется при любом изменении
+категорий, подкатегорий, разделов и товаров (см. catalog.signals).
+
+Версия - время изменения в нс (next_version) и записывается через cache.set, а не
+incr: в файловом кэше incr не атомарен между воркерами, и одновременные изменения
+слились бы в одно. Вытесненный ключ создаётся заново с новым временем, поэтому
+старая версия не повторится.
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_MODIFIED_KEY = 'catalog:modified'
+
+
+def next_version(current=None):
+    """Новое значение счётчика версии: время в нс, но не меньше current + 1. Значение
+    от времени не повторяет прежние, даже если ключ вытеснен из кэша и создан заново"""
+    version = time.time_ns()
+    if isinstance(current, int) and current >= version:
+        version = current + 1
+    return version
+
+
+def get_catalog_version():
+    """Текущая версия каталога (целое число, растёт со временем)"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, next_version(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY) or next_version()
+    return version
+
+
+def bump_catalog_version():
+    """Записывает новую версию каталога; снимок будет перестроен при следующем обращении"""
+    version = next_version(cache.get(CATALOG_VERSION_KEY))
+    cache.set(CATALOG_VERSION_KEY, version, timeout=None)
+    touch_catalog_modified()
+    return version
+
+
+def touch_catalog_modified():
+    """Запоминает время последнего изменения каталога (для заголовка Last-Modified)"""
+    cache.set(CATALOG_MODIFIED_KEY, time.time(), timeout=None)
+
+
+def get_catalog_modified():
+    """Время последнего изменения каталога (datetime в UTC)"""
+    timestamp = cache.get(CATALOG_MODIFIED_KEY)
+    if timestamp is None:
+        cache.add(CATALOG_MODIFIED_KEY, time.time(), timeout=None)
+        timestamp = cache.get(CATALOG_MODIFIED_KEY) or time.time()
+    return datetime.fromtimestamp(int(timestamp), tz=timezone.utc)
+
+
+@dataclass(frozen=True, slots=True)
+class SectionNode:
+    """Раздел - третий уровень"""
+    id: int
+    title: str
+    slug: str
+    description: str
+    subcategory_id: int
+    products: tuple = ()
+    positions: dict = field(default_factory=dict)
+
+    @property
+    def products_count(self):
+        return len(self.products)
+
+
+@dataclass(frozen=True, slots=True)
+class SubcategoryNode:
+    """Подкатегория - второй уровень"""
+    id: int
+    title: str
+    slug: str
+    description: str
+    category_id: int
+    sections: tuple = ()
+
+
+@dataclass(frozen=True, slots=True)
+class CategoryNode:
+    """Категория - первый уровень"""
+    id: int
+    title: str
+    slug: str
+    description: str
+    subcategories: tuple = ()
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogSnapshot:
+    """Неизменяемый снимок активной части каталога"""
+    version: int
+    categories: tuple
+    products: tuple
+    sections: dict
+    products_by_sku: dict
+
+    def get_section(self, section_id):
+        try:
+            return self.sections.get(int(section_id))
+        except (TypeError, ValueError):
+            return None
+
+    def get_product(self, sku):
+        return self.products_by_sku.get(sku)
+
+
+def build_snapshot(version):
+    """Строит снимок каталога из базы данных (2 запроса: дерево из closure-таблицы и
+    карточки товаров, см. catalog.cards)"""
+    from .cards import build_cards
+    from .models import CatalogNode, Product
+    from .tree import active_nodes
+
+    roots = []
+    children = {}
+    for node in active_nodes():
+        if node.level == CatalogNode.Level.CATEGORY:
+            roots.append(node)
+        else:
+            # Узлы неактивных родителей не попадут в снимок: их родителя нет среди активных
+            children.setdefault(node.parent_id, []).append(node)
+
+    products = build_cards(Product.objects.filter(is_active=True).order_by('order', 'title', 'id'))
+    products_by_section = {}
+    for product in products:
+        products_by_section.setdefault(product.section_id, []).append(product)
+
+    sections = {}
+    category_nodes = []
+    for category in roots:
+        subcategory_nodes = []
+        for subcategory in children.get(category.pk, ()):
+            section_nodes = []
+            for section in children.get(subcategory.pk, ()):
+                section_products = tuple(products_by_section.get(section.object_id, ()))
+                node = SectionNode(
+                    id=section.object_id,
+                    title=section.title,
+                    slug=section.slug,
+                    description=section.description,
+                    subcategory_id=subcategory.object_id,
+                    products=section_products,
+                    positions={product.pk: position for position, product in enumerate(section_products)},
+                )
+                sections[node.id] = node
+                section_nodes.append(node)
+            subcategory_nodes.append(SubcategoryNode(
+                id=subcategory.object_id,
+                title=subcategory.title,
+                slug=subcategory.slug,
+                description=subcategory.description,
+                category_id=category.object_id,
+                sections=tuple(section_nodes),
+            ))
+        category_nodes.append(CategoryNode(
+            id=category.object_id,
+            title=category.title,
+            slug=category.slug,
+            description=category.description,
+            subcategories=tuple(subcategory_nodes),
+        ))
+
+    return CatalogSnapshot(
+        version=version,
+        categories=tuple(category_nodes),
+        products=products,
+        sections=sections,
+        products_by_sku={product.sku: product for product in products},
+    )
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Возвращает актуальный снимок каталога, перестраивая его только при смене версии"""
+    global _snapshot
+    version = get_catalog_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = build_snapshot(version)
+        return _snapshot
@@ -0,0 +1,37 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from catalog.fragments import render_section_cards
+from catalog.thumbnails import get_thumbnail
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def section_cards(context, section, offset=0, limit=9, loading='lazy'):
+    """Карточки товаров раздела из кэша фрагментов (catalog.fragments)"""
+    html = render_section_cards(
+        section, offset, limit, loading,
+        snapshot_version=context.get('catalog_version'),
+    )
+    return mark_safe(html)
+
+
+@register.simple_tag
+def thumbnail(url, preset='card'):
+    """Миниатюра изображения (catalog.thumbnails.Thumbnail) или None:
+    {% thumbnail product.image_url 'modal' as thumb %}"""
+    return get_thumbnail(url, preset)
+
+
+@register.inclusion_tag('catalog/_picture.html')
+def picture(url, preset='card', alt='', loading='', img_class='', data_id=''):
+    """<picture> с WebP/JPEG srcset по миниатюрам; без миниатюр - обычный <img> с исходным URL"""
+    return {
+        'thumb': get_thumbnail(url, preset),
+        'url': url,
+        'alt': alt,
+        'loading': loading,
+        'img_class': img_class,
+        'data_id': data_id,
+    }
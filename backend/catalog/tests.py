@@ -1,3 +1,1345 @@
-from django.test import TestCase
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import serializers
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, TestCase, override_settings
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from django.utils import translation
+
+from .attributes import parse_load_limit, parse_wire_section
+from .cards import price_formatter
+from .facets import filter_products
+from .fragments import (
+    FRAGMENTS_GENERATION_KEY,
+    SECTION_VERSION_KEY,
+    get_fragments_generation,
+    get_section_version,
+    invalidate_all_fragments,
+    invalidate_section_fragments,
+    render_section_cards,
+)
+from .image_manifest import ImageManifest, image_signature
+from .image_matcher import ImageMatcher
+from .image_pool import run_parallel
+from .image_sync import ImageSync
+from .image_storage import ContentAddressedStorage, get_name_index
+from .lru import LRUCache
+from .models import CatalogNode, Category, Lead, Order, OrderItem, Product, Section, Subcategory
+from .page_cache import CSRF_PLACEHOLDER, _page_key, get_cached_page
+from .resize_cache import ALLOWED_SIZES, LOCK_STRIPES, LOCKS_DIR, ResizeCache, is_valid_request
+from .search import search_products
+from .snapshot import CATALOG_VERSION_KEY, bump_catalog_version, get_catalog_version, get_snapshot
+from .thumbnails import ThumbnailStore, fingerprint
+from .tree import TREE_MODELS, _rebuild_on_commit, active_nodes, rebuild_tree, tree_problems
+from .typeahead import CatalogTypeahead, Typeahead
+from .views import BATCH_MAX_SECTIONS, _index_variant
+
+# Общий кэш проекта (FileBasedCache в BASE_DIR/.cache) делят все процессы, включая
+# runserver: тесты работают с отдельным кэшем в памяти, чтобы cache.clear() и тестовые
+# страницы не попадали в кэш разработческого сервера
+_test_cache = override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'catalog-tests'},
+})
+
+
+def setUpModule():
+    _test_cache.enable()
+
+
+def tearDownModule():
+    _test_cache.disable()
+
+
+# Таблицы, которые растут вместе с каталогом и заказами: их нельзя читать полным
+# сканированием и сортировать во временном B-дереве
+HOT_TABLES = (
+    'catalog_product',
+    'catalog_catalognode',
+    'catalog_catalogtreepath',
+    'catalog_order',
+    'catalog_orderitem',
+    'catalog_lead',
+)
+
+
+def explain(sql, params):
+    """Строки плана запроса для текущей базы"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # На маленьких тестовых таблицах PostgreSQL и так выбрал бы Seq Scan и Sort:
+            # запрещаем их, чтобы в плане остались только вынужденные
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan):
+    problems = []
+    for line in plan:
+        if connection.vendor == 'postgresql':
+            if any(f'Seq Scan on {table} ' in f'{line} ' for table in HOT_TABLES):
+                problems.append(line)
+            elif line.strip().lstrip('-> ').startswith('Sort ') or 'Incremental Sort' in line:
+                problems.append(line)
+        else:
+            words = line.split()
+            if words[:1] == ['SCAN'] and len(words) > 1 and words[1] in HOT_TABLES and 'USING' not in words:
+                problems.append(line)
+            elif 'USE TEMP B-TREE FOR ORDER BY' in line:
+                problems.append(line)
+    return problems
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN для каждого запроса, который выполняют представления каталога"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for c in range(2):
+            category = Category.objects.create(title=f'Категория {c}', slug=f'category-{c}', order=c)
+            for s in range(2):
+                subcategory = Subcategory.objects.create(
+                    category=category, title=f'Подкатегория {c}.{s}', slug=f'subcategory-{s}', order=s,
+                )
+                for n in range(2):
+                    section = Section.objects.create(
+                        subcategory=subcategory, title=f'Раздел {c}.{s}.{n}', slug=f'section-{n}', order=n,
+                    )
+                    for p in range(5):
+                        Product.objects.create(
+                            section=section,
+                            title=f'ЗАН-{c}{s}{n}{p}',
+                            slug=f'zan-{c}{s}{n}{p}',
+                            sku=f'SKU-{c}{s}{n}{p}',
+                            price=Decimal(1000 * (p + 1)),
+                            wire_section='35/50' if p % 2 else '120-150',
+                            load_limit='10 кН',
+                            unit='шт',
+                            order=p,
+                        )
+        cls.section = Section.objects.order_by('pk').first()
+        cls.product = Product.objects.order_by('pk').first()
+        for i in range(3):
+            Lead.objects.create(name=f'Клиент {i}', phone='+77000000000', processed=bool(i % 2))
+            order = Order.objects.create(customer_name=f'Клиент {i}', customer_phone='+77000000000')
+            OrderItem.objects.create(
+                order=order, product=cls.product, product_title=cls.product.title,
+                product_sku=cls.product.sku, price=cls.product.price,
+            )
+        # Полная сборка манифеста изображений - намеренный проход по всем товарам
+        # (раз на процесс). Собираем его заранее во временную папку, а не в манифест проекта
+        manifest_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(manifest_dir.cleanup)
+        manifest = ImageManifest(Path(manifest_dir.name) / 'image_manifest.json')
+        manifest.build()
+        patcher = mock.patch('catalog.image_manifest._manifest', manifest)
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+
+    def setUp(self):
+        # Без кэша представления действительно обращаются к базе
+        cache.clear()
+
+    def capture(self, url, params=None):
+        queries = []
+
+        def record(execute, sql, sql_params, many, context):
+            queries.append((sql, sql_params))
+            return execute(sql, sql_params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200, url)
+        return [(sql, sql_params) for sql, sql_params in queries if sql.lstrip().upper().startswith('SELECT')]
+
+    def assertIndexedPlans(self, url, params=None):
+        failures = []
+        for sql, sql_params in self.capture(url, params):
+            plan = explain(sql, sql_params)
+            if plan_problems(plan):
+                failures.append(f'{sql}\n  ' + '\n  '.join(plan))
+        self.assertFalse(failures, f'{url}: запросы без индекса:\n' + '\n'.join(failures))
+
+    def test_index(self):
+        self.assertIndexedPlans('/')
+
+    def test_section_products(self):
+        self.assertIndexedPlans('/api/section/products/', {'section_id': self.section.pk, 'limit': 2})
+
+    def test_section_products_batch(self):
+        section_ids = ','.join(str(pk) for pk in Section.objects.values_list('pk', flat=True))
+        self.assertIndexedPlans('/api/section/products/batch/', {'section_ids': section_ids})
+
+    def test_product_detail(self):
+        self.assertIndexedPlans('/api/product/detail/', {'id': self.product.sku})
+        self.assertIndexedPlans('/api/product/detail/batch/', {'id': [self.product.sku, 'SKU-1111']})
+
+    def test_search(self):
+        self.assertIndexedPlans('/api/search/', {'q': 'зан-01'})
+        # Подсказки строятся в фоновом потоке; здесь - в потоке запроса, чтобы их запросы попали в план
+        with mock.patch('catalog.typeahead._typeahead', CatalogTypeahead()), \
+                mock.patch.object(CatalogTypeahead, 'refresh', CatalogTypeahead.build):
+            self.assertIndexedPlans('/api/search/suggest/', {'q': 'зан'})
+
+    def test_filter(self):
+        self.assertIndexedPlans('/api/products/filter/', {'wire_section': '35/50', 'limit': 3})
+
+    def test_filter_ranges(self):
+        self.assertIndexedPlans('/api/products/filter/', {'wire_mm2': '40', 'load_min': '5', 'load_max': '10'})
+
+    def test_admin_lists(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.assertIndexedPlans('/admin/catalog/lead/')
+        self.assertIndexedPlans('/admin/catalog/order/')
+
+
+class CatalogTreeTests(TestCase):
+    """Зеркало дерева (CatalogNode) после записей в обход save()"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for c in range(2):
+            category = Category.objects.create(title=f'Категория {c}', slug=f'tree-category-{c}', order=c)
+            subcategory = Subcategory.objects.create(category=category, title=f'Подкатегория {c}', slug='subcategory')
+            Section.objects.create(subcategory=subcategory, title=f'Раздел {c}', slug='section')
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def run_action(self, model_name, action, filters):
+        ids = [str(pk) for pk in apps.get_model('catalog', model_name).objects.values_list('pk', flat=True)]
+        response = self.client.post(
+            f'/admin/catalog/{model_name.lower()}/?{filters}',
+            {'action': action, '_selected_action': ids},
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_admin_actions_under_is_active_filter(self):
+        for model_name in ('Category', 'Subcategory', 'Section'):
+            with self.subTest(model_name):
+                self.run_action(model_name, 'make_inactive', 'is_active__exact=1')
+                self.assertEqual(tree_problems(), [])
+                self.assertFalse(active_nodes().filter(level=TREE_MODELS[model_name][0]).exists())
+                self.run_action(model_name, 'make_active', 'is_active__exact=0')
+                self.assertEqual(tree_problems(), [])
+                self.assertEqual(active_nodes().filter(level=TREE_MODELS[model_name][0]).count(), 2)
+
+    def test_queryset_update_needs_rebuild(self):
+        Category.objects.update(is_active=False)
+        self.assertEqual(len(tree_problems()), 2)
+        rebuild_tree()
+        self.assertEqual(tree_problems(), [])
+
+    def test_loaddata_rebuilds_tree(self):
+        data = serializers.serialize('json', [*Category.objects.all(), *Subcategory.objects.all(), *Section.objects.all()])
+        Category.objects.all().delete()
+        self.assertEqual(CatalogNode.objects.count(), 0)
+        with tempfile.TemporaryDirectory() as directory:
+            fixture = Path(directory) / 'catalog.json'
+            fixture.write_text(data, encoding='utf-8')
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                call_command('loaddata', str(fixture), verbosity=0)
+        # Одна пересборка на всю загрузку, а не на каждый объект
+        self.assertEqual(sum(callback is _rebuild_on_commit for callback in callbacks), 1)
+        self.assertEqual(CatalogNode.objects.count(), 6)
+        self.assertEqual(tree_problems(), [])
+
+
+class ProductAdminActionTests(TestCase):
+    """Массовые действия с товарами сбрасывают фрагменты своих разделов"""
+
+    def test_actions_under_is_active_filter(self):
+        category = Category.objects.create(title='Категория', slug='actions')
+        subcategory = Subcategory.objects.create(category=category, title='Подкатегория', slug='actions')
+        section = Section.objects.create(subcategory=subcategory, title='Раздел', slug='actions')
+        products = [
+            Product.objects.create(section=section, title=f'Товар {n}', slug=f'actions-{n}', sku=f'ACT-{n}')
+            for n in range(2)
+        ]
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        ids = [str(product.pk) for product in products]
+        for action, filters in (('make_inactive', 'is_active__exact=1'), ('make_active', 'is_active__exact=0')):
+            with self.subTest(action), mock.patch('catalog.admin.products_changed') as changed:
+                response = self.client.post(
+                    f'/admin/catalog/product/?{filters}', {'action': action, '_selected_action': ids},
+                )
+                self.assertEqual(response.status_code, 302)
+                changed.assert_called_once_with({section.pk})
+
+
+class ProductAttributeTests(TestCase):
+    """Числовые колонки характеристик не выходят за max_digits"""
+
+    def test_values_that_do_not_fit_are_discarded(self):
+        self.assertEqual(parse_wire_section('3х2,5 мм²'), (Decimal('2.50'), Decimal('2.50')))
+        self.assertEqual(parse_wire_section('1234567'), (None, None))
+        self.assertEqual(parse_load_limit('500 кгс'), Decimal('4.90'))
+        self.assertIsNone(parse_load_limit('20000000 т'))
+        self.assertIsNone(parse_load_limit('9' * 30 + ' мн'))
+
+    def test_save_with_huge_numbers(self):
+        category = Category.objects.create(title='Категория', slug='attributes')
+        subcategory = Subcategory.objects.create(category=category, title='Подкатегория', slug='attributes')
+        section = Section.objects.create(subcategory=subcategory, title='Раздел', slug='attributes')
+        product = Product.objects.create(
+            section=section, title='Товар', slug='attributes', sku='ATTR-1',
+            wire_section='1234567890', load_limit='99999999999 кН',
+        )
+        product.refresh_from_db()
+        self.assertIsNone(product.wire_section_max)
+        self.assertIsNone(product.load_limit_kn)
+
+
+class ProductFilterRangeTests(TestCase):
+    """Фильтр по числовым диапазонам: сечение провода и предельная нагрузка"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title='Категория', slug='ranges')
+        subcategory = Subcategory.objects.create(category=category, title='Подкатегория', slug='ranges')
+        section = Section.objects.create(subcategory=subcategory, title='Раздел', slug='ranges')
+        cls.products = {
+            sku: Product.objects.create(
+                section=section, title=sku, slug=sku.lower(), sku=sku, wire_section=wire_section, load_limit=load_limit,
+            )
+            for sku, wire_section, load_limit in (
+                ('RANGE-1', '35/50', '10 кН'),
+                ('RANGE-2', '35/50', '500 кгс'),
+                ('RANGE-3', '120-150', '10 кН'),
+                ('RANGE-4', '16', ''),
+            )
+        }
+
+    def setUp(self):
+        cache.clear()
+
+    def skus(self, params):
+        response = self.client.get('/api/products/filter/', params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(re.findall(r'data-product="(RANGE-\d)"', response.json()['html']))
+
+    def test_ranges(self):
+        self.assertEqual(self.skus({'wire_mm2': '40'}), ['RANGE-1', 'RANGE-2'])
+        self.assertEqual(self.skus({'load_min': '5', 'load_max': '10'}), ['RANGE-1', 'RANGE-3'])
+        self.assertEqual(self.skus({'wire_mm2': '40', 'load_min': '5', 'load_max': '10'}), ['RANGE-1'])
+        self.assertEqual(self.skus({'load_max': '5'}), ['RANGE-2'])
+
+    def test_bad_range_param(self):
+        for params in ({'wire_mm2': 'NaN'}, {'load_min': 'x'}):
+            with self.subTest(params):
+                self.assertEqual(self.client.get('/api/products/filter/', params).status_code, 400)
+
+
+class ResizeCacheTests(TestCase):
+    """Локальный resize_cache: размеры из списка, режимы Битрикса, одно уменьшение на файл"""
+
+    def setUp(self):
+        from PIL import Image
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        source = self.root / 'upload' / 'iblock' / 'abc'
+        source.mkdir(parents=True)
+        Image.new('RGB', (800, 400), 'red').save(source / 'photo.png')
+        override = self.settings(CATALOG_UPLOAD_ROOT=self.root / 'upload')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.cache = ResizeCache(self.root / 'cache', 10 * 2**20)
+
+    def size(self, path):
+        from PIL import Image
+
+        with Image.open(path) as image:
+            return image.size
+
+    def test_modes(self):
+        # 2 - EXACT: точный размер с обрезкой; 1 - вписать с сохранением пропорций
+        self.assertEqual(self.size(self.cache.get('abc', 575, 485, 2, 'photo.png')), (575, 485))
+        self.assertEqual(self.size(self.cache.get('abc', 98, 98, 1, 'photo.png')), (98, 49))
+
+    def test_only_allowed_sizes(self):
+        self.assertTrue(is_valid_request('abc', 310, 310, 2, 'photo.png'))
+        self.assertFalse(is_valid_request('abc', 311, 310, 2, 'photo.png'))
+        self.assertFalse(is_valid_request('abc', 310, 310, 0, 'photo.png'))
+        response = self.client.get('/upload/resize_cache/iblock/abc/300_300_2/photo.png')
+        self.assertEqual(response.status_code, 404)
+
+    def test_concurrent_requests_resize_once(self):
+        threads = [threading.Thread(target=self.cache.get, args=('abc', 310, 310, 2, 'photo.png')) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.resizes, 1)
+        self.assertEqual(self.cache._key_locks, {})
+
+    def test_eviction_keeps_lock_files_bounded(self):
+        self.cache.max_bytes = 1
+        for width, height, mode in ALLOWED_SIZES:
+            self.cache.get('abc', width, height, mode, 'photo.png')
+        self.assertEqual(len(self.cache.files), 1)
+        images = [path for path in (self.root / 'cache').rglob('*') if path.is_file() and path.suffix == '.png']
+        self.assertEqual(len(images), 1)
+        self.assertLessEqual(len(list((self.root / 'cache' / LOCKS_DIR).iterdir())), LOCK_STRIPES)
+
+
+class ImageManifestTests(TestCase):
+    """Манифест изображений: запись после фиксации, отложенное сохранение, подпись файла"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        (self.root / 'static' / 'img' / 'products').mkdir(parents=True)
+        self.image = self.root / 'static' / 'img' / 'products' / 'photo.png'
+        self.image.write_bytes(b'1')
+        override = self.settings(BASE_DIR=self.root, MEDIA_ROOT=self.root / 'media')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.manifest = ImageManifest(self.root / 'image_manifest.json')
+        patcher = mock.patch('catalog.image_manifest._manifest', self.manifest)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        category = Category.objects.create(title='Категория', slug='manifest')
+        subcategory = Subcategory.objects.create(category=category, title='Подкатегория', slug='manifest')
+        section = Section.objects.create(subcategory=subcategory, title='Раздел', slug='manifest')
+        self.product = Product.objects.create(
+            section=section, title='Товар', slug='manifest', sku='MAN-1', image_code='/static/img/products/photo.png',
+        )
+        self.manifest.build()
+
+    def test_rolled_back_save_leaves_no_entry(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.product.image_code = 'missing'
+                    self.product.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.manifest.entries[self.product.pk][1], '/static/img/products/photo.png')
+
+    def test_committed_saves_are_written_once(self):
+        with mock.patch.object(self.manifest, 'save', wraps=self.manifest.save) as save:
+            with mock.patch('catalog.image_manifest.SAVE_DELAY', 60), self.captureOnCommitCallbacks(execute=True):
+                for n in range(3):
+                    self.product.title = f'Товар {n}'
+                    self.product.save()
+            self.assertEqual(save.call_count, 0)
+            self.manifest._timer.cancel()
+            self.manifest.flush()
+            self.assertEqual(save.call_count, 1)
+        reloaded = ImageManifest(self.manifest.path)
+        self.assertTrue(reloaded.load())
+        self.assertEqual(reloaded.entries[self.product.pk][0], image_signature('', '/static/img/products/photo.png', 'Товар 2'))
+
+    def test_replaced_file_is_stale(self):
+        self.assertFalse(self.manifest.is_stale())
+        self.image.write_bytes(b'22')
+        self.assertEqual(self.manifest.stale_products(), [self.product.pk])
+        self.assertFalse(self.manifest.dirs_changed())
+        self.assertEqual(self.manifest.refresh(), 1)
+        self.assertEqual(self.manifest.entries[self.product.pk][2], 2)
+        self.assertFalse(self.manifest.is_stale())
+
+    def test_build_bumps_catalog_version(self):
+        version = get_catalog_version()
+        self.manifest.build()
+        self.assertGreater(get_catalog_version(), version)
+
+    def test_manifest_built_by_other_process_is_reloaded(self):
+        worker = ImageManifest(self.manifest.path)
+        self.assertTrue(worker.load())
+        Product.objects.filter(pk=self.product.pk).update(image_code='missing')
+        self.manifest.build()
+        # Гарантируем новый mtime и на файловых системах с грубой точностью времени
+        mtime = self.manifest.path.stat().st_mtime_ns + 10 ** 9
+        os.utime(self.manifest.path, ns=(mtime, mtime))
+        self.assertEqual(worker.entries[self.product.pk][1], '/static/img/products/photo.png')
+        # Обычные обращения проверяют файл не чаще RELOAD_INTERVAL
+        worker.ensure_loaded()
+        self.assertEqual(worker.entries[self.product.pk][1], '/static/img/products/photo.png')
+        self.assertTrue(worker.reload_if_changed())
+        self.assertEqual(worker.entries[self.product.pk][1], self.manifest.entries[self.product.pk][1])
+        self.assertFalse(worker.reload_if_changed())
+
+
+def legacy_image_match(filenames, title):
+    """Прежний поиск из Product.image_url: перебор файлов в порядке glob('*.jpg'),
+    glob('*.png'), glob('*.jpeg') до первого подходящего"""
+    title_clean = re.sub(r'[^\w\-/]', '', str(title).upper().strip())
+    normalized_title = re.sub(r'\s+', '', title_clean)
+    for ext in ('.jpg', '.jpeg', '.png'):
+        for variant in (
+            normalized_title + ext,
+            normalized_title.replace('/', '_') + ext,
+            normalized_title.replace('-', '_') + ext,
+            title_clean + ext,
+            title_clean.replace('/', '_') + ext,
+            title_clean.replace('-', '_') + ext,
+        ):
+            if variant in filenames:
+                return variant
+    value = normalized_title.replace('/', '_').replace('-', '_')
+    for ext in ('.jpg', '.png', '.jpeg'):
+        for name in sorted(name for name in filenames if name.endswith(ext)):
+            image_name = re.sub(r'[^\w\-/]', '', os.path.splitext(name)[0].upper())
+            image_name = image_name.replace(' ', '').replace('/', '_').replace('-', '_')
+            if value == image_name:
+                return name
+            if len(value) >= 3 and len(image_name) >= 3:
+                if value in image_name:
+                    if len(value) / len(image_name) >= 0.7:
+                        return name
+                elif image_name in value:
+                    if len(image_name) / len(value) >= 0.7:
+                        return name
+    return None
+
+
+class ImageMatcherTests(TestCase):
+    """Индексированный поиск изображения даёт тот же результат, что и прежний перебор файлов"""
+
+    # (файлы, название, прежний результат, новый результат)
+    CASES = (
+        (['ЗАН-35.jpg', 'ЗАН-35А.jpg'], 'ЗАН-35', 'ЗАН-35.jpg', 'ЗАН-35.jpg'),
+        (['ЗАН-35_50.png'], 'ЗАН-35/50', 'ЗАН-35_50.png', 'ЗАН-35_50.png'),
+        (['зан_35.jpeg'], 'ЗАН-35', 'зан_35.jpeg', 'зан_35.jpeg'),
+        (['НКИ-2.5-4.jpg'], 'НКИ 2.5', None, None),
+        (['НКИ-2.5-4.jpg'], 'НКИ-2.5', 'НКИ-2.5-4.jpg', 'НКИ-2.5-4.jpg'),
+        (['НКИ-2.5-4-ЛУЖ.jpg'], 'НКИ-2.5', None, None),
+        (['ЗАН-150.png'], 'ЗАН-150 (У)', 'ЗАН-150.png', 'ЗАН-150.png'),
+        (['АБ.jpg'], 'АБВ', None, None),
+        ([], 'ЗАН-35', None, None),
+        # Равный процент совпадения: первый файл в порядке glob
+        (['ТМЛ-16А.png', 'ТМЛ-16Б.jpg'], 'ТМЛ-16', 'ТМЛ-16Б.jpg', 'ТМЛ-16Б.jpg'),
+        (['ТМЛ-16Б.jpg', 'ТМЛ-16А.jpg'], 'ТМЛ-16', 'ТМЛ-16А.jpg', 'ТМЛ-16А.jpg'),
+        # Изменение: наибольший процент совпадения вместо первого подходящего файла
+        (['ТМЛ-16-8.jpg', 'ТМЛ-16Б.png'], 'ТМЛ-16', 'ТМЛ-16-8.jpg', 'ТМЛ-16Б.png'),
+        # Изменение: точное совпадение нормализованных имён важнее частичного
+        (['ЗАН-35А.jpg', 'зан_35.png'], 'ЗАН-35', 'ЗАН-35А.jpg', 'зан_35.png'),
+    )
+
+    def test_same_result_as_legacy_rules(self):
+        for filenames, title, legacy, expected in self.CASES:
+            with self.subTest(filenames=filenames, title=title):
+                self.assertEqual(legacy_image_match(filenames, title), legacy)
+                self.assertEqual(ImageMatcher(filenames).match(title), expected)
+
+    def test_match_many(self):
+        matcher = ImageMatcher(['ЗАН-35.jpg', 'ТМЛ-16Б.png'])
+        self.assertEqual(
+            matcher.match_many(['ЗАН-35', 'ТМЛ-16', 'ЗАН-35', 'ПА-1']),
+            {'ЗАН-35': 'ЗАН-35.jpg', 'ТМЛ-16': 'ТМЛ-16Б.png', 'ПА-1': None},
+        )
+
+
+class InactiveSectionTests(TestCase):
+    """Товары неактивных разделов не попадают в поиск и фильтр"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title='Категория', slug='inactive')
+        subcategory = Subcategory.objects.create(category=category, title='Подкатегория', slug='inactive')
+        for n, is_active in enumerate((True, False)):
+            section = Section.objects.create(
+                subcategory=subcategory, title=f'Раздел {n}', slug=f'inactive-{n}', is_active=is_active,
+            )
+            Product.objects.create(
+                section=section, title=f'Зажим {n}', slug=f'inactive-{n}', sku=f'INACT-{n}', wire_section='35/50',
+            )
+        cls.visible = Product.objects.get(sku='INACT-0')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_search(self):
+        total, results = search_products('зажим')
+        self.assertEqual(total, 1)
+        self.assertEqual([product.pk for score, (product, path) in results], [self.visible.pk])
+
+    def test_unsupported_database_falls_back_to_memory(self):
+        with self.settings(CATALOG_SEARCH_BACKEND='database'), \
+                mock.patch('catalog.fts.is_supported', return_value=False), \
+                mock.patch('catalog.fts.search_queryset') as search_queryset:
+            total, results = search_products('зажим')
+        search_queryset.assert_not_called()
+        self.assertEqual(total, 1)
+
+    def test_filter(self):
+        result = filter_products({'wire_section': ['35/50']})
+        self.assertEqual(result.total_count, 1)
+        self.assertEqual([product.pk for product in result.products], [self.visible.pk])
+        counts = {item['value']: item['count'] for item in result.facets['wire_section']['values']}
+        self.assertEqual(counts, {'35/50': 1})
+
+    def test_typeahead(self):
+        suggestions = CatalogTypeahead().build().complete('зажим')
+        self.assertEqual([product.pk for sku, title, orders, product in suggestions], [self.visible.pk])
+
+
+class TypeaheadTests(TestCase):
+    """Подсказки перестраиваются в фоне, запросы тем временем обслуживает прежняя структура"""
+
+    def test_serves_previous_index_while_rebuilding(self):
+        catalog_typeahead = CatalogTypeahead()
+        previous = Typeahead([('SKU-1', 'КА-15', None)])
+        catalog_typeahead.typeahead = previous
+        catalog_typeahead.version = 'old'
+        release = threading.Event()
+        with mock.patch.object(CatalogTypeahead, 'build', lambda self: release.wait(5)):
+            self.assertIs(catalog_typeahead.get(), previous)
+            thread = catalog_typeahead.thread
+            self.assertIsNotNone(thread)
+            # Повторный запрос не запускает вторую сборку
+            self.assertIs(catalog_typeahead.get(), previous)
+            self.assertIs(catalog_typeahead.thread, thread)
+            release.set()
+            thread.join(5)
+        self.assertIsNone(catalog_typeahead.thread)
+
+    def test_empty_response_while_first_build_runs(self):
+        with mock.patch('catalog.typeahead._typeahead', CatalogTypeahead()), \
+                mock.patch.object(CatalogTypeahead, 'refresh'):
+            response = self.client.get('/api/search/suggest/', {'q': 'ка'})
+        self.assertEqual(response.json()['suggestions'], [])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Хранение изображений по содержимому: загрузка, индекс имён, dedupe и очистка"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media = Path(directory.name) / 'media'
+        self.products_dir = self.media / 'products'
+        self.products_dir.mkdir(parents=True)
+        override = self.settings(MEDIA_ROOT=self.media, BASE_DIR=Path(directory.name))
+        override.enable()
+        self.addCleanup(override.disable)
+        for target, value in (
+            ('catalog.image_storage._index', None),
+            ('catalog.image_manifest._manifest', ImageManifest(Path(directory.name) / 'image_manifest.json')),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        category = Category.objects.create(title='Категория', slug='storage')
+        subcategory = Subcategory.objects.create(category=category, title='Подкатегория', slug='storage')
+        self.section = Section.objects.create(subcategory=subcategory, title='Раздел', slug='storage')
+
+    def sha(self, content):
+        return hashlib.sha256(content).hexdigest()
+
+    def test_round_trip_and_name_index(self):
+        storage = ContentAddressedStorage()
+        first = storage.save('products/CA1500.jpg', ContentFile(b'image'))
+        second = storage.save('products/CA1500_copy.JPG', ContentFile(b'image'))
+        self.assertEqual(first, f'products/{self.sha(b"image")}.jpg')
+        self.assertEqual(second, first)
+        self.assertEqual([path.name for path in self.products_dir.iterdir()], [Path(first).name])
+        with storage.open(first) as fh:
+            self.assertEqual(fh.read(), b'image')
+        index = get_name_index()
+        self.assertEqual(index.get('products/CA1500.jpg'), first)
+        # Известное имя не перенаправляется на другое содержимое
+        storage.save('products/CA1500.jpg', ContentFile(b'other'))
+        index.load()
+        self.assertEqual(index.get('products/CA1500.jpg'), first)
+
+    def test_dedupe(self):
+        sha = self.sha(b'same')
+        (self.products_dir / 'CA1500.jpg').write_bytes(b'same')
+        (self.products_dir / 'CA1500_TSni0GL.jpg').write_bytes(b'same')
+        (self.products_dir / 'other.png').write_bytes(b'other')
+        # Незаконченная запись того же содержимого не должна стать целевым файлом
+        stray = self.products_dir / f'{sha}.jpg.1.2.tmp'
+        stray.write_bytes(b'sa')
+        duplicate = Product.objects.create(
+            section=self.section, title='Товар 1', slug='storage-1', sku='ST-1', image='products/CA1500_TSni0GL.jpg',
+        )
+        other = Product.objects.create(
+            section=self.section, title='Товар 2', slug='storage-2', sku='ST-2', image='products/other.png',
+        )
+        call_command('dedupe_product_images', workers=1, stdout=StringIO(), stderr=StringIO())
+
+        duplicate.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(duplicate.image.name, f'products/{sha}.jpg')
+        self.assertEqual(other.image.name, f'products/{self.sha(b"other")}.png')
+        self.assertEqual(
+            sorted(path.name for path in self.products_dir.iterdir()),
+            sorted([f'{sha}.jpg', f'{self.sha(b"other")}.png', stray.name]),
+        )
+        self.assertEqual((self.products_dir / f'{sha}.jpg').read_bytes(), b'same')
+        self.assertEqual(get_name_index().get('products/CA1500.jpg'), f'products/{sha}.jpg')
+        # Новые имена сразу в копии static: production не раздаёт /media/
+        static_dir = Path(settings.BASE_DIR) / 'static' / 'img' / 'products'
+        self.assertEqual(
+            sorted(path.name for path in static_dir.iterdir() if not path.name.startswith('.')),
+            sorted([f'{sha}.jpg', f'{self.sha(b"other")}.png']),
+        )
+        self.assertEqual(duplicate.image_url, f'/static/img/products/{sha}.jpg')
+
+        # Повторный запуск ничего не меняет
+        output = StringIO()
+        call_command('dedupe_product_images', workers=1, stdout=output, stderr=StringIO())
+        self.assertIn('ссылок товаров: 0', output.getvalue())
+
+    def test_dedupe_without_sync_warns(self):
+        (self.products_dir / 'CA1500.jpg').write_bytes(b'same')
+        stderr = StringIO()
+        call_command('dedupe_product_images', workers=1, no_sync=True, stdout=StringIO(), stderr=stderr)
+        self.assertIn('sync_product_images', stderr.getvalue())
+        self.assertFalse((Path(settings.BASE_DIR) / 'static' / 'img' / 'products').exists())
+
+    def test_prune_unreferenced(self):
+        storage = ContentAddressedStorage()
+        used = storage.save('products/used.jpg', ContentFile(b'used'))
+        unused = storage.save('products/unused.jpg', ContentFile(b'unused'))
+        fresh = storage.save('products/fresh.jpg', ContentFile(b'fresh'))
+        legacy = storage.save('products/legacy.jpg', ContentFile(b'legacy'))
+        Product.objects.create(section=self.section, title='Товар 1', slug='storage-1', sku='ST-1', image=used)
+        # Старая ссылка ведёт к файлу через индекс имён
+        Product.objects.create(
+            section=self.section, title='Товар 2', slug='storage-2', sku='ST-2', image='products/legacy.jpg',
+        )
+        old = time.time() - 2 * 60 * 60
+        for name in (used, unused, legacy):
+            os.utime(self.media / name, (old, old))
+
+        call_command('prune_product_images', stdout=StringIO())
+
+        self.assertEqual(
+            sorted(path.name for path in self.products_dir.iterdir()),
+            sorted(Path(name).name for name in (used, fresh, legacy)),
+        )
+        index = get_name_index()
+        index.load()
+        self.assertIsNone(index.get('products/unused.jpg'))
+        self.assertEqual(index.get('products/legacy.jpg'), legacy)
+
+
+class CacheStatsTests(TestCase):
+    """Счётчики кэшей в памяти процесса: без потерь при параллельных запросах, видны сотрудникам"""
+
+    def test_lru_counters_under_threads(self):
+        lru = LRUCache(4)
+        lru.set('key', 'value')
+
+        def read():
+            for _ in range(1000):
+                lru.get('key')
+                lru.get('missing')
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(lru.stats(), {'size': 1, 'maxsize': 4, 'hits': 8000, 'misses': 8000})
+
+    def test_stats_view_is_staff_only(self):
+        self.assertEqual(self.client.get('/api/cache/stats/').status_code, 302)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        data = self.client.get('/api/cache/stats/').json()
+        self.assertEqual(
+            set(data['modal']), {'local_hits', 'shared_hits', 'misses', 'local_size', 'local_maxsize'},
+        )
+        self.assertEqual(set(data['search_terms']), {'size', 'maxsize', 'hits', 'misses'})
+
+
+class ProductTreePathTests(TestCase):
+    """Product.save() заполняет подкатегорию и категорию без лишнего запроса к разделу"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sections = []
+        for c in range(2):
+            category = Category.objects.create(title=f'Категория {c}', slug=f'path-{c}')
+            subcategory = Subcategory.objects.create(category=category, title=f'Подкатегория {c}', slug='path')
+            cls.sections.append(Section.objects.create(subcategory=subcategory, title=f'Раздел {c}', slug='path'))
+        cls.product = Product.objects.create(section=cls.sections[0], title='Товар', slug='path', sku='PATH-1')
+
+    def save(self, product):
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+        return [query['sql'] for query in queries if 'FROM "catalog_section"' in query['sql']]
+
+    def assertPath(self, section):
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.subcategory_id, product.category_id), (section.subcategory_id, section.subcategory.category_id))
+
+    def test_unchanged_section(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.title = 'Товар 2'
+        self.assertEqual(self.save(product), [])
+        self.assertPath(self.sections[0])
+
+    def test_section_loaded_with_subcategory(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.section = Section.objects.select_related('subcategory').get(pk=self.sections[1].pk)
+        self.assertEqual(self.save(product), [])
+        self.assertPath(self.sections[1])
+
+    def test_section_id_only(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.section_id = self.sections[1].pk
+        self.assertEqual(len(self.save(product)), 1)
+        self.assertPath(self.sections[1])
+
+
+class FragmentCounterTests(TestCase):
+    """Счётчики фрагментов в вытесняющем кэше не возвращают старые значения"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title='Категория', slug='fragments')
+        subcategory = Subcategory.objects.create(category=category, title='Подкатегория', slug='fragments')
+        cls.section = Section.objects.create(subcategory=subcategory, title='Раздел', slug='fragments')
+        Product.objects.create(section=cls.section, title='Товар', slug='fragments', sku='FRAG-1')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_evicted_counter_does_not_repeat(self):
+        for key, get in (
+            (SECTION_VERSION_KEY.format(self.section.pk), lambda: get_section_version(self.section.pk)),
+            (FRAGMENTS_GENERATION_KEY, get_fragments_generation),
+        ):
+            with self.subTest(key):
+                first = get()
+                invalidate_section_fragments([self.section.pk])
+                invalidate_all_fragments()
+                second = get()
+                self.assertGreater(second, first)
+                cache.delete(key)
+                self.assertNotIn(get(), (first, second))
+
+    def test_fragment_key_includes_catalog_version(self):
+        section = get_snapshot().get_section(self.section.pk)
+        render_section_cards(section)
+        with mock.patch('catalog.fragments.render_to_string', return_value='') as render:
+            render_section_cards(section)
+            render.assert_not_called()
+            bump_catalog_version()
+            render_section_cards(section)
+            render.assert_called_once()
+
+
+class SnapshotTests(TestCase):
+    """Снимок каталога: тёплые запросы без обращений к базе, перестройка после изменений"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title='Категория', slug='snapshot')
+        subcategory = Subcategory.objects.create(category=category, title='Подкатегория', slug='snapshot')
+        cls.section = Section.objects.create(subcategory=subcategory, title='Раздел', slug='snapshot')
+        cls.product = Product.objects.create(section=cls.section, title='Товар', slug='snapshot', sku='SNAP-1')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_requests_run_no_queries(self):
+        for url, params in (
+            ('/', {}),
+            ('/api/section/products/', {'section_id': self.section.pk}),
+        ):
+            with self.subTest(url):
+                self.assertEqual(self.client.get(url, params).status_code, 200)
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.client.get(url, params).status_code, 200)
+
+    def test_bump_rebuilds_snapshot(self):
+        snapshot = get_snapshot()
+        self.assertIs(get_snapshot(), snapshot)
+        versions = {bump_catalog_version() for _ in range(3)}
+        self.assertEqual(len(versions), 3)
+        self.assertIsNot(get_snapshot(), snapshot)
+
+    def test_product_save_rebuilds_snapshot(self):
+        snapshot = get_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = 'Новое название'
+            self.product.save()
+        rebuilt = get_snapshot()
+        self.assertNotEqual(rebuilt.version, snapshot.version)
+        self.assertEqual(rebuilt.get_section(self.section.pk).products[0].title, 'Новое название')
+
+    def test_evicted_version_is_new(self):
+        version = get_catalog_version()
+        cache.delete(CATALOG_VERSION_KEY)
+        self.assertNotEqual(get_catalog_version(), version)
+
+
+class SectionPaginationTests(TestCase):
+    """Страницы товаров раздела: параметры offset/limit и курсоры"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title='Категория', slug='paging')
+        subcategory = Subcategory.objects.create(category=category, title='Подкатегория', slug='paging')
+        cls.section = Section.objects.create(subcategory=subcategory, title='Раздел', slug='paging')
+        for n in range(7):
+            Product.objects.create(
+                section=cls.section, title=f'Товар {n}', slug=f'paging-{n}', sku=f'PAGE-{n}', order=n % 3,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bad_paging_params(self):
+        for params in ({'offset': 'x'}, {'limit': '9.5'}):
+            with self.subTest(params):
+                response = self.client.get('/api/section/products/', {'section_id': self.section.pk, **params})
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/section/products/batch/', {'section_ids': self.section.pk, 'limit': 'x'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            '/api/section/products/', {'section_id': self.section.pk, 'offset': -5, 'limit': 10_000},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['loaded_count'], self.section.products.count())
+
+    def page(self, **params):
+        response = self.client.get('/api/section/products/', {'section_id': self.section.pk, 'limit': 3, **params})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [int(pk) for pk in re.findall(r'data-product-id="(\d+)"', data['html'])], data
+
+    def walk(self, cursor=None):
+        ids = []
+        while True:
+            page_ids, data = self.page(**({'cursor': cursor} if cursor else {}))
+            ids += page_ids
+            cursor = data['next_cursor']
+            if not data['has_more']:
+                return ids, data
+            self.assertTrue(cursor)
+
+    def ordered_ids(self):
+        return list(
+            self.section.products.filter(is_active=True).order_by('order', 'title', 'id').values_list('pk', flat=True)
+        )
+
+    def test_cursor_walk_returns_every_product_once(self):
+        ids, last = self.walk()
+        self.assertEqual(ids, self.ordered_ids())
+        self.assertIsNone(last['next_cursor'])
+        self.assertEqual(last['loaded_count'], last['total_count'])
+
+    def test_cursor_is_stable_when_product_inserted(self):
+        first_ids, first = self.page()
+        with self.captureOnCommitCallbacks(execute=True):
+            # Перед курсором (offset сдвинулся бы и повторил товар) и после него
+            before = Product.objects.create(
+                section=self.section, title='Товар 00', slug='paging-before', sku='PAGE-B', order=0,
+            )
+            after = Product.objects.create(
+                section=self.section, title='Товар 10', slug='paging-after', sku='PAGE-A', order=1,
+            )
+        rest, last = self.walk(first['next_cursor'])
+        ordered = self.ordered_ids()
+        self.assertEqual(first_ids + rest, [pk for pk in ordered if pk != before.pk])
+        self.assertIn(after.pk, rest)
+        self.assertEqual(self.page(offset=3)[0][0], first_ids[-1])
+        self.assertFalse(last['has_more'])
+
+
+class PageCacheTests(TestCase):
+    """Кэш главной: заглушка CSRF, ключ по версии каталога, запросы мимо кэша"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title='Категория', slug='page')
+        subcategory = Subcategory.objects.create(category=category, title='Подкатегория', slug='page')
+        section = Section.objects.create(subcategory=subcategory, title='Раздел', slug='page')
+        cls.product = Product.objects.create(section=section, title='Товар', slug='page', sku='PAGE-CACHE-1')
+
+    def setUp(self):
+        cache.clear()
+
+    def cached(self):
+        return get_cached_page('index', _index_variant())
+
+    def tokens(self, response):
+        return set(re.findall(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode('utf-8')))
+
+    def test_csrf_token_is_fresh_per_response(self):
+        first = self.client.get('/')
+        cached = self.cached()
+        self.assertIn(CSRF_PLACEHOLDER.encode('ascii'), cached)
+        second = Client().get('/')
+        self.assertEqual(self.cached(), cached)
+        for response in (first, second):
+            self.assertNotIn(CSRF_PLACEHOLDER.encode('ascii'), response.content)
+            self.assertTrue(self.tokens(response))
+            for token in self.tokens(response):
+                self.assertNotIn(token.encode('ascii'), cached)
+        self.assertFalse(self.tokens(first) & self.tokens(second))
+
+    def test_key_follows_catalog_version(self):
+        self.client.get('/')
+        self.assertIsNotNone(self.cached())
+        bump_catalog_version()
+        self.assertIsNone(self.cached())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = 'Новое название'
+            self.product.save()
+        with self.settings(CATALOG_LAZY_INDEX=False):
+            self.assertContains(self.client.get('/'), 'Новое название')
+            self.assertIsNotNone(self.cached())
+
+    def test_authenticated_and_post_requests_bypass_cache(self):
+        self.assertEqual(self.client.post('/').status_code, 405)
+        self.assertIsNone(self.cached())
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        cache.set(_page_key('index', get_catalog_version(), _index_variant()), b'cached page')
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.content, b'cached page')
+        self.assertEqual(self.cached(), b'cached page')
+        cache.clear()
+        self.client.get('/')
+        self.assertIsNone(self.cached())
+
+
+class ConditionalGetTests(TestCase):
+    """ETag и Last-Modified: ответ 304 без запросов к базе, новый ETag после правки товара"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title='Категория', slug='conditional')
+        subcategory = Subcategory.objects.create(category=category, title='Подкатегория', slug='conditional')
+        cls.section = Section.objects.create(subcategory=subcategory, title='Раздел', slug='conditional')
+        cls.product = Product.objects.create(
+            section=cls.section, title='Товар', slug='conditional', sku='COND-1', wire_section='35/50',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def requests(self):
+        return (
+            ('/', {}),
+            ('/api/section/products/', {'section_id': self.section.pk}),
+            ('/api/section/products/batch/', {'section_ids': self.section.pk}),
+            ('/api/product/detail/', {'id': self.product.sku}),
+            ('/api/products/filter/', {'wire_section': '35/50'}),
+        )
+
+    def test_not_modified_without_queries(self):
+        for url, params in self.requests():
+            with self.subTest(url):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                for headers in (
+                    {'HTTP_IF_NONE_MATCH': response['ETag']},
+                    {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']},
+                ):
+                    with self.assertNumQueries(0):
+                        self.assertEqual(self.client.get(url, params, **headers).status_code, 304)
+
+    def test_etag_changes_after_product_edit(self):
+        etags = {url: self.client.get(url, params)['ETag'] for url, params in self.requests()}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = 'Новое название'
+            self.product.save()
+        for url, params in self.requests():
+            with self.subTest(url):
+                response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etags[url])
+
+
+class SectionProductsBatchTests(TestCase):
+    """Страницы нескольких разделов одним запросом"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title='Категория', slug='batch')
+        subcategory = Subcategory.objects.create(category=category, title='Подкатегория', slug='batch')
+        cls.sections = []
+        for s in range(2):
+            section = Section.objects.create(subcategory=subcategory, title=f'Раздел {s}', slug=f'batch-{s}', order=s)
+            for n in range(5):
+                Product.objects.create(
+                    section=section, title=f'Товар {s}.{n}', slug=f'batch-{s}-{n}', sku=f'BATCH-{s}{n}', order=n,
+                )
+            cls.sections.append(section)
+
+    def setUp(self):
+        cache.clear()
+
+    def batch(self, **params):
+        response = self.client.get('/api/section/products/batch/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_mixed_and_missing_ids(self):
+        first, second = (section.pk for section in self.sections)
+        data = self.batch(section_ids=f'{second},999999,abc,{first},{second}')
+        self.assertEqual(list(data['sections']), [str(second), str(first)])
+        self.assertEqual(data['missing'], [999999])
+        self.assertEqual(self.client.get('/api/section/products/batch/', {'section_ids': 'abc'}).status_code, 400)
+
+    def test_limits_are_capped(self):
+        section_ids = ','.join(str(pk) for pk in range(1, 100))
+        data = self.batch(section_ids=section_ids)
+        self.assertEqual(len(data['sections']) + len(data['missing']), BATCH_MAX_SECTIONS)
+        first = self.sections[0].pk
+        with mock.patch('catalog.views.SECTION_MAX_LIMIT', 3):
+            data = self.batch(section_ids=first, limit=1000)
+            self.assertEqual(data['sections'][str(first)]['loaded_count'], 3)
+            data = self.batch(section_ids=first, **{f'limit_{first}': 1000})
+            self.assertEqual(data['sections'][str(first)]['loaded_count'], 3)
+
+    def test_same_shape_as_section_endpoint(self):
+        first, second = (section.pk for section in self.sections)
+        cursor = self.client.get('/api/section/products/', {'section_id': first, 'limit': 2}).json()['next_cursor']
+        data = self.batch(section_ids=f'{first},{second}', limit=2, **{f'cursor_{first}': cursor})
+        for section_id, params in ((first, {'cursor': cursor}), (second, {})):
+            with self.subTest(section_id):
+                single = self.client.get(
+                    '/api/section/products/', {'section_id': section_id, 'limit': 2, **params},
+                ).json()
+                self.assertTrue(single.pop('success'))
+                self.assertEqual(data['sections'][str(section_id)], single)
+
+
+class ProductCardTests(TestCase):
+    """Готовые строки карточки совпадают с фильтрами шаблона"""
+
+    def test_price_text_matches_template_filters(self):
+        template = Template('{% load humanize %}{{ value|floatformat:0|intcomma }}')
+        values = ('1234.5', '999.49', '999.5', '1000', '12', '0.5', '1234567.5', '-1234.5', '12345678901')
+        for language in ('ru', 'en', 'hi'):
+            with translation.override(language):
+                format_price = price_formatter()
+                for value in map(Decimal, values):
+                    with self.subTest(language=language, value=value):
+                        self.assertEqual(format_price(value), template.render(Context({'value': value})))
+        with translation.override('ru'):
+            self.assertEqual(price_formatter()(Decimal('1234.5')), '1\xa0235')
+
+    def test_zero_price_is_hidden(self):
+        format_price = price_formatter()
+        for value in (None, 0, Decimal('0'), Decimal('0.4')):
+            with self.subTest(value=value):
+                self.assertEqual(format_price(value), '')
+        category = Category.objects.create(title='Категория', slug='cards')
+        subcategory = Subcategory.objects.create(category=category, title='Подкатегория', slug='cards')
+        section = Section.objects.create(subcategory=subcategory, title='Раздел', slug='cards')
+        Product.objects.create(section=section, title='Товар', slug='cards', sku='CARD-1', price=Decimal('0'))
+        cache.clear()
+        html = self.client.get('/api/section/products/', {'section_id': section.pk}).json()['html']
+        self.assertIn('CARD-1', html)
+        self.assertNotIn('product-box__prices', html)
+
+
+class ThumbnailTests(TestCase):
+    """Миниатюры: srcset по плотностям, пропуск готовых, обычный <img> без миниатюр"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        (self.root / 'media' / 'products').mkdir(parents=True)
+        override = self.settings(MEDIA_ROOT=self.root / 'media', MEDIA_URL='/media/')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.store = ThumbnailStore(self.root / 'thumbs', '/static/img/thumbs/')
+        patcher = mock.patch('catalog.thumbnails._store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def source(self, name, size, color='red'):
+        from PIL import Image
+
+        Image.new('RGB', size, color).save(self.root / 'media' / 'products' / name)
+        return f'/media/products/{name}'
+
+    def picture(self, url):
+        return Template('{% load catalog_tags %}{% picture url alt="Товар" %}').render(Context({'url': url}))
+
+    def test_srcset(self):
+        url = self.source('wide.png', (800, 400))
+        self.assertEqual(self.store.generate(url, presets=['card']), 4)
+        self.store.save()
+        thumb = self.store.get(url, 'card')
+        self.assertEqual((thumb.width, thumb.height), (310, 155))
+        self.assertTrue(thumb.src.startswith('/static/img/thumbs/') and thumb.src.endswith('-310x155.jpg'))
+        self.assertRegex(thumb.srcset, r'^/static/img/thumbs/\S+-310x155\.jpg 1x, /static/img/thumbs/\S+-620x310\.jpg 2x$')
+        self.assertEqual([mime_type for mime_type, srcset in thumb.sources], ['image/webp'])
+        self.assertIn('-620x310.webp 2x', thumb.sources[0][1])
+        html = self.picture(url)
+        self.assertIn(f'<source type="image/webp" srcset="{thumb.sources[0][1]}">', html)
+        self.assertIn(f'src="{thumb.src}" srcset="{thumb.srcset}" width="310" height="155"', html)
+        # Исходник меньше квадрата 2x: только 1x без увеличения
+        small = self.source('small.png', (200, 100))
+        self.store.generate(small, presets=['card'])
+        self.store.save()
+        self.assertEqual(self.store.get(small, 'card').srcset.count('x, '), 0)
+
+    def test_up_to_date_thumbnails_are_skipped(self):
+        url = self.source('photo.png', (800, 800))
+        self.assertEqual(self.store.generate(url, presets=['card']), 4)
+        with mock.patch('catalog.thumbnails.file_sha256') as sha256, \
+                mock.patch('catalog.thumbnails.make_thumbnails') as make:
+            self.assertEqual(self.store.generate(url, presets=['card']), 0)
+        sha256.assert_not_called()
+        make.assert_not_called()
+        self.assertEqual(self.store.generate(url, presets=['card'], force=True), 4)
+        # Изменённый исходник получает новые имена файлов
+        self.store.save()
+        old = self.store.get(url, 'card').src
+        self.source('photo.png', (800, 800), 'blue')
+        path = self.root / 'media' / 'products' / 'photo.png'
+        mtime = path.stat().st_mtime_ns + 10 ** 9
+        os.utime(path, ns=(mtime, mtime))
+        self.assertEqual(self.store.generate(url, presets=['card']), 4)
+        self.store.save()
+        self.assertNotEqual(self.store.get(url, 'card').src, old)
+
+    def test_fallback_img_without_thumbnail(self):
+        url = self.source('photo.png', (800, 800))
+        self.assertEqual(self.picture(url), f'<img src="{url}" alt="Товар">')
+        placeholder = 'data:image/png;base64,AAAA'
+        self.assertEqual(self.picture(placeholder), f'<img src="{placeholder}" alt="Товар">')
+
+
+class ImagePoolTests(TestCase):
+    """Пул процессов даёт тот же результат, что и последовательная обработка"""
+
+    def setUp(self):
+        from PIL import Image
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        products = self.root / 'media' / 'products'
+        products.mkdir(parents=True)
+        override = self.settings(MEDIA_ROOT=self.root / 'media', MEDIA_URL='/media/')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.urls = []
+        for n, size in enumerate(((800, 400), (200, 300), (640, 640), (1000, 100), (50, 50))):
+            Image.new('RGB', size, (n * 40, 0, 0)).save(products / f'{n}.png')
+            self.urls.append(f'/media/products/{n}.png')
+        (products / 'broken.png').write_bytes(b'not an image')
+        self.broken = '/media/products/broken.png'
+        self.urls.insert(2, self.broken)
+
+    def generate(self, name, workers):
+        store = ThumbnailStore(self.root / name, f'/static/{name}/')
+        stats = store.generate_all(self.urls, workers=workers, chunk_size=2)
+        return store, stats
+
+    def test_pooled_output_equals_serial(self):
+        serial, serial_stats = self.generate('serial', workers=1)
+        pooled, pooled_stats = self.generate('pooled', workers=3)
+        self.assertEqual(pooled.sources, serial.sources)
+        self.assertEqual(pooled.thumbnails, serial.thumbnails)
+        # Индекс сравнивается выше: порядок ключей в файле зависит от порядка готовности пачек
+        files = sorted(path.name for path in serial.root.iterdir() if path.name != 'manifest.json')
+        self.assertEqual(sorted(path.name for path in pooled.root.iterdir() if path.name != 'manifest.json'), files)
+        for name in files:
+            self.assertEqual((pooled.root / name).read_bytes(), (serial.root / name).read_bytes(), name)
+        self.assertEqual(pooled_stats, serial_stats)
+
+    def test_failing_image_does_not_stop_pool(self):
+        store, stats = self.generate('pooled', workers=3)
+        self.assertEqual([url for url, error in stats['errors']], [self.broken])
+        self.assertIn('UnidentifiedImageError', stats['errors'][0][1])
+        self.assertEqual(len(store.thumbnails), len(self.urls) - 1)
+        paths = [str(self.root / 'media' / 'products' / f'{n}.png') for n in range(5)]
+        results = {
+            item: (result, error)
+            for item, result, error in run_parallel(fingerprint, [*paths, str(self.root / 'missing.png')], 2, 2)
+        }
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(error is None for result, error in map(results.get, paths)))
+        self.assertTrue(results[str(self.root / 'missing.png')][1].startswith('FileNotFoundError'))
+
+
+class ImageSyncTests(TestCase):
+    """Синхронизация media/products → static: только изменённые файлы, удаление сирот"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.source = Path(directory.name) / 'media' / 'products'
+        self.target = Path(directory.name) / 'static' / 'img' / 'products'
+        (self.source / 'nested').mkdir(parents=True)
+        self.write('a.png', b'aaaa')
+        self.write('nested/b.png', b'bbbbbb')
+
+    def write(self, name, content):
+        path = self.source / name
+        previous = path.stat().st_mtime_ns if path.exists() else 0
+        path.write_bytes(content)
+        # Новый mtime и на файловых системах с грубой точностью времени
+        mtime = max(path.stat().st_mtime_ns, previous + 10 ** 9)
+        os.utime(path, ns=(mtime, mtime))
+
+    def run_sync(self, **kwargs):
+        return ImageSync(self.source, self.target).run(workers=1, **kwargs)
+
+    def test_second_run_copies_nothing(self):
+        report = self.run_sync()
+        self.assertEqual(sorted(report.added), ['a.png', 'nested/b.png'])
+        self.assertEqual((self.target / 'nested' / 'b.png').read_bytes(), b'bbbbbb')
+        with mock.patch('catalog.image_sync.fingerprint') as fingerprint, \
+                mock.patch('catalog.image_sync.sync_file') as sync_file:
+            report = self.run_sync()
+        fingerprint.assert_not_called()
+        sync_file.assert_not_called()
+        self.assertFalse(report.changed)
+        self.assertEqual((report.unchanged, report.copied_bytes), (2, 0))
+
+    def test_changed_file_is_refreshed(self):
+        self.run_sync()
+        self.write('a.png', b'AAAA')
+        report = self.run_sync()
+        self.assertEqual(report.updated, ['a.png'])
+        self.assertEqual(report.copied_bytes, 4)
+        self.assertEqual((self.target / 'a.png').read_bytes(), b'AAAA')
+        # То же содержимое с новым mtime - без копирования
+        self.write('a.png', b'AAAA')
+        report = self.run_sync()
+        self.assertEqual((report.touched, report.updated, report.copied_bytes), (['a.png'], [], 0))
+
+    def test_orphans_are_removed(self):
+        self.run_sync()
+        (self.target / 'manual.png').write_bytes(b'manual')
+        (self.source / 'nested' / 'b.png').unlink()
+        self.assertEqual(self.run_sync(dry_run=True).deleted, ['nested/b.png'])
+        self.assertTrue((self.target / 'nested' / 'b.png').exists())
+        report = self.run_sync()
+        self.assertEqual(report.deleted, ['nested/b.png'])
+        self.assertFalse((self.target / 'nested' / 'b.png').exists())
+        # Файлы, которые создала не синхронизация, не трогаем
+        self.assertTrue((self.target / 'manual.png').exists())
+        self.assertFalse(self.run_sync().changed)
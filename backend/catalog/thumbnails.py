@@ -0,0 +1,423 @@
+"""
+Миниатюры изображений товаров: карточка, модальное окно и превью в админке.
+
+Исходник - локальный файл, на который указывает Product.image_url (static или
+media). Для каждого размера создаются варианты 1x и 2x в WebP и JPEG: изображение
+вписывается в квадрат без обрезки и без увеличения. Имя файла - хэш содержимого
+исходника и параметров обработки, поэтому файлы можно кэшировать бессрочно,
+а изменённый исходник получает новые имена.
+
+Индекс (manifest.json в папке миниатюр) хранит для URL исходника (размер, mtime,
+sha256), а для sha256 - готовые варианты с шириной и высотой. При рендере
+миниатюра ищется только в индексе, без обращений к диску; файлы создаёт команда
+generate_thumbnails (только недостающие; --force пересоздаёт и существующие).
+
+Раздача: в production WhiteNoise отдаёт только STATIC_ROOT и индексирует его один
+раз при старте. Поэтому миниатюры создаются на этапе сборки до collectstatic
+(generate_thumbnails --from-files не обращается к базе), а сайт читает собранную
+копию индекса из STATIC_ROOT - один раз, как и WhiteNoise: ссылки ведут только на
+собранные файлы. При WHITENOISE_AUTOREFRESH (по умолчанию в DEBUG) static раздаётся
+из исходных папок, и процессы перечитывают индекс, когда меняется его mtime.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import unquote
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Сторона квадрата, в который вписывается изображение (для 1x), px
+PRESETS = {
+    'card': 310,
+    'modal': 600,
+    'admin': 150,
+}
+DENSITIES = (1, 2)
+# (расширение, формат Pillow, MIME-тип); JPEG - запасной вариант в <img>
+FORMATS = (
+    ('webp', 'WEBP', 'image/webp'),
+    ('jpg', 'JPEG', 'image/jpeg'),
+)
+QUALITY = 82
+# Меняется вместе с алгоритмом обработки: старые имена файлов становятся недействительными
+PIPELINE_VERSION = 1
+MANIFEST_FORMAT = 1
+# Как часто проверять, не обновил ли индекс другой процесс, с
+RELOAD_INTERVAL = 5
+HASH_CHUNK = 1024 * 1024
+
+
+def get_thumbnails_dir():
+    return Path(getattr(settings, 'CATALOG_THUMBNAILS_DIR', Path(settings.BASE_DIR) / 'static' / 'img' / 'thumbs'))
+
+
+def get_thumbnails_url():
+    return getattr(settings, 'CATALOG_THUMBNAILS_URL', f'{settings.STATIC_URL}img/thumbs/')
+
+
+def get_collected_manifest_path():
+    """Индекс в STATIC_ROOT после collectstatic или None, если миниатюры раздаются не из static"""
+    url = get_thumbnails_url()
+    if not settings.STATIC_ROOT or not url.startswith(settings.STATIC_URL):
+        return None
+    return Path(settings.STATIC_ROOT) / url[len(settings.STATIC_URL):] / 'manifest.json'
+
+
+def source_path(url):
+    """Локальный файл для URL изображения товара или None (data:, внешний URL, resize_cache)"""
+    if not url:
+        return None
+    if url.startswith(settings.MEDIA_URL):
+        path = Path(settings.MEDIA_ROOT) / unquote(url[len(settings.MEDIA_URL):])
+        return path if path.is_file() else None
+    if url.startswith(settings.STATIC_URL):
+        from django.contrib.staticfiles import finders
+
+        found = finders.find(unquote(url[len(settings.STATIC_URL):]))
+        return Path(found) if found else None
+    return None
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(path):
+    """[размер, mtime в нс, sha256] файла; задача пула для хэширования"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, file_sha256(path)]
+
+
+def derivative_name(source_sha, preset, density, extension, width, height):
+    """Имя файла варианта: хэш исходника и параметров + размеры"""
+    params = f'{source_sha}:{PRESETS[preset]}:{density}:{extension}:{QUALITY}:{PIPELINE_VERSION}'
+    digest = hashlib.sha256(params.encode('ascii')).hexdigest()[:20]
+    return f'{digest}-{width}x{height}.{extension}'
+
+
+def _prepare(image, image_format):
+    """Изображение в режиме, который поддерживает формат; прозрачность JPEG - на белом фоне"""
+    from PIL import Image
+
+    if image_format == 'JPEG':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        return image.convert('RGB') if image.mode != 'RGB' else image
+    if image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'P') else 'RGB')
+    return image
+
+
+def make_thumbnails(path, source_sha, presets, output_dir, force=False):
+    """Создаёт недостающие (force - все) варианты исходника path; возвращает
+    ({размер: [[density, width, height, {расширение: имя файла}], ...]}, число записанных файлов)"""
+    from PIL import Image, ImageOps
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    records = {}
+    written = 0
+    with Image.open(path) as original:
+        original = ImageOps.exif_transpose(original)
+        original.load()
+        for preset in presets:
+            variants = []
+            previous_size = None
+            for density in DENSITIES:
+                side = PRESETS[preset] * density
+                image = original.copy()
+                image.thumbnail((side, side), Image.Resampling.LANCZOS)
+                # Исходник меньше квадрата: 2x совпал бы с 1x
+                if image.size == previous_size:
+                    break
+                previous_size = image.size
+                width, height = image.size
+                files = {}
+                for extension, image_format, mime_type in FORMATS:
+                    name = derivative_name(source_sha, preset, density, extension, width, height)
+                    files[extension] = name
+                    target = output_dir / name
+                    if target.exists() and not force:
+                        continue
+                    buffer = io.BytesIO()
+                    _prepare(image, image_format).save(buffer, image_format, quality=QUALITY, optimize=True)
+                    tmp_path = target.with_name(f'{name}.{os.getpid()}.tmp')
+                    tmp_path.write_bytes(buffer.getvalue())
+                    os.replace(tmp_path, target)
+                    written += 1
+                variants.append([density, width, height, files])
+            records[preset] = variants
+    return records, written
+
+
+def thumbnail_task(job):
+    """Задача пула: job = (путь исходника, sha256, размеры, папка миниатюр, force)"""
+    path, source_sha, presets, output_dir, force = job
+    return make_thumbnails(path, source_sha, presets, output_dir, force)
+
+
+@dataclass(frozen=True, slots=True)
+class Thumbnail:
+    """Миниатюра для шаблона: JPEG 1x в src, варианты по плотности в srcset"""
+    src: str
+    width: int
+    height: int
+    srcset: str
+    # ((MIME-тип, srcset), ...) для <source> внутри <picture>
+    sources: tuple
+
+
+class ThumbnailStore:
+    """Индекс миниатюр с сохранением на диск. manifest_path - индекс не из папки миниатюр
+    (собранная копия в STATIC_ROOT), reload=False - прочитать его один раз"""
+
+    def __init__(self, root, url, manifest_path=None, reload=True):
+        self.root = Path(root)
+        self.url = url
+        self.manifest_path = Path(manifest_path) if manifest_path else None
+        self.reload = reload
+        self.sources = {}
+        self.thumbnails = {}
+        self.loaded_mtime = None
+        self.checked_at = None
+        self._cache = {}
+        self._lock = threading.RLock()
+
+    @property
+    def path(self):
+        return self.manifest_path or self.root / 'manifest.json'
+
+    def _mtime(self):
+        try:
+            return self.path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self):
+        mtime = self._mtime()
+        data = {}
+        if mtime is not None:
+            try:
+                with open(self.path, encoding='utf-8') as fh:
+                    data = json.load(fh)
+            except (OSError, ValueError):
+                data = {}
+        if data.get('format') != MANIFEST_FORMAT:
+            data = {}
+        with self._lock:
+            self.sources = data.get('sources', {})
+            self.thumbnails = data.get('thumbnails', {})
+            self.loaded_mtime = mtime
+            self.checked_at = time.monotonic()
+            self._cache = {}
+
+    def save(self):
+        """Атомарно записывает индекс на диск"""
+        with self._lock:
+            data = {'format': MANIFEST_FORMAT, 'sources': self.sources, 'thumbnails': self.thumbnails}
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                json.dump(data, fh, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save thumbnails manifest {self.path}: {e}")
+            return
+        with self._lock:
+            self.loaded_mtime = self._mtime()
+            self._cache = {}
+
+    def _ensure_fresh(self):
+        checked_at = self.checked_at
+        if checked_at is not None and (not self.reload or time.monotonic() - checked_at < RELOAD_INTERVAL):
+            return
+        with self._lock:
+            if self.checked_at is not None and time.monotonic() - self.checked_at < RELOAD_INTERVAL:
+                return
+            if self.checked_at is None or self._mtime() != self.loaded_mtime:
+                self.load()
+            self.checked_at = time.monotonic()
+
+    def get(self, url, preset='card'):
+        """Thumbnail для URL исходника или None, если миниатюр ещё нет"""
+        if not url or url.startswith('data:'):
+            return None
+        self._ensure_fresh()
+        key = (url, preset)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        thumbnail = None
+        source = self.sources.get(url)
+        variants = self.thumbnails.get(source[2], {}).get(preset) if source else None
+        if variants:
+            thumbnail = self._make_thumbnail(variants)
+        self._cache[key] = thumbnail
+        return thumbnail
+
+    def _make_thumbnail(self, variants):
+        srcsets = {}
+        for density, width, height, files in variants:
+            for extension, name in files.items():
+                srcsets.setdefault(extension, []).append(f'{self.url}{name} {density}x')
+        density, width, height, files = variants[0]
+        return Thumbnail(
+            src=f'{self.url}{files["jpg"]}',
+            width=width,
+            height=height,
+            srcset=', '.join(srcsets['jpg']),
+            sources=tuple(
+                (mime_type, ', '.join(srcsets[extension]))
+                for extension, image_format, mime_type in FORMATS
+                if extension != 'jpg' and extension in srcsets
+            ),
+        )
+
+    def is_current(self, url, path):
+        """Запись исходника совпадает с размером и mtime файла - хэш пересчитывать не нужно"""
+        entry = self.sources.get(url)
+        if not entry:
+            return False
+        stat = os.stat(path)
+        return entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns
+
+    def source_sha(self, url, path):
+        """sha256 исходника; файл перечитывается только при смене размера или mtime"""
+        if not self.is_current(url, path):
+            entry = fingerprint(path)
+            with self._lock:
+                self.sources[url] = entry
+        return self.sources[url][2]
+
+    def missing_presets(self, sha, presets=None):
+        """Размеры, для которых у исходника нет записи или файлов на диске"""
+        recorded = self.thumbnails.get(sha, {})
+        missing = []
+        for preset in presets or PRESETS:
+            variants = recorded.get(preset)
+            if not variants or not all(
+                (self.root / name).exists() for variant in variants for name in variant[3].values()
+            ):
+                missing.append(preset)
+        return missing
+
+    def record(self, sha, records):
+        with self._lock:
+            self.thumbnails.setdefault(sha, {}).update(records)
+            self._cache = {}
+
+    def generate(self, url, presets=None, force=False):
+        """Создаёт недостающие миниатюры исходника url; возвращает число записанных файлов
+        или None, если локального исходника нет. Индекс не перечитывается с диска и не
+        сохраняется - это делает вызывающий код (load() до, save() после)"""
+        path = source_path(url)
+        if path is None:
+            return None
+        sha = self.source_sha(url, path)
+        missing = list(presets or PRESETS) if force else self.missing_presets(sha, presets)
+        if not missing:
+            return 0
+        records, written = make_thumbnails(path, sha, missing, self.root, force)
+        self.record(sha, records)
+        return written
+
+    def generate_all(self, urls, presets=None, force=False, workers=None, chunk_size=None, progress=None):
+        """generate() для многих исходников в пуле процессов (catalog.image_pool): сначала
+        хэши изменившихся файлов, затем миниатюры уникальных исходников. Индекс сохраняется
+        контрольными точками, поэтому прерванный запуск продолжается без повторной работы.
+        progress(название этапа) возвращает колбэк run_parallel. Возвращает счётчики и
+        список (url, ошибка)"""
+        from .image_pool import DEFAULT_CHUNK_SIZE, Checkpoint, run_parallel
+
+        presets = list(presets or PRESETS)
+        chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+        checkpoint = Checkpoint(self.save)
+        stats = {'sources': 0, 'without_source': 0, 'hashed': 0, 'up_to_date': 0, 'written': 0, 'errors': []}
+
+        paths = {}
+        for url in dict.fromkeys(urls):
+            stats['sources'] += 1
+            path = source_path(url)
+            if path is None:
+                stats['without_source'] += 1
+            else:
+                paths[url] = str(path)
+
+        stale = {path: url for url, path in paths.items() if not self.is_current(url, path)}
+        for path, entry, error in run_parallel(
+            fingerprint, stale, workers, chunk_size, progress and progress('Хэши исходников'),
+        ):
+            if error:
+                stats['errors'].append((stale[path], error))
+                del paths[stale[path]]
+                continue
+            with self._lock:
+                self.sources[stale[path]] = entry
+            stats['hashed'] += 1
+            checkpoint()
+
+        jobs = {}
+        urls_by_sha = {}
+        for url, path in paths.items():
+            sha = self.sources[url][2]
+            urls_by_sha.setdefault(sha, []).append(url)
+            if sha in jobs:
+                continue
+            missing = presets if force else self.missing_presets(sha, presets)
+            if missing:
+                jobs[sha] = (path, sha, tuple(missing), str(self.root), force)
+        stats['up_to_date'] = sum(len(urls) for sha, urls in urls_by_sha.items() if sha not in jobs)
+
+        for job, result, error in run_parallel(
+            thumbnail_task, jobs.values(), workers, chunk_size,
+            progress and progress('Миниатюры'),
+        ):
+            if error:
+                stats['errors'].extend((url, error) for url in urls_by_sha[job[1]])
+                continue
+            records, written = result
+            self.record(job[1], records)
+            stats['written'] += written
+            checkpoint()
+        self.save()
+        return stats
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_thumbnails():
+    """Общий для процесса индекс миниатюр"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                collected = None
+                if not getattr(settings, 'WHITENOISE_AUTOREFRESH', settings.DEBUG):
+                    collected = get_collected_manifest_path()
+                _store = ThumbnailStore(
+                    get_thumbnails_dir(), get_thumbnails_url(), manifest_path=collected, reload=collected is None,
+                )
+    return _store
+
+
+def get_thumbnail(url, preset='card'):
+    return get_thumbnails().get(url, preset)
@@ -0,0 +1,204 @@
+"""
+Closure-таблица дерева каталога: Category → Subcategory → Section → Subsection.
+
+Каждый объект дерева копируется в CatalogNode, а CatalogTreePath хранит все пары
+(предок, потомок, глубина), включая узел сам себе. Поэтому хлебные крошки, поддерево
+и меню - один запрос без вложенных prefetch. Узлы и пути обновляются сигналами при
+сохранении и удалении; при переносе узла переписываются только пути его поддерева.
+
+Записи в обход save() зеркало не видит:
+- QuerySet.update() - после него вызывается sync_nodes(модель, id), как в массовых
+  действиях админки (id читаются до update(), иначе фильтр по изменённому полю
+  вернёт пустой список);
+- loaddata сохраняет объекты с raw=True - сигнал откладывает одну пересборку дерева
+  до фиксации транзакции (rebuild_after_commit);
+- raw SQL и правки в консоли базы - команда rebuild_catalog_tree; с --check она
+  только сообщает о расхождениях (tree_problems).
+"""
+from django.apps import apps as global_apps
+from django.db import connection, transaction
+
+from .models import CatalogNode, CatalogTreePath
+
+# Модель → (уровень, поле родителя)
+TREE_MODELS = {
+    'Category': (CatalogNode.Level.CATEGORY, None),
+    'Subcategory': (CatalogNode.Level.SUBCATEGORY, 'category'),
+    'Section': (CatalogNode.Level.SECTION, 'subcategory'),
+    'Subsection': (CatalogNode.Level.SUBSECTION, 'section'),
+}
+NODE_FIELDS = ('title', 'slug', 'description', 'is_active', 'order')
+
+
+def _node_values(instance):
+    return {name: getattr(instance, name) for name in NODE_FIELDS}
+
+
+def _link(parent, subtree):
+    """Связывает поддерево [(id узла, глубина от корня поддерева)] со всеми предками parent"""
+    if parent is None:
+        return
+    ancestors = list(CatalogTreePath.objects.filter(descendant=parent).values_list('ancestor_id', 'depth'))
+    CatalogTreePath.objects.bulk_create([
+        CatalogTreePath(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=ancestor_depth + 1 + depth)
+        for ancestor_id, ancestor_depth in ancestors
+        for descendant_id, depth in subtree
+    ])
+
+
+def sync_node(instance):
+    """Создаёт или обновляет узел объекта дерева; при смене родителя переносит поддерево"""
+    level, parent_field = TREE_MODELS[instance._meta.object_name]
+    with transaction.atomic():
+        parent = None
+        if parent_field:
+            parent_id = getattr(instance, f'{parent_field}_id')
+            parent = CatalogNode.objects.filter(level=level - 1, object_id=parent_id).first()
+            if parent is None:
+                parent = sync_node(getattr(instance, parent_field))
+
+        values = _node_values(instance)
+        node = CatalogNode.objects.filter(level=level, object_id=instance.pk).first()
+        if node is None:
+            node = CatalogNode.objects.create(level=level, object_id=instance.pk, parent=parent, **values)
+            CatalogTreePath.objects.create(ancestor=node, descendant=node, depth=0)
+            _link(parent, [(node.pk, 0)])
+            return node
+
+        changed = [name for name, value in values.items() if getattr(node, name) != value]
+        for name in changed:
+            setattr(node, name, values[name])
+        moved = node.parent_id != (parent.pk if parent else None)
+        if moved:
+            node.parent = parent
+            changed.append('parent')
+        if changed:
+            node.save(update_fields=changed)
+        if moved:
+            # Пути внутри поддерева не меняются; пути от старых предков заменяются новыми
+            subtree = list(CatalogTreePath.objects.filter(ancestor=node).values_list('descendant_id', 'depth'))
+            subtree_ids = [descendant_id for descendant_id, depth in subtree]
+            CatalogTreePath.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+            _link(parent, subtree)
+        return node
+
+
+def sync_nodes(model, pks):
+    """sync_node для объектов model с id из pks - после массовых update() в обход сигналов"""
+    for instance in model.objects.filter(pk__in=pks):
+        sync_node(instance)
+
+
+def delete_node(instance):
+    """Удаляет узел объекта; дочерние узлы и пути удаляются каскадом"""
+    level = TREE_MODELS[instance._meta.object_name][0]
+    CatalogNode.objects.filter(level=level, object_id=instance.pk).delete()
+
+
+def rebuild_tree(apps=global_apps):
+    """Пересобирает узлы и closure-таблицу по четырём моделям дерева"""
+    node_model = apps.get_model('catalog', 'CatalogNode')
+    path_model = apps.get_model('catalog', 'CatalogTreePath')
+    with transaction.atomic():
+        path_model.objects.all().delete()
+        node_model.objects.all().delete()
+        nodes = {}
+        ancestors = {}
+        for model_name, (level, parent_field) in TREE_MODELS.items():
+            model = apps.get_model('catalog', model_name)
+            objects = list(model.objects.all())
+            created = node_model.objects.bulk_create([
+                node_model(
+                    level=level,
+                    object_id=instance.pk,
+                    parent_id=nodes[(level - 1, getattr(instance, f'{parent_field}_id'))] if parent_field else None,
+                    **_node_values(instance),
+                )
+                for instance in objects
+            ])
+            paths = []
+            for instance, node in zip(objects, created):
+                nodes[(level, instance.pk)] = node.pk
+                node_ancestors = [(node.pk, 0)]
+                if node.parent_id:
+                    node_ancestors += [(ancestor_id, depth + 1) for ancestor_id, depth in ancestors[node.parent_id]]
+                ancestors[node.pk] = node_ancestors
+                paths += [
+                    path_model(ancestor_id=ancestor_id, descendant_id=node.pk, depth=depth)
+                    for ancestor_id, depth in node_ancestors
+                ]
+            path_model.objects.bulk_create(paths, batch_size=1000)
+    return len(nodes)
+
+
+def _rebuild_on_commit():
+    rebuild_tree()
+
+
+def rebuild_after_commit():
+    """Одна пересборка дерева после фиксации текущей транзакции, сколько бы раз ни вызывали"""
+    if any(func is _rebuild_on_commit for sids, func, robust in connection.run_on_commit):
+        return
+    transaction.on_commit(_rebuild_on_commit)
+
+
+def tree_problems():
+    """Расхождения узлов и путей с четырьмя моделями дерева; пустой список - зеркало актуально"""
+    problems = []
+    nodes = {(node.level, node.object_id): node for node in CatalogNode.objects.all()}
+    keys = {node.pk: key for key, node in nodes.items()}
+    path_counts = {}
+    for descendant_id in CatalogTreePath.objects.values_list('descendant_id', flat=True):
+        path_counts[descendant_id] = path_counts.get(descendant_id, 0) + 1
+    seen = set()
+    for model_name, (level, parent_field) in TREE_MODELS.items():
+        for instance in global_apps.get_model('catalog', model_name).objects.all():
+            label = f'{model_name} #{instance.pk}'
+            seen.add((level, instance.pk))
+            node = nodes.get((level, instance.pk))
+            if node is None:
+                problems.append(f'{label}: нет узла')
+                continue
+            changed = [name for name, value in _node_values(instance).items() if getattr(node, name) != value]
+            if changed:
+                problems.append(f'{label}: устарели поля {", ".join(changed)}')
+            if parent_field and keys.get(node.parent_id) != (level - 1, getattr(instance, f'{parent_field}_id')):
+                problems.append(f'{label}: неверный родитель')
+            # Путь к себе и к каждому предку
+            if path_counts.get(node.pk, 0) != level:
+                problems.append(f'{label}: путей {path_counts.get(node.pk, 0)} вместо {level}')
+    for level, object_id in sorted(nodes.keys() - seen):
+        problems.append(f'Лишний узел: уровень {level}, объект #{object_id}')
+    return problems
+
+
+def breadcrumbs(level, object_id):
+    """Узлы от корня до заданного включительно (один запрос)"""
+    return list(
+        CatalogNode.objects.filter(
+            descendant_paths__descendant__level=level,
+            descendant_paths__descendant__object_id=object_id,
+        ).order_by('-descendant_paths__depth')
+    )
+
+
+def subtree_object_ids(level, object_id, descendant_level=CatalogNode.Level.SECTION):
+    """Подзапрос: id объектов уровня descendant_level в поддереве узла (включая сам узел)"""
+    return CatalogTreePath.objects.filter(
+        ancestor__level=level,
+        ancestor__object_id=object_id,
+        descendant__level=descendant_level,
+    ).values('descendant__object_id')
+
+
+def subtree_products(level, object_id):
+    """Товары поддерева любого уровня (один запрос)"""
+    from .models import Product
+
+    return Product.objects.filter(section_id__in=subtree_object_ids(level, object_id))
+
+
+def active_nodes(max_level=CatalogNode.Level.SECTION):
+    """Активные узлы до уровня max_level в порядке меню (один запрос); у узла
+    с неактивным предком нет родителя среди результатов"""
+    return CatalogNode.objects.filter(is_active=True, level__lte=max_level).order_by('level', 'order', 'title')
@@ -0,0 +1,192 @@
+"""
+Подсказки при вводе маркировки («КА-15», «ВС-70/95»): отсортированный массив ключей
+и bisect по префиксу.
+
+Ключ - название или SKU товара в нормализованном виде (как в catalog.search) без
+пробелов, дефисов и подчёркиваний, поэтому «ка-15», «КА 15» и «ка15» дают одно и то
+же. Название индексируется и с каждого следующего слова: «Наконечник ТМЛ 16-8»
+находится по «тмл 16». Подсказки упорядочены по популярности - числу заказов
+с этой маркировкой (OrderItem.product_sku), затем по названию.
+
+Товары пронумерованы в порядке популярности, и каждому ключу соответствует номер
+товара, поэтому лучшие N подсказок - это N наименьших номеров в диапазоне ключей.
+Для коротких префиксов диапазон велик, и ответы для них вычисляются при построении;
+остальные диапазоны не длиннее SCAN_LIMIT просматриваются при запросе.
+
+Построение занимает секунды на большом каталоге, поэтому идёт в фоновом потоке:
+пока новая структура не готова, запросы обслуживает прежняя.
+"""
+import heapq
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from itertools import groupby
+
+from django.db import connections
+from django.db.models import Count
+
+from .search import PREFIX_END, normalize_text
+from .snapshot import get_catalog_version, get_snapshot
+
+logger = logging.getLogger(__name__)
+
+MAX_SUGGESTIONS = 10
+SCAN_LIMIT = 64
+# С скольких слов названия начинать ключи («Наконечник ТМЛ 16-8» → «ТМЛ168», «168»)
+TITLE_KEY_WORDS = 4
+# Популярность пересчитывается не чаще, чем раз в POPULARITY_TTL секунд
+POPULARITY_TTL = 300
+
+_SEPARATORS_RE = re.compile(r'[\s\-_]+')
+
+
+def make_key(value):
+    """Нормализованный ключ без пробелов и дефисов"""
+    return _SEPARATORS_RE.sub('', normalize_text(value))
+
+
+def _title_keys(title):
+    words = normalize_text(title).split()
+    return {make_key(' '.join(words[start:])) for start in range(min(len(words), TITLE_KEY_WORDS))}
+
+
+def get_popularity():
+    """SKU → число заказов с этой маркировкой"""
+    from .models import OrderItem
+
+    return dict(
+        OrderItem.objects.exclude(product_sku='')
+        .values_list('product_sku')
+        .annotate(orders=Count('order_id', distinct=True))
+        .values_list('product_sku', 'orders')
+    )
+
+
+class Typeahead:
+    """Неизменяемая структура подсказок; suggestions - кортежи в порядке популярности"""
+
+    def __init__(self, items, popularity=None):
+        """items - (sku, title, payload); payload возвращается в подсказках"""
+        popularity = popularity or {}
+        items = sorted(items, key=lambda item: (-popularity.get(item[0], 0), item[1], item[0]))
+        self.suggestions = tuple(
+            (sku, title, popularity.get(sku, 0), payload) for sku, title, payload in items
+        )
+        pairs = set()
+        for rank, (sku, title, payload) in enumerate(items):
+            for key in _title_keys(title) | {make_key(sku)}:
+                if key:
+                    pairs.add((key, rank))
+        pairs = sorted(pairs)
+        self.keys = [key for key, rank in pairs]
+        self.ranks = [rank for key, rank in pairs]
+        self.top = self._precompute_top()
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def _precompute_top(self):
+        """Лучшие подсказки для каждого префикса, чей диапазон длиннее SCAN_LIMIT"""
+        top = {}
+        length = 1
+        while True:
+            large = False
+            start = 0
+            for prefix, group in groupby(self.keys, key=lambda key: key[:length]):
+                size = sum(1 for _ in group)
+                # Группа одинаковых ключей короче length уже учтена на прошлых шагах
+                if size > SCAN_LIMIT and len(prefix) == length:
+                    large = True
+                    top[prefix] = tuple(heapq.nsmallest(MAX_SUGGESTIONS, set(self.ranks[start:start + size])))
+                start += size
+            if not large:
+                return top
+            length += 1
+
+    def complete(self, prefix, limit=MAX_SUGGESTIONS):
+        """До limit подсказок, чьё название или SKU начинается с prefix"""
+        key = make_key(prefix)
+        if not key:
+            return []
+        ranks = self.top.get(key)
+        if ranks is None:
+            # Префикса нет в таблице - значит, диапазон не длиннее SCAN_LIMIT
+            start = bisect_left(self.keys, key)
+            end = bisect_left(self.keys, key + PREFIX_END, start)
+            ranks = heapq.nsmallest(limit, set(self.ranks[start:end]))
+        return [self.suggestions[rank] for rank in ranks[:limit]]
+
+
+class CatalogTypeahead:
+    """Подсказки по активным товарам, перестраиваемые в фоне при изменении каталога
+    или популярности"""
+
+    def __init__(self):
+        self.typeahead = None
+        self.version = None
+        self.built_at = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def is_fresh(self, version):
+        return (
+            self.typeahead is not None
+            and self.version == version
+            and time.monotonic() - self.built_at < POPULARITY_TTL
+        )
+
+    def build(self):
+        """Строит подсказки по текущему снимку каталога и подменяет ими прежние"""
+        snapshot = get_snapshot()
+        typeahead = Typeahead(
+            (
+                (product.sku, product.title, product)
+                for product in snapshot.products
+                # Товары неактивных разделов, как и в поиске, не подсказываются
+                if product.section_id in snapshot.sections
+            ),
+            get_popularity(),
+        )
+        self.version = snapshot.version
+        self.built_at = time.monotonic()
+        self.typeahead = typeahead
+        return typeahead
+
+    def _run(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Could not build typeahead index')
+        finally:
+            # Соединения с базой у каждого потока свои
+            connections.close_all()
+            with self.lock:
+                self.thread = None
+
+    def refresh(self):
+        """Запускает перестройку в фоновом потоке, если она ещё не идёт"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='typeahead', daemon=True)
+                self.thread.start()
+
+    def get(self):
+        """Текущие подсказки (None до окончания первой сборки). Устаревшие перестраиваются
+        в фоне, а до тех пор отвечают прежние"""
+        if not self.is_fresh(get_catalog_version()):
+            self.refresh()
+        return self.typeahead
+
+
+_typeahead = CatalogTypeahead()
+
+
+def complete(prefix, limit=MAX_SUGGESTIONS):
+    """[(sku, title, число заказов, product), ...] для введённого префикса;
+    None, пока подсказки ещё строятся"""
+    typeahead = _typeahead.get()
+    if typeahead is None:
+        return None
+    return typeahead.complete(prefix, limit)
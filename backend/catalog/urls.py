@@ -9,7 +9,14 @@ from .views import (
     CartClearView,
     OrderCreateView,
     ProductDetailView,
+    ProductDetailBatchView,
     SectionProductsView,
+    SectionProductsBatchView,
+    ProductFilterView,
+    SearchView,
+    TypeaheadView,
+    CacheStatsView,
+    ResizeCacheView,
 )
 
 app_name = 'catalog'
@@ -23,6 +30,17 @@ urlpatterns = [
     path('api/cart/clear/', CartClearView.as_view(), name='cart-clear'),
     path('api/orders/', OrderCreateView.as_view(), name='order-create'),
     path('api/product/detail/', ProductDetailView.as_view(), name='product-detail'),
+    path('api/product/detail/batch/', ProductDetailBatchView.as_view(), name='product-detail-batch'),
     path('api/section/products/', SectionProductsView.as_view(), name='section-products'),
+    path('api/section/products/batch/', SectionProductsBatchView.as_view(), name='section-products-batch'),
+    path('api/products/filter/', ProductFilterView.as_view(), name='product-filter'),
+    path('api/search/', SearchView.as_view(), name='search'),
+    path('api/search/suggest/', TypeaheadView.as_view(), name='search-suggest'),
+    path('api/cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path(
+        'upload/resize_cache/iblock/<str:code>/<int:width>_<int:height>_<int:mode>/<str:filename>',
+        ResizeCacheView.as_view(),
+        name='resize-cache',
+    ),
 ]
 
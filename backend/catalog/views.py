@@ -1,16 +1,31 @@
+import hashlib
 import json
+import os
 
 from decimal import Decimal, InvalidOperation
 
-from django.http import JsonResponse, HttpResponse
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, JsonResponse, HttpResponse
 from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
 from django.views.generic import TemplateView
-from django.template.loader import render_to_string
 
-from django.db.models import Prefetch
-
-from .models import Lead, Order, OrderItem, Category, Subcategory, Section, Subsection, Product
+from .models import Lead, Order, OrderItem, Product
+from .facets import FACETS, filter_products
+from .fragments import get_fragments_generation, get_section_version
+from .modal_cache import get_modal_cache_stats, render_product_modal
+from .page_cache import get_cached_page, punch_csrf_token, render_page
+from .pagination import InvalidCursor, get_section_page
+from .resize_cache import ResizeError, content_type, get_resize_cache, is_valid_request
+from .search import get_search_cache_stats, make_snippet, search_products
+from .snapshot import get_catalog_modified, get_catalog_version, get_snapshot
+from .typeahead import MAX_SUGGESTIONS, complete
 
 
 def _get_cart(session):
@@ -81,42 +96,139 @@ def _cart_totals(cart):
     }
 
 
+def _etag(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def _index_variant():
+    return 'lazy' if getattr(settings, 'CATALOG_LAZY_INDEX', False) else 'full'
+
+
+# Валидаторы для условных GET-запросов: считаются по версиям из кэша и снимку каталога,
+# поэтому ответ 304 отдаётся без запросов к БД и рендера шаблонов
+
+def _index_etag(request, *args, **kwargs):
+    return _etag('index', get_catalog_version(), get_fragments_generation(), _index_variant())
+
+
+def _catalog_last_modified(request, *args, **kwargs):
+    return get_catalog_modified()
+
+
+def _section_products_etag(request, *args, **kwargs):
+    try:
+        section_id = int(request.GET.get('section_id'))
+    except (TypeError, ValueError):
+        return None
+    return _etag(
+        'section', section_id, get_section_version(section_id), get_fragments_generation(),
+        request.GET.get('offset', 0), request.GET.get('limit', 9), request.GET.get('cursor', ''),
+    )
+
+
+BATCH_MAX_SECTIONS = 50
+BATCH_MAX_PRODUCTS = 50
+SECTION_MAX_LIMIT = 50
+SEARCH_MAX_LIMIT = 50
+FILTER_MAX_LIMIT = 50
+# Фасеты, значения которых - id узлов дерева каталога
+FILTER_ID_FACETS = ('category', 'subcategory', 'section')
+TYPEAHEAD_MAX_AGE = 60
+# Уменьшенные изображения не меняются по тому же URL
+RESIZE_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def _parse_page(offset, limit, max_limit):
+    """(offset >= 0, 1 <= limit <= max_limit) из параметров запроса; ValueError для нечисла"""
+    return max(int(offset), 0), min(max(int(limit), 1), max_limit)
+
+
+def _parse_batch_section_ids(request):
+    section_ids = []
+    for value in request.GET.get('section_ids', '').split(','):
+        try:
+            section_id = int(value)
+        except ValueError:
+            continue
+        if section_id not in section_ids:
+            section_ids.append(section_id)
+    return section_ids[:BATCH_MAX_SECTIONS]
+
+
+def _section_products_batch_etag(request, *args, **kwargs):
+    section_ids = _parse_batch_section_ids(request)
+    if not section_ids:
+        return None
+    return _etag(
+        'sections', get_fragments_generation(), request.GET.urlencode(),
+        *(get_section_version(section_id) for section_id in section_ids),
+    )
+
+
+def _get_detail_product(request):
+    sku = request.GET.get('id') or request.GET.get('sku')
+    if not sku:
+        return None
+    return get_snapshot().get_product(sku)
+
+
+def _product_detail_etag(request, *args, **kwargs):
+    product = _get_detail_product(request)
+    if product is None:
+        return None
+    return _etag('product', product.pk, product.updated_at.timestamp(), get_fragments_generation())
+
+
+def _product_detail_last_modified(request, *args, **kwargs):
+    product = _get_detail_product(request)
+    return product.updated_at if product is not None else None
+
+
+def _get_batch_products(request):
+    """(товары, ненайденные SKU) для ?id=...&id=..."""
+    snapshot = get_snapshot()
+    products, missing = [], []
+    for sku in list(dict.fromkeys(request.GET.getlist('id')))[:BATCH_MAX_PRODUCTS]:
+        product = snapshot.get_product(sku)
+        if product is None:
+            missing.append(sku)
+        else:
+            products.append(product)
+    return products, missing
+
+
+@method_decorator(vary_on_cookie, name='get')
+@method_decorator(condition(etag_func=_index_etag, last_modified_func=_catalog_last_modified), name='get')
 class FrontendIndexView(TemplateView):
     template_name = 'catalog/index.html'
 
     def get(self, request, *args, **kwargs):
-        get_token(request)
-        context = self.get_context_data()
-        return self.render_to_response(context)
+        token = get_token(request)
+        # Страница одинакова для всех, кроме CSRF-токена: отдаём из кэша и подставляем токен
+        variant = _index_variant()
+        # Авторизованные (сотрудники из админки) - мимо общего кэша страницы
+        shared = not request.user.is_authenticated
+        content = get_cached_page('index', variant) if shared else None
+        if content is None:
+            context = self.get_context_data()
+            content = render_page('index', self.template_name, context, request, variant, store=shared)
+        return HttpResponse(punch_csrf_token(content, token))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
         try:
-            # Создаем queryset для активных товаров
-            active_products = Product.objects.filter(is_active=True).order_by('order', 'title')
-            
-            # Загружаем все активные категории с вложенными уровнями и товарами
-            all_categories = Category.objects.filter(is_active=True).prefetch_related(
-                Prefetch(
-                    'subcategories',
-                    queryset=Subcategory.objects.filter(is_active=True).order_by('order', 'title').prefetch_related(
-                        Prefetch(
-                            'sections',
-                            queryset=Section.objects.filter(is_active=True).order_by('order', 'title').prefetch_related(
-                                Prefetch('products', queryset=active_products)
-                            )
-                        )
-                    )
-                )
-            ).order_by('order', 'title')
+            # Дерево каталога и товары берём из снимка: в установившемся режиме без запросов к БД
+            snapshot = get_snapshot()
             
-            # Собираем все товары для отображения на странице
-            all_products = list(active_products.select_related('section__subcategory__category'))
+            lazy_catalog = getattr(settings, 'CATALOG_LAZY_INDEX', False)
             
-            context['categories'] = all_categories
-            context['root_categories'] = all_categories  # Для совместимости со старыми шаблонами
-            context['all_products'] = all_products
+            context['categories'] = snapshot.categories
+            context['root_categories'] = snapshot.categories  # Для совместимости со старыми шаблонами
+            # В ленивом режиме карточки товаров не попадают в HTML главной
+            context['all_products'] = () if lazy_catalog else snapshot.products
+            context['lazy_catalog'] = lazy_catalog
+            context['catalog_version'] = snapshot.version
         except Exception as e:
             # Если ошибка с базой данных, возвращаем пустые списки
             context['categories'] = []
@@ -330,58 +442,303 @@ class OrderCreateView(View):
         }, status=201)
 
 
+@method_decorator(
+    condition(etag_func=_product_detail_etag, last_modified_func=_product_detail_last_modified),
+    name='get',
+)
 class ProductDetailView(View):
     http_method_names = ['get']
 
     def get(self, request, *args, **kwargs):
-        sku = request.GET.get('id') or request.GET.get('sku')
-        if not sku:
-            return HttpResponse('Товар не найден', status=404)
-        
-        try:
-            product = Product.objects.get(sku=sku, is_active=True)
-        except Product.DoesNotExist:
+        # Активные товары есть в снимке каталога, запрос к БД не нужен
+        product = _get_detail_product(request)
+        if product is None:
             return HttpResponse('Товар не найден', status=404)
         
-        html = render_to_string('catalog/product_detail.html', {
-            'product': product,
-        }, request=request)
-        
-        return HttpResponse(html)
+        # HTML модального окна берётся из кэша по SKU и updated_at
+        return HttpResponse(render_product_modal(product))
+
 
+class ProductDetailBatchView(View):
+    """Модальные окна нескольких товаров одним запросом (?id=SKU1&id=SKU2),
+    чтобы фронтенд мог заранее загрузить окна видимых карточек"""
+    http_method_names = ['get']
 
+    def get(self, request, *args, **kwargs):
+        products, missing = _get_batch_products(request)
+        if not products and not missing:
+            return JsonResponse({'success': False, 'message': 'Не указаны товары'}, status=400)
+        return JsonResponse({
+            'success': True,
+            'modals': {product.sku: render_product_modal(product) for product in products},
+            'missing': missing,
+        })
+
+
+@method_decorator(
+    condition(etag_func=_section_products_etag, last_modified_func=_catalog_last_modified),
+    name='get',
+)
 class SectionProductsView(View):
     """AJAX endpoint для загрузки товаров раздела с пагинацией"""
     http_method_names = ['get']
 
     def get(self, request, *args, **kwargs):
         section_id = request.GET.get('section_id')
-        offset = int(request.GET.get('offset', 0))
-        limit = int(request.GET.get('limit', 9))
+        try:
+            offset, limit = _parse_page(request.GET.get('offset', 0), request.GET.get('limit', 9), SECTION_MAX_LIMIT)
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Некорректные offset или limit'}, status=400)
+        # Курсор (next_cursor из предыдущего ответа) имеет приоритет над offset
+        cursor = request.GET.get('cursor')
         
         if not section_id:
             return JsonResponse({'success': False, 'message': 'Не указан раздел'}, status=400)
         
+        # HTML карточек берётся из кэша фрагментов раздела
         try:
-            section = Section.objects.get(id=section_id, is_active=True)
-        except Section.DoesNotExist:
+            page = get_section_page(section_id, offset, limit, cursor=cursor)
+        except InvalidCursor:
+            return JsonResponse({'success': False, 'message': 'Некорректный курсор'}, status=400)
+        if page is None:
             return JsonResponse({'success': False, 'message': 'Раздел не найден'}, status=404)
         
-        # Получаем товары с пагинацией
-        products = section.products.filter(is_active=True).order_by('order', 'title')[offset:offset + limit]
-        total_count = section.products.filter(is_active=True).count()
-        
-        # Рендерим HTML для товаров
-        products_html = render_to_string('catalog/_product_list.html', {
-            'products': products,
-        }, request=request)
-        
-        has_more = (offset + limit) < total_count
-        
+        return JsonResponse({'success': True, **page.as_dict()})
+
+
+@method_decorator(
+    condition(etag_func=_section_products_batch_etag, last_modified_func=_catalog_last_modified),
+    name='get',
+)
+class SectionProductsBatchView(View):
+    """Первые (или следующие) страницы нескольких разделов одним запросом.
+
+    ?section_ids=1,2,3&limit=9 - общие параметры; для отдельного раздела можно
+    передать cursor_<id>, offset_<id> и limit_<id>.
+    """
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        section_ids = _parse_batch_section_ids(request)
+        if not section_ids:
+            return JsonResponse({'success': False, 'message': 'Не указаны разделы'}, status=400)
+
+        try:
+            default_limit = _parse_page(0, request.GET.get('limit', 9), SECTION_MAX_LIMIT)[1]
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Некорректный limit'}, status=400)
+
+        # Все разделы отдаются из одного снимка каталога
+        snapshot = get_snapshot()
+        sections = {}
+        missing = []
+        for section_id in section_ids:
+            try:
+                offset, limit = _parse_page(
+                    request.GET.get(f'offset_{section_id}', 0),
+                    request.GET.get(f'limit_{section_id}', default_limit),
+                    SECTION_MAX_LIMIT,
+                )
+                page = get_section_page(
+                    section_id, offset, limit,
+                    cursor=request.GET.get(f'cursor_{section_id}'),
+                    snapshot=snapshot,
+                )
+            except (ValueError, InvalidCursor):
+                return JsonResponse(
+                    {'success': False, 'message': f'Некорректные параметры раздела {section_id}'},
+                    status=400,
+                )
+            if page is None:
+                missing.append(section_id)
+            else:
+                sections[str(section_id)] = page.as_dict()
+
+        return JsonResponse({'success': True, 'sections': sections, 'missing': missing})
+
+
+def _filter_etag(request, *args, **kwargs):
+    return _etag('filter', get_catalog_version(), get_fragments_generation(), request.GET.urlencode())
+
+
+def _parse_filters(request):
+    selected = {}
+    for facet in FACETS:
+        values = request.GET.getlist(facet)
+        if facet in FILTER_ID_FACETS:
+            values = [int(value) for value in values if value.isdigit()]
+        values = [value for value in values if value != '']
+        if values:
+            selected[facet] = values
+    return selected
+
+
+def _parse_decimal_param(request, name):
+    """Decimal из параметра запроса или None; ValueError для нечисла"""
+    value = (request.GET.get(name) or '').strip().replace(',', '.')
+    if not value:
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(name)
+    if not number.is_finite():
+        raise ValueError(name)
+    return number
+
+
+def _range_product_ids(request):
+    """id товаров по числовым диапазонам (индексы wire_section_min/max, load_limit_kn)
+    или None, если диапазоны не заданы"""
+    wire_mm2 = _parse_decimal_param(request, 'wire_mm2')
+    load_min = _parse_decimal_param(request, 'load_min')
+    load_max = _parse_decimal_param(request, 'load_max')
+    if wire_mm2 is None and load_min is None and load_max is None:
+        return None
+    queryset = Product.objects.all()
+    if wire_mm2 is not None:
+        queryset = queryset.for_wire_section(wire_mm2)
+    if load_min is not None or load_max is not None:
+        queryset = queryset.with_load_limit(load_min, load_max)
+    # Порядок не нужен: страницу сортирует фасетный индекс
+    return set(queryset.order_by().values_list('id', flat=True))
+
+
+@method_decorator(condition(etag_func=_filter_etag, last_modified_func=_catalog_last_modified), name='get')
+class ProductFilterView(View):
+    """Фасетный фильтр: /api/products/filter/?wire_section=16-25&price=1000-5000&offset=0&limit=9.
+    Значения одного фасета можно передать несколько раз; в ответе - HTML карточек
+    страницы и счётчики всех фасетов. Числовые диапазоны: wire_mm2=70 (подходит для
+    провода 70 мм²), load_min и load_max (предельная нагрузка, кН)"""
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        try:
+            offset, limit = _parse_page(request.GET.get('offset', 0), request.GET.get('limit', 9), FILTER_MAX_LIMIT)
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Некорректные offset или limit'}, status=400)
+        try:
+            product_ids = _range_product_ids(request)
+        except ValueError as e:
+            return JsonResponse({'success': False, 'message': f'Некорректное значение {e}'}, status=400)
+
+        result = filter_products(_parse_filters(request), offset, limit, product_ids)
+        html = render_to_string('catalog/_product_list.html', {'products': result.products, 'loading': 'lazy'})
+        return JsonResponse({
+            'success': True,
+            'html': html,
+            'total_count': result.total_count,
+            'loaded_count': offset + len(result.products),
+            'has_more': result.has_more,
+            'facets': result.facets,
+        })
+
+
+class SearchView(View):
+    """Поиск товаров: /api/search/?q=зан-1500&limit=20"""
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        query = (request.GET.get('q') or '').strip()
+        try:
+            limit = min(max(int(request.GET.get('limit', 20)), 1), SEARCH_MAX_LIMIT)
+        except ValueError:
+            limit = 20
+
+        total, results = search_products(query, limit) if query else (0, [])
         return JsonResponse({
             'success': True,
-            'html': products_html,
-            'has_more': has_more,
-            'total_count': total_count,
-            'loaded_count': offset + len(products),
+            'query': query,
+            'total': total,
+            'results': [
+                {
+                    'id': product.pk,
+                    'sku': product.sku,
+                    'title': product.title,
+                    'section': path,
+                    'section_id': product.section_id,
+                    'wire_section': product.wire_section,
+                    'load_limit': product.load_limit,
+                    'price': str(product.display_price),
+                    'image_url': product.image_url,
+                    'score': score,
+                    'snippet': make_snippet(product, query),
+                }
+                for score, (product, path) in results
+            ],
         })
+
+
+class TypeaheadView(View):
+    """Подсказки при вводе: /api/search/suggest/?q=ка-15&limit=10.
+    Без шаблонов и без обращения к сессии, чтобы ответ можно было кэшировать"""
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        query = (request.GET.get('q') or '').strip()
+        try:
+            limit = min(max(int(request.GET.get('limit', MAX_SUGGESTIONS)), 1), MAX_SUGGESTIONS)
+        except ValueError:
+            limit = MAX_SUGGESTIONS
+
+        suggestions = complete(query, limit)
+        response = JsonResponse({
+            'success': True,
+            'query': query,
+            'suggestions': [
+                {'id': product.pk, 'sku': sku, 'title': title, 'section_id': product.section_id, 'orders': orders}
+                for sku, title, orders, product in suggestions or ()
+            ],
+        })
+        if suggestions is None:
+            # Подсказки ещё строятся: пустой ответ не кэшируется
+            patch_cache_control(response, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, max_age=TYPEAHEAD_MAX_AGE)
+        return response
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class CacheStatsView(View):
+    """Счётчики кэшей в памяти воркера, ответившего на запрос (только для сотрудников)"""
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        response = JsonResponse({
+            'success': True,
+            'pid': os.getpid(),
+            'modal': get_modal_cache_stats(),
+            'search_terms': get_search_cache_stats(),
+        })
+        patch_cache_control(response, private=True, no_store=True)
+        return response
+
+
+class ResizeCacheView(View):
+    """Изображения по URL resize_cache Битрикса (image_code товаров), уменьшенные из локальных
+    исходников при первом запросе. Имя файла не меняется при повторной генерации, поэтому
+    ответ кэшируется браузером и CDN бессрочно"""
+    http_method_names = ['get', 'head']
+
+    def get(self, request, code, width, height, mode, filename):
+        if not is_valid_request(code, width, height, mode, filename):
+            raise Http404('Изображение не найдено')
+        cache = get_resize_cache()
+        # Второй заход - если файл вытеснил другой процесс между get() и open()
+        for attempt in range(2):
+            try:
+                path = cache.get(code, width, height, mode, filename)
+            except ResizeError as e:
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.warning(f"Could not resize {code}/{filename}: {e}")
+                raise Http404('Изображение не найдено')
+            if path is None:
+                raise Http404('Изображение не найдено')
+            try:
+                response = FileResponse(open(path, 'rb'), content_type=content_type(path))
+            except FileNotFoundError:
+                continue
+            patch_cache_control(response, public=True, max_age=RESIZE_CACHE_MAX_AGE, immutable=True)
+            return response
+        raise Http404('Изображение не найдено')
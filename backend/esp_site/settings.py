@@ -14,6 +14,7 @@ from pathlib import Path
 import os
 import dj_database_url
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -108,6 +109,46 @@ else:
     }
 
 
+# Cache
+# Версия каталога (catalog.snapshot), фрагменты и счётчики хранятся в кэше и должны быть
+# общими для всех воркеров gunicorn. Счётчики записываются значением от времени через
+# cache.set (без incr), поэтому вытеснение и неатомарный файловый кэш их не ломают.
+# По умолчанию - файловый кэш в BASE_DIR/.cache; для нескольких контейнеров - Redis:
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, CACHE_LOCATION=redis://...
+# LocMemCache годится только для одного процесса
+CACHE_BACKEND = config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / '.cache')),
+    }
+}
+if CACHE_BACKEND.endswith('.FileBasedCache'):
+    # По умолчанию 300 записей с вытеснением: фрагменты вытесняли бы друг друга слишком часто
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=20000, cast=int)}
+if CACHE_BACKEND.endswith('.LocMemCache') and config('WEB_CONCURRENCY', default=1, cast=int) > 1:
+    raise ImproperlyConfigured(
+        'LocMemCache is per-process: with WEB_CONCURRENCY > 1 gunicorn workers would serve '
+        'different catalog versions. Use FileBasedCache or RedisCache (CACHE_BACKEND).'
+    )
+
+# Каталог
+# Ленивая главная: в HTML только дерево категорий и меню, карточки товаров раздела
+# подгружаются через /api/section/products/ при первом открытии раздела.
+# По умолчанию выключена - главная с карточками, как раньше
+CATALOG_LAZY_INDEX = config('CATALOG_LAZY_INDEX', default='False') == 'True'
+# Сколько отрендеренных модальных окон товаров держать в памяти каждого процесса
+CATALOG_MODAL_LRU_SIZE = config('CATALOG_MODAL_LRU_SIZE', default=512, cast=int)
+# Поиск товаров: memory - индекс в памяти процесса, database - полнотекстовый индекс
+# базы (tsvector/GIN в PostgreSQL, FTS5 в SQLite; на других базах - поиск в памяти)
+CATALOG_SEARCH_BACKEND = config('CATALOG_SEARCH_BACKEND', default='memory')
+# Процессов для обработки изображений (миниатюры, хэши, манифест); 0 - по числу ядер
+CATALOG_IMAGE_WORKERS = config('CATALOG_IMAGE_WORKERS', default=0, cast=int)
+# Дисковый кэш /upload/resize_cache/...: уменьшенные копии локальных изображений
+CATALOG_RESIZE_CACHE_DIR = config('CATALOG_RESIZE_CACHE_DIR', default=str(BASE_DIR / 'resize_cache'))
+CATALOG_RESIZE_CACHE_MAX_BYTES = config('CATALOG_RESIZE_CACHE_MAX_BYTES', default=256 * 1024 * 1024, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
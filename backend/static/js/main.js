@@ -649,6 +649,14 @@
                 // Открываем текущую подкатегорию - показываем разделы
                 $toggle.addClass('is-open');
                 $sections.show();
+
+                // В ленивом режиме заранее загружаем первые страницы всех разделов подкатегории
+                if (isLazyCatalog()) {
+                    var sectionIds = $sections.find('.section-toggle').map(function() {
+                        return $(this).data('section-id');
+                    }).get();
+                    loadLazySections(sectionIds);
+                }
                 // Убеждаемся, что описание подкатегории видно
                 if ($subcategoryDescription.length) {
                     $subcategoryDescription.show();
@@ -656,6 +664,87 @@
             }
         });
 
+        // Добавляет карточки из ответа /api/section/products/ в основной контейнер товаров
+        function appendSectionProducts($mainContainer, sectionId, html) {
+            $(html).each(function() {
+                var $productBox = $(this).find('.product-box');
+                var productSku = $productBox.data('product');
+                if (productSku) {
+                    // Ищем существующий элемент по SKU
+                    var $existing = $mainContainer.find('.product-item[data-product="' + productSku + '"]');
+                    if ($existing.length) {
+                        // Показываем существующий товар
+                        $existing.show();
+                    } else {
+                        // Создаем новый элемент из шаблона
+                        var $productItem = $('<div class="column column-block product-item" data-product="' + productSku + '" data-section-id="' + sectionId + '"></div>');
+                        $productItem.html($(this).html());
+                        $mainContainer.append($productItem);
+                    }
+                }
+            });
+        }
+
+        // Ленивый режим главной: карточки раздела загружаются при первом открытии раздела
+        var lazySections = {};
+
+        function isLazyCatalog() {
+            return $('#products-container').data('lazy') === true;
+        }
+
+        var lazySectionCallbacks = {};
+
+        // Первые страницы нескольких разделов одним запросом к /api/section/products/batch/
+        function loadLazySections(sectionIds, done) {
+            var pendingIds = [];
+            sectionIds.forEach(function(sectionId) {
+                if (done) {
+                    (lazySectionCallbacks[sectionId] = lazySectionCallbacks[sectionId] || []).push(done);
+                }
+                if (!lazySections[sectionId]) {
+                    lazySections[sectionId] = 'loading';
+                    pendingIds.push(sectionId);
+                }
+            });
+            if (!pendingIds.length) {
+                return;
+            }
+            $.ajax({
+                url: '/api/section/products/batch/',
+                method: 'GET',
+                data: {
+                    section_ids: pendingIds.join(','),
+                    limit: 9
+                },
+                success: function(response) {
+                    if (!response.success) {
+                        return;
+                    }
+                    $.each(response.sections || {}, function(sectionId, page) {
+                        if (page.html) {
+                            appendSectionProducts($('#products-container'), sectionId, page.html);
+                            // Новые карточки скрыты, пока обработчик раздела не покажет первые 9
+                            $('#products-container .product-item[data-section-id="' + sectionId + '"]').hide();
+                        }
+                        $('.section-load-more-btn[data-section-id="' + sectionId + '"]').data('cursor', page.next_cursor || '');
+                    });
+                },
+                error: function(xhr, status, error) {
+                    console.error('Ошибка AJAX:', error);
+                },
+                complete: function() {
+                    pendingIds.forEach(function(sectionId) {
+                        lazySections[sectionId] = 'loaded';
+                        var callbacks = lazySectionCallbacks[sectionId] || [];
+                        delete lazySectionCallbacks[sectionId];
+                        callbacks.forEach(function(callback) {
+                            callback();
+                        });
+                    });
+                }
+            });
+        }
+
         // Обработчик кнопки "Показать еще" для загрузки дополнительных товаров
         $(document).off('click.loadMore', '.section-load-more-btn').on('click.loadMore', '.section-load-more-btn', function(event) {
             event.preventDefault();
@@ -665,6 +754,7 @@
             var sectionId = $btn.data('section-id');
             var offset = parseInt($btn.data('offset')) || 9;
             var limit = parseInt($btn.data('limit')) || 9;
+            var cursor = $btn.data('cursor');
 
             if (!sectionId) {
                 return;
@@ -673,15 +763,22 @@
             // Блокируем кнопку во время загрузки
             $btn.prop('disabled', true).text('Загрузка...');
 
+            // Следующая страница по курсору из предыдущего ответа, иначе по offset
+            var requestData = {
+                section_id: sectionId,
+                limit: limit
+            };
+            if (cursor) {
+                requestData.cursor = cursor;
+            } else {
+                requestData.offset = offset;
+            }
+
             // Загружаем товары через AJAX
             $.ajax({
                 url: '/api/section/products/',
                 method: 'GET',
-                data: {
-                    section_id: sectionId,
-                    offset: offset,
-                    limit: limit
-                },
+                data: requestData,
                 success: function(response) {
                     if (response.success && response.html) {
                         // Находим контейнер товаров
@@ -690,24 +787,8 @@
 
                         if ($mainContainer.length) {
                             // Добавляем товары в основной контейнер
-                            var $newProducts = $(response.html);
-                            $newProducts.each(function() {
-                                var $productBox = $(this).find('.product-box');
-                                var productSku = $productBox.data('product');
-                                if (productSku) {
-                                    // Ищем существующий элемент по SKU
-                                    var $existing = $mainContainer.find('.product-item[data-product="' + productSku + '"]');
-                                    if ($existing.length) {
-                                        // Показываем существующий товар
-                                        $existing.show();
-                                    } else {
-                                        // Создаем новый элемент из шаблона
-                                        var $productItem = $('<div class="column column-block product-item" data-product="' + productSku + '" data-section-id="' + sectionId + '"></div>');
-                                        $productItem.html($(this).html());
-                                        $mainContainer.append($productItem);
-                                    }
-                                }
-                            });
+                            appendSectionProducts($mainContainer, sectionId, response.html);
+                            prefetchProductModals();
 
                             // Обновляем счетчик товаров
                             if (typeof updateProductsCount === 'function') {
@@ -729,9 +810,10 @@
                             });
                         }
 
-                        // Обновляем offset для следующей загрузки
+                        // Обновляем offset и курсор для следующей загрузки
                         var newOffset = offset + limit;
                         $btn.data('offset', newOffset);
+                        $btn.data('cursor', response.next_cursor || '');
 
                         // Если больше нет товаров, скрываем кнопку
                         if (!response.has_more) {
@@ -766,6 +848,16 @@
                 return;
             }
 
+            // В ленивом режиме сначала подгружаем первую страницу товаров раздела
+            if (isLazyCatalog() && !$toggle.hasClass('is-open') && lazySections[sectionId] !== 'loaded') {
+                if (!lazySectionCallbacks[sectionId]) {
+                    loadLazySections([sectionId], function() {
+                        $toggle.trigger('click');
+                    });
+                }
+                return;
+            }
+
             // Находим товары из скрытой структуры
             var $hiddenProducts = $('.section-products[data-section-id="' + sectionId + '"] .product-box');
             var $mainContainer = $('#products-container');
@@ -796,6 +888,7 @@
                 $('.catalog-section-item__title').show();
 
                 // Скрываем кнопку "Показать еще"
+                $('.section-load-more').hide();
                 var $loadMoreBtn = $('#load-more-btn');
                 var $loadMoreContainer = $('#load-more-container');
                 if ($loadMoreBtn.length) {
@@ -937,6 +1030,15 @@
                         }
                     }
 
+                    // В ленивом режиме кнопка "Показать еще" раздела переносится под основной контейнер
+                    if (isLazyCatalog()) {
+                        $('.section-load-more').hide();
+                        var $sectionLoadMore = $('.section-load-more[data-section-id="' + sectionId + '"]');
+                        if ($sectionLoadMore.length && $sectionLoadMore.find('.section-load-more-btn').css('display') !== 'none') {
+                            $sectionLoadMore.insertAfter($mainContainer).show();
+                        }
+                    }
+
                     // Если товары не найдены по SKU, используем data-section-id
                     if (foundProducts === 0) {
                         var $sectionProducts = $mainContainer.find('.product-item[data-section-id="' + sectionId + '"]');
@@ -1032,6 +1134,9 @@
                     // Если нет основного контейнера, показываем товары из скрытой структуры напрямую
                     $hiddenProductsContainer.css('display', 'flex').show();
                 }
+
+                // Модальные окна видимых карточек загружаем одним запросом
+                prefetchProductModals();
             }
         });
 
@@ -1489,6 +1594,35 @@
         fetchCart();
     }
 
+    // Заранее загруженные модальные окна товаров: SKU -> HTML
+    var productModalCache = {};
+
+    function prefetchProductModals() {
+        var skus = [];
+        $('#products-container .product-item:visible .dev_product_detail').each(function() {
+            var sku = $(this).data('id');
+            if (sku && !(sku in productModalCache) && skus.indexOf(sku) === -1 && skus.length < 50) {
+                skus.push(sku);
+            }
+        });
+        if (!skus.length) {
+            return;
+        }
+        $.ajax({
+            url: '/api/product/detail/batch/',
+            method: 'GET',
+            traditional: true,
+            data: {
+                id: skus
+            },
+            success: function(response) {
+                if (response.success && response.modals) {
+                    $.extend(productModalCache, response.modals);
+                }
+            }
+        });
+    }
+
     function initProductDetail() {
         $(document).off('click.productDetail', '.dev_product_detail').on('click.productDetail', '.dev_product_detail', function(event) {
             event.preventDefault();
@@ -1523,6 +1657,17 @@
             // Открываем модальное окно
             modal.open();
 
+            // Окно уже загружено заранее
+            if (productModalCache[productId]) {
+                $modalContent.html(productModalCache[productId]);
+                if (window.Foundation) {
+                    $(document).foundation();
+                }
+                initQuantityControls();
+                initAddToCartButtons();
+                return;
+            }
+
             // Загружаем детали товара
             $.ajax({
                 url: '/api/product/detail/',